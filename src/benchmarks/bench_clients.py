@@ -0,0 +1,95 @@
+"""Requests per second with a freshly built API object per call (the old
+`BaseService.__init__` behavior) versus the shared client registry.
+
+Calls go over a real socket to a minimal HTTP server on localhost, which
+answers every request with the same pod, so the cost of setting up clients
+and connections is measured along with the client's own overhead:
+
+    PYTHONPATH=src python -m benchmarks.bench_clients
+"""
+
+import argparse
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import kubernetes.client
+
+from django_operator.clients import ClientRegistry
+
+POD = json.dumps(
+    {"apiVersion": "v1", "kind": "Pod", "metadata": {"name": "pod"}}
+).encode()
+
+
+class PodHandler(BaseHTTPRequestHandler):
+    # keep connections open, as the apiserver does; without TCP_NODELAY the
+    #  body waits on the ack of the headers on a reused connection
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(POD)))
+        self.end_headers()
+        self.wfile.write(POD)
+
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def serving():
+    """Point the default client configuration at a local server"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PodHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    default = kubernetes.client.Configuration.get_default_copy()
+    configuration = kubernetes.client.Configuration()
+    configuration.host = f"http://127.0.0.1:{server.server_address[1]}"
+    kubernetes.client.Configuration.set_default(configuration)
+    try:
+        yield
+    finally:
+        kubernetes.client.Configuration.set_default(default)
+        server.shutdown()
+        server.server_close()
+
+
+def _per_call(count):
+    for _ in range(count):
+        kubernetes.client.CoreV1Api().read_namespaced_pod(namespace="bench", name="pod")
+
+
+def _registry(count):
+    registry = ClientRegistry()
+    for _ in range(count):
+        registry.get_api("CoreV1Api").read_namespaced_pod(namespace="bench", name="pod")
+
+
+def run(count):
+    results = {}
+    with serving():
+        for label, fn in (("per-call", _per_call), ("registry", _registry)):
+            start = time.perf_counter()
+            fn(count)
+            elapsed = time.perf_counter() - start
+            results[label] = count / elapsed
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=2000)
+    args = parser.parse_args()
+    results = run(args.count)
+    for label, rps in results.items():
+        print(f"{label:>10}: {rps:10.0f} req/s")
+    print(f"{'speedup':>10}: {results['registry'] / results['per-call']:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""End to end migrations of many Django objects against the fake apiserver:
+API calls per migration, wall time and peak (python) memory, first for the
+initial deployment of every object and then for an upgrade to a new version.
+
+Handlers are retried the way kopf would, on as many threads as kopf runs sync
+handlers on, with retry delays scaled down by `--time-scale`. Run from the
+repository root so that `manifests/` resolves:
+
+    PYTHONPATH=src python -m benchmarks.bench_migrations --objects 1 100 1000
+"""
+
+import argparse
+import logging
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import kopf
+
+from benchmarks.fake_apiserver import FakeApiServer, serving
+from django_operator.clients import DEFAULT_WORKERS
+from django_operator.pipelines.migration import MigrationPipeline
+from django_operator.scheduling import (
+    api_rate_limiter,
+    manage_commands_scheduler,
+)
+from django_operator.utils import merge_patch
+
+SPEC = {
+    "host": "app.example.com",
+    "image": "registry.example.com/repo/project",
+    "clusterIssuer": "letsencrypt",
+    "autoscalers": {
+        "app": {
+            "enabled": True,
+            "cpuUtilizationThreshold": 70,
+            "replicas": {"minimum": 2, "maximum": 4},
+        },
+    },
+    "ports": {"app": 8000, "redis": 6379},
+    "env": [{"name": "REGULAR_ENV_VAR", "value": "regular value"}],
+    "envFromConfigMapRefs": ["env"],
+    "envFromSecretRefs": ["database"],
+    "initManageCommands": [["migrate"], ["create_groups"]],
+    "commands": {
+        purpose: {"command": ["run"], "args": [purpose]}
+        for purpose in ("app", "worker", "beat")
+    },
+}
+
+
+def django_body(index, version):
+    return {
+        "apiVersion": "thismatters.github/v1alpha",
+        "kind": "Django",
+        "metadata": {
+            "name": "tenant",
+            "namespace": f"tenant-{index}",
+            "uid": str(uuid.uuid4()),
+            "labels": {},
+        },
+        "spec": dict(SPEC, version=version),
+        "status": {},
+    }
+
+
+def migrate(server, body, *, diff, logger, time_scale):
+    """Run the pipeline handler on `body` until the object settles, patching
+    it and retrying as kopf would. Returns the number of handler runs."""
+    label = MigrationPipeline.label
+    retry = 0
+    started = datetime.utcnow()
+    runs = 0
+    while True:
+        runs += 1
+        patch = kopf.Patch()
+        metadata = body["metadata"]
+        kwargs = {
+            "logger": logger,
+            "patch": patch,
+            "body": body,
+            "meta": metadata,
+            "spec": body["spec"],
+            "status": body["status"],
+            "labels": metadata["labels"],
+            "namespace": metadata["namespace"],
+            "name": metadata["name"],
+            "diff": diff,
+            "retry": retry,
+            "started": started,
+            "runtime": datetime.utcnow() - started,
+        }
+        delay = 0
+        try:
+            result = MigrationPipeline(**kwargs).handle()
+        except kopf.TemporaryError as e:
+            retry += 1
+            delay = e.delay or 0
+        else:
+            retry = 0
+            started = datetime.utcnow()
+            if result is not None:
+                patch.status[MigrationPipeline.update_handler_name] = result
+        if patch:
+            server.record("patch_namespaced_custom_object")
+            body.update(merge_patch(body, dict(patch)))
+            body.setdefault("status", {})
+        # only the first run is caused by the change to the spec
+        diff = ()
+        if body["metadata"]["labels"].get(label) == MigrationPipeline.waiting_step_name:
+            return runs
+        if delay and time_scale:
+            time.sleep(delay * time_scale)
+
+
+def _phase(server, bodies, *, version, workers, logger, time_scale):
+    label = MigrationPipeline.label
+    for body in bodies:
+        if version is None:
+            # what the create handler does
+            body["metadata"]["labels"][label] = MigrationPipeline.steps[0].name
+            diff = ()
+        else:
+            old = body["spec"]["version"]
+            body["spec"] = dict(body["spec"], version=version)
+            diff = (("change", ("spec", "version"), old, version),)
+    calls = sum(server.calls.values())
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        runs = list(
+            executor.map(
+                lambda body: migrate(
+                    server, body, diff=diff, logger=logger, time_scale=time_scale
+                ),
+                bodies,
+            )
+        )
+    elapsed = time.perf_counter() - start
+    return {
+        "wall": elapsed,
+        "calls": sum(server.calls.values()) - calls,
+        "runs": sum(runs),
+    }
+
+
+def run(count, *, latency, workers, time_scale, trace_memory, server_version, qps):
+    manage_commands_scheduler.clear()
+    api_rate_limiter.qps = qps
+    server = FakeApiServer(latency=latency)
+    logger = logging.getLogger("benchmarks.migrations")
+    bodies = [django_body(index, "2021.12.1") for index in range(count)]
+    results = {}
+    with serving(server, server_version=server_version):
+        for phase, version in (("create", None), ("upgrade", "2021.12.2")):
+            if trace_memory:
+                tracemalloc.start()
+                baseline = tracemalloc.get_traced_memory()[0]
+            result = _phase(
+                server,
+                bodies,
+                version=version,
+                workers=workers,
+                logger=logger,
+                time_scale=time_scale,
+            )
+            if trace_memory:
+                result["peak"] = tracemalloc.get_traced_memory()[1] - baseline
+                tracemalloc.stop()
+            failed = sum(
+                1
+                for body in bodies
+                if body["status"].get("condition") != "running"
+                or body["status"].get("version") != body["spec"]["version"]
+            )
+            result["failed"] = failed
+            results[phase] = result
+    return results, server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--objects", type=int, nargs="+", default=[1, 100, 1000])
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds added to each API call"
+    )
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument(
+        "--qps",
+        type=float,
+        default=0,
+        help="client side rate limit; unlimited by default to measure the operator",
+    )
+    parser.add_argument(
+        "--time-scale",
+        type=float,
+        default=0.001,
+        help="fraction of each retry delay actually waited",
+    )
+    parser.add_argument(
+        "--no-apply",
+        action="store_true",
+        help="pretend the cluster predates server-side apply",
+    )
+    parser.add_argument(
+        "--no-tracemalloc",
+        action="store_true",
+        help="skip memory tracing, which slows everything down",
+    )
+    parser.add_argument("--methods", action="store_true", help="calls by method")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    print(
+        f"{'objects':>8}{'phase':>9}{'wall':>10}{'migr/s':>9}"
+        f"{'calls/migr':>12}{'runs/migr':>11}{'peak':>11}{'failed':>8}"
+    )
+    for count in args.objects:
+        results, server = run(
+            count,
+            latency=args.latency,
+            workers=args.workers,
+            time_scale=args.time_scale,
+            trace_memory=not args.no_tracemalloc,
+            server_version=(1, 21) if args.no_apply else (1, 28),
+            qps=args.qps,
+        )
+        for phase, result in results.items():
+            peak = result.get("peak")
+            print(
+                f"{count:>8}{phase:>9}"
+                f"{result['wall']:>9.2f}s"
+                f"{count / result['wall']:>9.1f}"
+                f"{result['calls'] / count:>12.1f}"
+                f"{result['runs'] / count:>11.1f}"
+                + (f"{peak / 2**20:>8.1f}MiB" if peak is not None else f"{'-':>11}")
+                + f"{result['failed']:>8}"
+            )
+        if args.methods:
+            print(f"{'':>8}calls per object, both phases")
+            for method, calls in sorted(server.calls.items()):
+                print(f"{'':>8}{method:<50}{calls / count:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Dotted path lookups: the former recursive `superget`, which split the key
+on every call, versus the compiled `superget` and one `supergetmany` walk.
+
+    PYTHONPATH=src python -m benchmarks.bench_superget
+"""
+
+import argparse
+import time
+
+from django_operator.kinds import DjangoKind
+from django_operator.utils import superget, supergetmany
+
+SPEC = {
+    "host": "test.somewhere.com",
+    "ports": {"app": 8000, "redis": 6379},
+    "resourceRequests": {
+        purpose: {"cpu": "500m", "memory": "512Mi"}
+        for purpose in ("app", "beat", "worker")
+    },
+}
+PATHS = tuple(DjangoKind.spec_kwargs.values())
+
+
+def recursive_superget(dct, superkey, *, default=None, _raise=None):
+    if "." in superkey:
+        key, remainder = superkey.split(".", maxsplit=1)
+    else:
+        key = superkey
+        remainder = None
+    if key not in dct:
+        if _raise is not None:
+            raise _raise
+        return default
+    val = dct[key]
+    if not remainder:
+        return val
+    return recursive_superget(val, remainder, default=default, _raise=_raise)
+
+
+def run(count):
+    timings = {}
+    for label, fn in (
+        ("recursive", lambda: [recursive_superget(SPEC, p) for p in PATHS]),
+        ("compiled", lambda: [superget(SPEC, p) for p in PATHS]),
+        ("batch", lambda: supergetmany(SPEC, PATHS)),
+    ):
+        start = time.perf_counter()
+        for _ in range(count):
+            fn()
+        timings[label] = (time.perf_counter() - start) / count
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=100000)
+    args = parser.parse_args()
+    timings = run(args.count)
+    print(f"{len(PATHS)} paths per lookup, as in DjangoKind.__init__")
+    for label, timing in timings.items():
+        print(
+            f"{label:<12}{timing * 1e6:>8.2f}us"
+            f"{timings['recursive'] / timing:>8.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
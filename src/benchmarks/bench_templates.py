@@ -0,0 +1,58 @@
+"""Manifest rendering throughput: reading, formatting and parsing the template
+on every call (the old `BaseService._render_manifest`) versus rendering the
+compiled template cache. Run from the repository root so that `manifests/`
+resolves:
+
+    PYTHONPATH=src python -m benchmarks.bench_templates
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import yaml
+
+from django_operator.templates import TemplateCache
+from django_operator.tests.test_templates import TEMPLATE_KWARGS
+
+
+def _read_format_load(template):
+    with open(Path("manifests") / template) as f:
+        text = f.read().format(**TEMPLATE_KWARGS)
+    return yaml.safe_load(text)
+
+
+def run(count):
+    cache = TemplateCache()
+    cache.preload()
+    results = {}
+    for path in sorted(Path("manifests").glob("*.yaml")):
+        timings = {}
+        for label, fn in (
+            ("per-call", _read_format_load),
+            ("compiled", lambda t: cache.render(t, **TEMPLATE_KWARGS)),
+        ):
+            start = time.perf_counter()
+            for _ in range(count):
+                fn(path.name)
+            timings[label] = (time.perf_counter() - start) / count
+        results[path.name] = timings
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=500)
+    args = parser.parse_args()
+    print(f"{'template':<30}{'per-call':>12}{'compiled':>12}{'speedup':>10}")
+    for template, timings in run(args.count).items():
+        print(
+            f"{template:<30}"
+            f"{timings['per-call'] * 1e6:>10.1f}us"
+            f"{timings['compiled'] * 1e6:>10.1f}us"
+            f"{timings['per-call'] / timings['compiled']:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
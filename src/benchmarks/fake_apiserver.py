@@ -0,0 +1,227 @@
+"""An in-process stand-in for the parts of the kubernetes API which the
+services use, for driving the operator without a cluster.
+
+Objects are kept as plain (camelCased) manifests and handed back as client
+models, as the real client would. Writes are reported to the watch cache the
+way the kopf watch handlers would, and a trivial controller settles them at
+once: deployments are fully rolled out and pods have succeeded. Every call
+is counted and can be slowed down by a fixed `latency`."""
+
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import kopf
+import kubernetes.client
+from kubernetes.client.exceptions import ApiException
+
+from django_operator.clients import registry
+from django_operator.utils import merge_patch
+from django_operator.watches import resource_cache
+
+# the snake_cased resource in the client method names => (kind, model)
+RESOURCES = {
+    "deployment": ("deployment", "V1Deployment"),
+    "service": ("service", "V1Service"),
+    "ingress": ("ingress", "V1Ingress"),
+    "pod": ("pod", "V1Pod"),
+    "horizontal_pod_autoscaler": (
+        "horizontalpodautoscaler",
+        "V1HorizontalPodAutoscaler",
+    ),
+}
+MODELS = dict(RESOURCES.values())
+METHOD = re.compile(
+    r"^(?P<verb>read|create|patch|delete|list)_namespaced_"
+    rf"(?P<resource>{'|'.join(RESOURCES)})(?P<status>_status)?$"
+)
+
+
+class _Response:
+    """What `ApiClient.deserialize` reads from"""
+
+    def __init__(self, body):
+        self.data = json.dumps(body)
+
+
+class FakeApiServer:
+    def __init__(self, *, latency=0, watch=True):
+        self.latency = latency
+        self.watch = watch
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._objects = {}
+        # only used to turn manifests into models
+        self._api_client = kubernetes.client.ApiClient()
+
+    def record(self, method):
+        with self._lock:
+            self.calls[method] += 1
+
+    def _call(self, method):
+        self.record(method)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _model(self, kind, body):
+        return self._api_client.deserialize(_Response(body), MODELS[kind])
+
+    def _missing(self, kind, name):
+        return ApiException(status=404, reason=f"{kind} {name} not found")
+
+    def _settle(self, kind, body):
+        """What the controllers would eventually make of the object"""
+        if kind == "deployment":
+            replicas = body.get("spec", {}).get("replicas")
+            replicas = 1 if replicas is None else replicas
+            body["status"] = {
+                "observedGeneration": body["metadata"]["generation"],
+                "replicas": replicas,
+                "updatedReplicas": replicas,
+                "readyReplicas": replicas,
+                "availableReplicas": replicas,
+                "conditions": [{"type": "Available", "status": "True"}],
+            }
+        elif kind == "pod":
+            body["status"] = {"phase": "Succeeded"}
+        return body
+
+    def _store(self, kind, namespace, name, body, event_type):
+        key = (kind, namespace, name)
+        # status is a subresource, writes to the object don't touch it
+        body.pop("status", None)
+        with self._lock:
+            previous = self._objects.get(key)
+            metadata = body.setdefault("metadata", {})
+            metadata.update({"name": name, "namespace": namespace})
+            if previous is None:
+                metadata.update({"uid": str(uuid.uuid4()), "generation": 1})
+            else:
+                metadata["uid"] = previous["metadata"]["uid"]
+                generation = previous["metadata"]["generation"]
+                if body.get("spec") != previous.get("spec"):
+                    generation += 1
+                metadata["generation"] = generation
+            self._objects[key] = body = self._settle(kind, body)
+        if self.watch:
+            resource_cache.observe(kind=kind, event_type=event_type, body=body)
+        return body
+
+    def _get(self, kind, namespace, name):
+        with self._lock:
+            body = self._objects.get((kind, namespace, name))
+        if body is None:
+            raise self._missing(kind, name)
+        return body
+
+    def read(self, kind, *, namespace, name, **_):
+        return self._model(kind, self._get(kind, namespace, name))
+
+    def create(self, kind, *, namespace, body, **_):
+        name = body["metadata"]["name"]
+        with self._lock:
+            exists = (kind, namespace, name) in self._objects
+        if exists:
+            raise ApiException(status=409, reason=f"{kind} {name} exists")
+        body = json.loads(json.dumps(body))
+        return self._model(kind, self._store(kind, namespace, name, body, "ADDED"))
+
+    def patch(self, kind, *, namespace, name, body, **_):
+        current = self._get(kind, namespace, name)
+        body = merge_patch(current, json.loads(json.dumps(body)))
+        return self._model(kind, self._store(kind, namespace, name, body, "MODIFIED"))
+
+    def apply(self, *, namespace, name, body):
+        kind = body["kind"].lower()
+        with self._lock:
+            exists = (kind, namespace, name) in self._objects
+        body = json.loads(json.dumps(body))
+        event_type = "MODIFIED" if exists else "ADDED"
+        return self._model(kind, self._store(kind, namespace, name, body, event_type))
+
+    def delete(self, kind, *, namespace, name, **_):
+        key = (kind, namespace, name)
+        with self._lock:
+            body = self._objects.get(key)
+            if body is None:
+                raise self._missing(kind, name)
+            if body["metadata"].get("finalizers"):
+                body["metadata"]["deletionTimestamp"] = "now"
+                return {}
+            del self._objects[key]
+        if self.watch:
+            resource_cache.observe(kind=kind, event_type="DELETED", body=body)
+        return {}
+
+    def list(self, kind, *, namespace, label_selector=None, **_):
+        label, _, value = (label_selector or "").partition("=")
+        with self._lock:
+            bodies = [
+                body
+                for (_kind, _namespace, _), body in self._objects.items()
+                if _kind == kind
+                and _namespace == namespace
+                and (
+                    not label or body["metadata"].get("labels", {}).get(label) == value
+                )
+            ]
+        return SimpleNamespace(items=[self._model(kind, body) for body in bodies])
+
+    def count(self, kind=None):
+        with self._lock:
+            return sum(1 for key in self._objects if kind in (None, key[0]))
+
+    @property
+    def api(self):
+        return FakeApi(self)
+
+    def post_event(self, *args, **kwargs):
+        # kopf posts events from a queue of its own, off the handler's path
+        self.record("create_namespaced_event")
+
+
+class FakeApi:
+    """Every API group at once; the method names don't overlap"""
+
+    def __init__(self, server):
+        self._server = server
+
+    def server_side_apply_request(self, *, namespace, name, body):
+        self._server._call("server_side_apply_request")
+        return self._server.apply(namespace=namespace, name=name, body=body)
+
+    def __getattr__(self, method):
+        match = METHOD.match(method)
+        if match is None:
+            raise AttributeError(method)
+        kind = RESOURCES[match["resource"]][0]
+        action = getattr(self._server, match["verb"])
+
+        def call(**kwargs):
+            self._server._call(method)
+            return action(kind, **kwargs)
+
+        return call
+
+
+@contextmanager
+def serving(server, *, server_version=(1, 28)):
+    """Point the services at `server`; `server_version` decides whether they
+    use server-side apply"""
+    with ExitStack() as stack:
+        stack.enter_context(
+            patch.object(registry, "get_api", lambda *_, **__: server.api)
+        )
+        stack.enter_context(
+            patch.object(registry, "server_version", lambda **_: server_version)
+        )
+        # kopf can only post events from within its own handlers
+        for name in ("info", "warn", "exception"):
+            stack.enter_context(patch.object(kopf, name, server.post_event))
+        yield server
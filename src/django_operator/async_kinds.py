@@ -0,0 +1,267 @@
+import asyncio
+
+from django_operator.async_services import (
+    AsyncDaemonSetService,
+    AsyncDeploymentService,
+    AsyncHorizontalPodAutoscalerService,
+    AsyncIngressService,
+    AsyncPodService,
+    AsyncServiceService,
+)
+from django_operator.kinds import DjangoKind, ResourceErrors
+from django_operator.utils import merged, superget
+from django_operator.watches import (
+    daemonset_ready,
+    pod_phase,
+    resource_cache,
+    rollout_progress,
+)
+
+
+class AsyncDjangoKind(DjangoKind):
+    """`DjangoKind` for the async handlers; every method which reaches the
+    apiserver is a coroutine, the manifest building is shared."""
+
+    kind_services = {
+        "pod": AsyncPodService,
+        "ingress": AsyncIngressService,
+        "service": AsyncServiceService,
+        "deployment": AsyncDeploymentService,
+        "daemonset": AsyncDaemonSetService,
+        "horizontalpodautoscaler": AsyncHorizontalPodAutoscalerService,
+    }
+
+    async def read_resource(self, kind, purpose, name):
+        return await self.service(kind).read(namespace=self.namespace, name=name)
+
+    async def delete_resource(self, *, kind, name):
+        return await self._ensure(
+            kind=kind, purpose="purpose", existing=name, delete=True
+        )
+
+    async def list_owned(self, kind):
+        items = await self.service(kind).list_owned(
+            namespace=self.namespace, instance=self.uid
+        )
+        return {item.metadata.name: item for item in items}
+
+    async def unprotect_resource(self, *, kind, name, obj=None):
+        await self.service(kind).unprotect(namespace=self.namespace, name=name, obj=obj)
+
+    async def _fan_out(self, fn, targets):
+        semaphore = asyncio.Semaphore(self.fan_out_limit)
+
+        async def run(target):
+            async with semaphore:
+                await fn(**target)
+
+        results = await asyncio.gather(
+            *[run(target) for target in targets], return_exceptions=True
+        )
+        errors = {
+            (target["kind"], target["name"]): result
+            for target, result in zip(targets, results)
+            if isinstance(result, Exception)
+        }
+        if errors:
+            raise ResourceErrors(errors)
+
+    async def _ensure_raw(
+        self, kind, purpose, delete=False, template=None, parent=None, **kwargs
+    ):
+        if template is None:
+            template = f"{kind}_{purpose}.yaml"
+        if parent is None:
+            parent = self.body
+        return await self.service(kind).ensure(
+            namespace=self.namespace,
+            template=template,
+            purpose=purpose,
+            parent=parent,
+            delete=delete,
+            **kwargs,
+            **self.base_kwargs,
+        )
+
+    async def _ensure(self, kind, purpose, delete=False, **kwargs):
+        obj = await self._ensure_raw(kind, purpose, delete=delete, **kwargs)
+        if not delete:
+            return {kind: {purpose: obj.metadata.name}}
+        return {}
+
+    async def _watched(self, *, kind, name, predicate, timeout):
+        obj = await resource_cache.async_wait_for(
+            kind=kind,
+            namespace=self.namespace,
+            name=name,
+            predicate=predicate,
+            timeout=timeout,
+        )
+        if obj is None:
+            obj = await self.service(kind).read_status(
+                namespace=self.namespace, name=name
+            )
+            obj = obj.to_dict()
+        return obj
+
+    async def pod_phase(self, name, *, timeout=0):
+        pod = await self._watched(
+            kind="pod",
+            name=name,
+            predicate=lambda obj: pod_phase(obj) not in ("pending", "running"),
+            timeout=timeout,
+        )
+        return pod_phase(pod)
+
+    async def deployment_rollout(self, *, name, timeout=0):
+        deployment = await self._watched(
+            kind="deployment",
+            name=name,
+            predicate=lambda obj: rollout_progress(obj)["complete"],
+            timeout=timeout,
+        )
+        return rollout_progress(deployment)
+
+    async def ensure_redis(self):
+        ret = await self._ensure(
+            kind="deployment",
+            purpose="redis",
+            existing=superget(self.status, "created.deployment.redis"),
+        )
+        ret = merged(
+            ret,
+            await self._ensure(
+                kind="service",
+                purpose="redis",
+                existing=superget(self.status, "created.service.redis"),
+            ),
+        )
+        return ret
+
+    async def start_prepull(self):
+        if superget(self.spec, "imagePrePull.enabled", default=False):
+            _daemonset = await self._ensure(
+                kind="daemonset",
+                purpose="prepull",
+                enrichments=self._prepull_enrichments(),
+            )
+            return superget(_daemonset, "daemonset.prepull")
+
+    async def prepull_ready(self, name, *, timeout=0):
+        daemonset = await self._watched(
+            kind="daemonset", name=name, predicate=daemonset_ready, timeout=timeout
+        )
+        return daemonset_ready(daemonset)
+
+    async def clean_prepull(self, *, name):
+        await self.delete_resource(kind="daemonset", name=name)
+
+    async def start_manage_commands(self):
+        manage_commands = self.spec.get("initManageCommands", [])
+        if manage_commands:
+            return await self.ensure_manage_commands(manage_commands=manage_commands)
+
+    async def ensure_manage_commands(self, *, manage_commands):
+        _pod = await self._ensure(
+            kind="pod",
+            purpose="migrations",
+            enrichments=self._manage_commands_enrichments(
+                manage_commands=manage_commands
+            ),
+        )
+        return superget(_pod, "pod.migrations")
+
+    async def start_manage_command(self, command):
+        kwargs = self._manage_command_kwargs(command)
+        _pod = await self._ensure(**kwargs)
+        return _pod["pod"][kwargs["purpose"]]
+
+    async def pod_phases(self, names, *, timeout=0):
+        pods = await resource_cache.async_wait_for_any(
+            kind="pod",
+            namespace=self.namespace,
+            names=names,
+            predicate=lambda obj: pod_phase(obj) not in ("pending", "running"),
+            timeout=timeout,
+        )
+        phases = {}
+        for name, pod in pods.items():
+            if pod is None:
+                pod = await self.service("pod").read_status(
+                    namespace=self.namespace, name=name
+                )
+                pod = pod.to_dict()
+            phases[name] = pod_phase(pod)
+        return phases
+
+    async def clean_manage_commands(self, *, pod_name):
+        await self.delete_resource(kind="pod", name=pod_name)
+
+    async def _migrate_resource(
+        self,
+        *,
+        purpose,
+        enrichments=None,
+        kind="deployment",
+        template=None,
+        skip_delete=False,
+        **kwargs,
+    ):
+        blue_name, green_name = self._resource_names(kind=kind, purpose=purpose)
+        self.logger.debug(
+            f"migrate {purpose} {kind} => former = {blue_name} :: "
+            f"existing = {green_name} :: skip_delete = {skip_delete}"
+        )
+        green_obj = await self._ensure_raw(
+            kind="deployment",
+            purpose=purpose,
+            enrichments=enrichments,
+            existing=green_name,
+            template=template,
+            **kwargs,
+        )
+        ret = {kind: {purpose: green_obj.metadata.name}}
+
+        if kind == "deployment":
+            hpa_kwargs = self._hpa_kwargs(purpose=purpose, green_obj=green_obj)
+            if hpa_kwargs is not None:
+                if blue_name:
+                    blue_obj = await self.service("deployment").read(
+                        namespace=self.namespace,
+                        name=blue_name,
+                    )
+                    hpa_kwargs.update({"current_replicas": blue_obj.spec.replicas})
+                ret = merged(
+                    ret,
+                    await self._ensure(
+                        kind="horizontalpodautoscaler",
+                        purpose=purpose,
+                        template="horizontalpodautoscaler.yaml",
+                        parent=green_obj,
+                        **hpa_kwargs,
+                    ),
+                )
+
+        if blue_name and not skip_delete:
+            self.logger.debug(f"migrate {purpose} => doing delete")
+            await self._ensure(
+                kind="deployment",
+                purpose=purpose,
+                existing=blue_name,
+                delete=True,
+            )
+        return ret
+
+    async def clean_blue(self, *, purpose, blue):
+        if blue:
+            self.logger.debug(f"migrate {purpose} => doing delete")
+            await self.delete_resource(kind="deployment", name=blue)
+
+    async def migrate_service(self):
+        ret = await self._ensure(kind="service", purpose="app")
+        _, common_name = self.host.split(".", maxsplit=1)
+        ret = merged(
+            ret,
+            await self._ensure(kind="ingress", purpose="app", common_name=common_name),
+        )
+        return ret
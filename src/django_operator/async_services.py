@@ -0,0 +1,227 @@
+from django_operator.clients import AsyncApiException as ApiException
+from django_operator.clients import async_registry, get_async_api
+from django_operator.metrics import time_request
+from django_operator.scheduling import (
+    CRITICAL,
+    api_rate_limiter,
+    request_priority,
+)
+from django_operator.services import (
+    BaseService,
+    DaemonSetService,
+    DeploymentService,
+    DjangoService,
+    HorizontalPodAutoscalerService,
+    IngressService,
+    PodService,
+    ServiceService,
+)
+from django_operator.utils import superget
+
+
+class AsyncBaseService(BaseService):
+    """`BaseService` on the `kubernetes_asyncio` client; everything which
+    talks to the apiserver is a coroutine, manifest building is shared."""
+
+    def __init__(self, *, logger, configuration=None):
+        self.logger = logger
+        self.configuration = configuration
+        self.client = get_async_api(self.api_klass, configuration=configuration)
+
+    async def __transact(self, method_name, **kwargs):
+        if method_name is None:
+            raise NotImplementedError
+        _method = getattr(self.client, method_name)
+        attempt = 0
+        while True:
+            await api_rate_limiter.acquire_async()
+            try:
+                with time_request(method_name):
+                    return await _method(**kwargs)
+            except ApiException as e:
+                if not api_rate_limiter.retry_throttled(e, attempt=attempt):
+                    self.logger.debug(f"ApiException: {kwargs.get('body', 'no body')}")
+                    raise
+            attempt += 1
+            self.logger.debug(f"{method_name} was throttled, retrying")
+
+    async def _patch(self, **kwargs):
+        return await self.__transact(self.patch_method, **kwargs)
+
+    async def _read(self, **kwargs):
+        return await self.__transact(self.read_method, **kwargs)
+
+    async def _post(self, **kwargs):
+        return await self.__transact(self.post_method, **kwargs)
+
+    async def _apply(self, **kwargs):
+        # unlike the sync client, this one can send apply patches itself
+        return await self.__transact(
+            self.patch_method,
+            field_manager=self.field_manager,
+            force=True,
+            _content_type="application/apply-patch+yaml",
+            **kwargs,
+        )
+
+    async def uses_server_side_apply(self):
+        return (
+            self.server_side_apply
+            and await async_registry.supports_server_side_apply(
+                configuration=self.configuration
+            )
+        )
+
+    async def _delete(self, **kwargs):
+        try:
+            return await self.__transact(self.delete_method, **kwargs)
+        except ApiException:
+            return {}
+
+    async def unprotect(self, *, namespace, name, obj=None):
+        with request_priority(CRITICAL):
+            await self._unprotect(namespace=namespace, name=name, obj=obj)
+
+    async def _unprotect(self, *, namespace, name, obj):
+        if obj is None:
+            try:
+                obj = await self._read(namespace=namespace, name=name)
+            except ApiException:
+                # object doesn't exist
+                return
+        protector = "django.thismatters.github/protector"
+        try:
+            finalizers = [f for f in obj.metadata.finalizers if f != protector] or None
+        except TypeError:
+            # obj.metadata.finalizers is None
+            return
+        try:
+            await self._patch(
+                body={"metadata": {"finalizers": finalizers}},
+                namespace=namespace,
+                name=name,
+            )
+        except ApiException as e:
+            if e.status == 404:
+                # deleted in the meantime
+                return
+            # the resource would be stuck on the finalizer, this must be retried
+            self.logger.error(f"removing finalizers failed for {name}: {e}")
+            raise
+
+    async def read_status(self, **kwargs):
+        with request_priority(CRITICAL):
+            return await self.__transact(self.read_status_method, **kwargs)
+
+    async def read(self, **kwargs):
+        return await self._read(**kwargs)
+
+    async def list_owned(self, *, namespace, instance):
+        listed = await self.__transact(
+            self.list_method,
+            namespace=namespace,
+            label_selector=f"{self.instance_label}={instance}",
+        )
+        return listed.items
+
+    async def restore(self, *, namespace, body):
+        name = superget(body, "metadata.name")
+        if await self.uses_server_side_apply():
+            return await self._apply(namespace=namespace, name=name, body=body)
+        return await self._patch(namespace=namespace, name=name, body=body)
+
+    async def ensure(
+        self,
+        *,
+        namespace,
+        template=None,
+        body=None,
+        parent=None,
+        existing=None,
+        enrichments=None,
+        delete=False,
+        **kwargs,
+    ):
+        if not delete:
+            _body = self._get_manifest(
+                body=body,
+                template=template,
+                parent=parent,
+                namespace=namespace,
+                enrichments=enrichments,
+                **kwargs,
+            )
+            self._remember(body=_body, purpose=kwargs.get("purpose"))
+            if await self.uses_server_side_apply():
+                name = superget(_body, "metadata.name")
+                if self._seen_current(namespace=namespace, body=_body):
+                    try:
+                        _obj = await self._read(namespace=namespace, name=name)
+                    except ApiException:
+                        _obj = None
+                    if _obj is not None and self._is_current(obj=_obj, body=_body):
+                        self.logger.debug(f"{name} is unchanged, skipping apply")
+                        return _obj
+                return await self._apply(namespace=namespace, name=name, body=_body)
+            if not existing:
+                existing = superget(_body, "metadata.name")
+        _obj = None
+        if existing:
+            try:
+                _obj = await self._read(namespace=namespace, name=existing)
+            except ApiException:
+                existing = None
+            else:
+                existing = _obj.metadata.name
+
+        obj = None
+        if existing:
+            if delete:
+                await self.unprotect(namespace=namespace, name=existing, obj=_obj)
+                obj = await self._delete(namespace=namespace, name=existing)
+                self._forget(namespace=namespace, name=existing)
+            elif self._is_current(obj=_obj, body=_body):
+                self.logger.debug(f"{existing} is unchanged, skipping patch")
+                obj = _obj
+            else:
+                obj = await self._patch(namespace=namespace, name=existing, body=_body)
+        elif not delete:
+            obj = await self._post(namespace=namespace, body=_body)
+        return obj
+
+
+class AsyncDeploymentService(AsyncBaseService, DeploymentService):
+    pass
+
+
+class AsyncDaemonSetService(AsyncBaseService, DaemonSetService):
+    pass
+
+
+class AsyncServiceService(AsyncBaseService, ServiceService):
+    pass
+
+
+class AsyncIngressService(AsyncBaseService, IngressService):
+    pass
+
+
+class AsyncPodService(AsyncBaseService, PodService):
+    pass
+
+
+class AsyncHorizontalPodAutoscalerService(
+    AsyncBaseService, HorizontalPodAutoscalerService
+):
+    pass
+
+
+class AsyncDjangoService(AsyncBaseService, DjangoService):
+    async def _read(self, **kwargs):
+        return await super()._read(**self._custom_object_kwargs(**kwargs))
+
+    async def _patch(self, **kwargs):
+        return await super()._patch(**self._custom_object_kwargs(**kwargs))
+
+    async def patch(self, **kwargs):
+        return await self._patch(**kwargs)
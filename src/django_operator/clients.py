@@ -0,0 +1,171 @@
+import copy
+import os
+import re
+import threading
+
+import kubernetes.client
+import urllib3
+from kubernetes.client.exceptions import ApiException
+
+from django_operator.settings import FAN_OUT_LIMIT
+
+try:
+    import kubernetes_asyncio.client
+    import kubernetes_asyncio.config
+    from kubernetes_asyncio.client.exceptions import (
+        ApiException as AsyncApiException,
+    )
+except ImportError:  # only needed for the async handlers
+    kubernetes_asyncio = None
+    AsyncApiException = None
+
+# server-side apply went GA in kubernetes 1.22
+SERVER_SIDE_APPLY_VERSION = (1, 22)
+
+# kopf runs sync handlers in a ThreadPoolExecutor; when `max_workers` isn't
+#  configured python sizes that pool as below
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+
+def pool_maxsize(workers, *, lanes=0):
+    """Connections enough for every handler thread, plus the threads of one
+    handler fanning out over resources or running its parallel lanes"""
+    return workers + FAN_OUT_LIMIT + lanes
+
+
+DEFAULT_POOL_MAXSIZE = pool_maxsize(DEFAULT_WORKERS)
+
+
+def _version(info):
+    # minor versions can look like "22+" on managed clusters
+    minor = re.match(r"\d+", info.minor)
+    return (int(info.major), int(minor.group()) if minor else 0)
+
+
+class ClientRegistry:
+    """Process-wide cache of kubernetes API objects.
+
+    Building an `ApiClient` builds a fresh urllib3 pool, so one is kept per
+    set of credentials and every API group shares it."""
+
+    client_module = kubernetes.client
+
+    def __init__(self, *, pool_maxsize=DEFAULT_POOL_MAXSIZE):
+        self.pool_maxsize = pool_maxsize
+        self._lock = threading.Lock()
+        self._api_clients = {}
+        self._apis = {}
+        self._server_versions = {}
+
+    def configure(self, *, pool_maxsize=None):
+        with self._lock:
+            if pool_maxsize:
+                self.pool_maxsize = pool_maxsize
+            # clients built with the old settings are dropped, new ones will
+            #  be made on demand
+            self._api_clients = {}
+            self._apis = {}
+            self._server_versions = {}
+
+    def _credentials_key(self, configuration):
+        if configuration is None:
+            return None
+        return id(configuration)
+
+    def _make_api_client(self, configuration):
+        if configuration is None:
+            configuration = self.client_module.Configuration.get_default_copy()
+        else:
+            # the caller's configuration is theirs to keep as it is
+            configuration = copy.deepcopy(configuration)
+        configuration.connection_pool_maxsize = self.pool_maxsize
+        return self.client_module.ApiClient(configuration=configuration)
+
+    def api_client(self, *, configuration=None):
+        key = self._credentials_key(configuration)
+        with self._lock:
+            if key not in self._api_clients:
+                # hold onto the configuration too so that its id stays unique
+                self._api_clients[key] = (
+                    self._make_api_client(configuration),
+                    configuration,
+                )
+            return self._api_clients[key][0]
+
+    def get_api(self, api_klass, *, configuration=None):
+        key = (api_klass, self._credentials_key(configuration))
+        api = self._apis.get(key)
+        if api is None:
+            api_client = self.api_client(configuration=configuration)
+            with self._lock:
+                api = self._apis.setdefault(
+                    key, getattr(self.client_module, api_klass)(api_client=api_client)
+                )
+        return api
+
+    def server_version(self, *, configuration=None):
+        """(major, minor) of the cluster, or `None` if it couldn't be told"""
+        key = self._credentials_key(configuration)
+        if key not in self._server_versions:
+            try:
+                api = self.get_api("VersionApi", configuration=configuration)
+                info = api.get_code()
+            except (ApiException, urllib3.exceptions.HTTPError):
+                # callers fall back to what always works; only a version that
+                #  was told is kept, so a passing failure is asked about again
+                return None
+            self._server_versions[key] = _version(info)
+        return self._server_versions[key]
+
+    def supports_server_side_apply(self, *, configuration=None):
+        version = self.server_version(configuration=configuration)
+        return version is not None and version >= SERVER_SIDE_APPLY_VERSION
+
+
+class AsyncClientRegistry(ClientRegistry):
+    """The same, for `kubernetes_asyncio`; the pool size caps the aiohttp
+    connector instead of urllib3"""
+
+    client_module = getattr(kubernetes_asyncio, "client", None)
+
+    async def server_version(self, *, configuration=None):
+        key = self._credentials_key(configuration)
+        if key not in self._server_versions:
+            try:
+                api = self.get_api("VersionApi", configuration=configuration)
+                info = await api.get_code()
+            except (AsyncApiException, OSError):
+                return None
+            self._server_versions[key] = _version(info)
+        return self._server_versions[key]
+
+    async def supports_server_side_apply(self, *, configuration=None):
+        version = await self.server_version(configuration=configuration)
+        return version is not None and version >= SERVER_SIDE_APPLY_VERSION
+
+    async def close(self):
+        # aiohttp sessions belong to the loop they were opened on
+        with self._lock:
+            api_clients = [c for c, _ in self._api_clients.values()]
+            self._api_clients = {}
+            self._apis = {}
+            self._server_versions = {}
+        for api_client in api_clients:
+            await api_client.close()
+
+
+registry = ClientRegistry()
+async_registry = AsyncClientRegistry()
+
+# catch either client's errors in code shared by the sync and async handlers
+API_EXCEPTIONS = tuple(e for e in (ApiException, AsyncApiException) if e)
+
+
+def get_api(api_klass, *, configuration=None):
+    return registry.get_api(api_klass, configuration=configuration)
+
+
+def get_async_api(api_klass, *, configuration=None):
+    if kubernetes_asyncio is None:
+        raise ImportError("kubernetes_asyncio is required for the async handlers")
+    return async_registry.get_api(api_klass, configuration=configuration)
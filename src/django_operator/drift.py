@@ -0,0 +1,168 @@
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping, Sequence
+
+from kubernetes import client
+from kubernetes.utils import parse_quantity
+
+from django_operator.settings import DRIFT_CACHE_SIZE
+
+
+def _same(desired, live):
+    if desired == live:
+        return True
+    # the apiserver normalizes quantities, e.g. "1000m" comes back as "1"
+    try:
+        return parse_quantity(desired) == parse_quantity(live)
+    except (TypeError, ValueError):
+        return False
+
+
+def drifted_paths(desired, live, path=""):
+    """Where `live` no longer holds what `desired` asks for. Fields only
+    `live` has, such as defaults filled in by the apiserver, don't count."""
+    if desired is None or (isinstance(desired, (Mapping, list)) and not desired):
+        return []
+    if isinstance(desired, Mapping):
+        if not isinstance(live, Mapping):
+            return [path]
+        ret = []
+        for key, value in desired.items():
+            ret.extend(
+                drifted_paths(value, live.get(key), f"{path}.{key}" if path else key)
+            )
+        return ret
+    if isinstance(desired, list):
+        if (
+            not isinstance(live, Sequence)
+            or isinstance(live, str)
+            or len(live) != len(desired)
+        ):
+            return [path]
+        ret = []
+        for index, (_desired, _live) in enumerate(zip(desired, live)):
+            ret.extend(drifted_paths(_desired, _live, f"{path}[{index}]"))
+        return ret
+    return [] if _same(desired, live) else [path]
+
+
+def _model(name):
+    model = getattr(client, name, None)
+    return model if hasattr(model, "openapi_types") else None
+
+
+def served(desired, type_name):
+    """`desired` less the fields the kubernetes client model `type_name`
+    doesn't have; the apiserver drops those, so they can't drift"""
+    if type_name.startswith("list[") and isinstance(desired, list):
+        return [served(item, type_name[5:-1]) for item in desired]
+    model = _model(type_name)
+    if model is None or not isinstance(desired, Mapping):
+        return desired
+    fields = {key: attr for attr, key in model.attribute_map.items()}
+    return {
+        key: served(value, model.openapi_types[fields[key]])
+        for key, value in desired.items()
+        if key in fields
+    }
+
+
+def served_spec(body):
+    """The spec of a manifest as the apiserver would keep it"""
+    version = body.get("apiVersion", "").rsplit("/", 1)[-1]
+    model = _model(f"{version.capitalize()}{body.get('kind', '')}")
+    if model is None:
+        return body.get("spec")
+    return served(body.get("spec"), model.openapi_types["spec"])
+
+
+class ManifestCache:
+    """The manifest each resource was last written with, by (Django uid,
+    kind, purpose), so that watch events can be checked for drift without
+    asking the apiserver. The least recently written go first once `maxsize`
+    is reached."""
+
+    # consecutive corrections of one manifest before it is given up on, lest
+    #  the operator fight another controller (or a mutating webhook) forever
+    max_corrections = 3
+
+    def __init__(self, maxsize=DRIFT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        # key => {"name": ..., "body": ..., "spec": ..., "digest": ...,
+        #  "corrections": ...}
+        self._manifests = OrderedDict()
+        # (kind, namespace, name) => key of `_manifests`
+        self._names = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._manifests)
+
+    def remember(self, *, uid, kind, purpose, body, digest):
+        """`digest` is the hash the manifest was written with"""
+        if uid is None or purpose is None:
+            return
+        key = (uid, kind, purpose)
+        metadata = body["metadata"]
+        name = (kind, metadata.get("namespace"), metadata.get("name"))
+        with self._lock:
+            former = self._manifests.pop(key, None)
+            if former is not None:
+                self._names.pop(former["name"], None)
+            self._manifests[key] = {
+                "name": name,
+                "body": body,
+                "spec": served_spec(body),
+                "digest": digest,
+                "corrections": 0,
+            }
+            self._names[name] = key
+            while len(self._manifests) > self.maxsize:
+                _, evicted = self._manifests.popitem(last=False)
+                self._names.pop(evicted["name"], None)
+
+    def forget(self, *, kind, namespace, name):
+        with self._lock:
+            key = self._names.pop((kind, namespace, name), None)
+            if key is not None:
+                self._manifests.pop(key, None)
+
+    def _entry(self, kind, metadata):
+        key = self._names.get((kind, metadata.get("namespace"), metadata.get("name")))
+        return None if key is None else self._manifests[key]
+
+    def desired(self, *, kind, namespace, name):
+        with self._lock:
+            entry = self._entry(kind, {"namespace": namespace, "name": name})
+            return None if entry is None else entry["body"]
+
+    def drift(self, *, kind, body, digest):
+        """(desired manifest, drifted paths) when the live `body`, carrying
+        the hash `digest`, has strayed from what it was last written with"""
+        with self._lock:
+            entry = self._entry(kind, body.get("metadata") or {})
+            if entry is None or entry["corrections"] >= self.max_corrections:
+                return None
+            if digest != entry["digest"]:
+                # an event for an earlier write of ours; the latest is on its way
+                return None
+            desired, spec = entry["body"], entry["spec"]
+        paths = drifted_paths(spec, body.get("spec"), "spec")
+        if not paths:
+            with self._lock:
+                entry["corrections"] = 0
+            return None
+        return desired, paths
+
+    def corrected(self, *, kind, namespace, name):
+        """Count a correction, returning how many there have been in a row"""
+        with self._lock:
+            entry = self._entry(kind, {"namespace": namespace, "name": name})
+            if entry is None:
+                return 0
+            entry["corrections"] += 1
+            return entry["corrections"]
+
+
+manifest_cache = ManifestCache()
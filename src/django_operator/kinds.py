@@ -1,23 +1,101 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import kopf
 
 from django_operator.services import (
+    DaemonSetService,
     DeploymentService,
     HorizontalPodAutoscalerService,
     IngressService,
     PodService,
     ServiceService,
 )
-from django_operator.utils import merge, slugify, superget
+from django_operator.settings import FAN_OUT_LIMIT
+from django_operator.tracing import submit
+from django_operator.utils import merged, slugify, superget, supergetmany
+from django_operator.watches import (
+    daemonset_ready,
+    pod_phase,
+    resource_cache,
+    rollout_progress,
+)
+
+
+class ResourceErrors(Exception):
+    """Everything that went wrong in a fan-out, by (kind, name)"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(
+            "; ".join(f"{kind} {name}: {e}" for (kind, name), e in errors.items())
+        )
+
+
+class ManageCommandGraph:
+    """The `manageCommands` of a spec; each command may run as soon as the
+    commands it comes `after` have succeeded"""
+
+    def __init__(self, commands):
+        self.commands = {}
+        for command in commands:
+            name = slugify(command.get("name") or "-".join(command["command"]))
+            if name in self.commands:
+                raise ValueError(f"{name} is declared more than once")
+            after = [slugify(other) for other in command.get("after") or []]
+            self.commands[name] = dict(command, name=name, after=after)
+        for name, command in self.commands.items():
+            unknown = set(command["after"]) - self.commands.keys()
+            if unknown:
+                raise ValueError(f"{name} comes after unknown {sorted(unknown)}")
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        remaining = {name: set(c["after"]) for name, c in self.commands.items()}
+        while remaining:
+            free = [
+                name
+                for name, after in remaining.items()
+                if not after & remaining.keys()
+            ]
+            if not free:
+                raise ValueError(f"{sorted(remaining)} come after each other")
+            for name in free:
+                del remaining[name]
+
+    def runnable(self, phases):
+        """Commands yet to start whose predecessors all succeeded"""
+        return [
+            name
+            for name, command in self.commands.items()
+            if name not in phases
+            and all(phases.get(other) == "succeeded" for other in command["after"])
+        ]
+
+    def done(self, phases):
+        return all(phases.get(name) == "succeeded" for name in self.commands)
 
 
 class DjangoKind:
+    fan_out_limit = FAN_OUT_LIMIT
     kind_services = {
         "pod": PodService,
         "ingress": IngressService,
         "service": ServiceService,
         "deployment": DeploymentService,
+        "daemonset": DaemonSetService,
         "horizontalpodautoscaler": HorizontalPodAutoscalerService,
     }
+    # template kwargs taken straight from the spec
+    spec_kwargs = {
+        "app_port": "ports.app",
+        "redis_port": "ports.redis",
+        "app_cpu_request": "resourceRequests.app.cpu",
+        "beat_cpu_request": "resourceRequests.beat.cpu",
+        "worker_cpu_request": "resourceRequests.worker.cpu",
+        "app_memory_request": "resourceRequests.app.memory",
+        "beat_memory_request": "resourceRequests.beat.memory",
+        "worker_memory_request": "resourceRequests.worker.memory",
+    }
 
     def __init__(self, *, logger, patch, body, spec, status, namespace, **_):
         self.logger = logger
@@ -40,15 +118,10 @@ class DjangoKind:
             "version": version,
             "version_slug": version_slug,
             "cluster_issuer": cluster_issuer,
-            "app_port": superget(spec, "ports.app"),
-            "redis_port": superget(spec, "ports.redis"),
-            "app_cpu_request": superget(spec, "resourceRequests.app.cpu"),
-            "beat_cpu_request": superget(spec, "resourceRequests.beat.cpu"),
-            "worker_cpu_request": superget(spec, "resourceRequests.worker.cpu"),
-            "app_memory_request": superget(spec, "resourceRequests.app.memory"),
-            "beat_memory_request": superget(spec, "resourceRequests.beat.memory"),
-            "worker_memory_request": superget(spec, "resourceRequests.worker.memory"),
         }
+        found = supergetmany(spec, self.spec_kwargs.values())
+        for kwarg, superkey in self.spec_kwargs.items():
+            self.base_kwargs[kwarg] = found[superkey]
         self.body = body
         self.host = host
         self.spec = spec
@@ -57,11 +130,18 @@ class DjangoKind:
         self.status = status
         self.version = version
         self.namespace = namespace
+        self.uid = superget(body, "metadata.uid")
         self.version_slug = version_slug
+        self._services = {}
+
+    def service(self, kind):
+        if kind not in self._services:
+            kind_service_class = self.kind_services[kind]
+            self._services[kind] = kind_service_class(logger=self.logger)
+        return self._services[kind]
 
     def read_resource(self, kind, purpose, name):
-        kind_service_class = self.kind_services[kind]
-        obj = kind_service_class(logger=self.logger).read(
+        obj = self.service(kind).read(
             namespace=self.namespace,
             name=name,
         )
@@ -70,22 +150,51 @@ class DjangoKind:
     def delete_resource(self, *, kind, name):
         return self._ensure(kind=kind, purpose="purpose", existing=name, delete=True)
 
-    def unprotect_resource(self, *, kind, name):
-        kind_service_class = self.kind_services[kind]
-        kind_service_class(logger=self.logger).unprotect(
+    def list_owned(self, kind):
+        """{name: obj} of every `kind` labeled as made for this object"""
+        items = self.service(kind).list_owned(
+            namespace=self.namespace, instance=self.uid
+        )
+        return {item.metadata.name: item for item in items}
+
+    def unprotect_resource(self, *, kind, name, obj=None):
+        self.service(kind).unprotect(
             namespace=self.namespace,
             name=name,
+            obj=obj,
         )
 
+    def _fan_out(self, fn, targets):
+        """Call `fn(**target)` for each target, `fan_out_limit` at a time; every
+        target is tried before any failures are raised together"""
+        if not targets:
+            return
+        workers = min(self.fan_out_limit, len(targets))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [(t, submit(executor, fn, **t)) for t in targets]
+        errors = {}
+        for target, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors[(target["kind"], target["name"])] = e
+        if errors:
+            raise ResourceErrors(errors)
+
+    def unprotect_resources(self, targets):
+        return self._fan_out(self.unprotect_resource, targets)
+
+    def delete_resources(self, targets):
+        return self._fan_out(self.delete_resource, targets)
+
     def _ensure_raw(
         self, kind, purpose, delete=False, template=None, parent=None, **kwargs
     ):
-        kind_service_class = self.kind_services[kind]
         if template is None:
             template = f"{kind}_{purpose}.yaml"
         if parent is None:
             parent = self.body
-        obj = kind_service_class(logger=self.logger).ensure(
+        obj = self.service(kind).ensure(
             namespace=self.namespace,
             template=template,
             purpose=purpose,
@@ -102,23 +211,43 @@ class DjangoKind:
             return {kind: {purpose: obj.metadata.name}}
         return {}
 
-    def pod_phase(self, name):
-        pod = PodService(logger=self.logger).read_status(
-            namespace=self.namespace, name=name
+    def _watched(self, *, kind, name, predicate, timeout):
+        """Wait on the watch cache for the object, falling back to reading its
+        status from the apiserver if the watch hasn't seen it yet"""
+        obj = resource_cache.wait_for(
+            kind=kind,
+            namespace=self.namespace,
+            name=name,
+            predicate=predicate,
+            timeout=timeout,
         )
-        return pod.status.phase.lower()
+        if obj is None:
+            obj = (
+                self.service(kind)
+                .read_status(namespace=self.namespace, name=name)
+                .to_dict()
+            )
+        return obj
 
-    def deployment_reached_condition(self, *, name, condition):
-        self.logger.debug(f"within deployment_reached_condition: name= {name}")
-        deployment = DeploymentService(logger=self.logger).read_status(
-            namespace=self.namespace, name=name
+    def pod_phase(self, name, *, timeout=0):
+        pod = self._watched(
+            kind="pod",
+            name=name,
+            predicate=lambda obj: pod_phase(obj) not in ("pending", "running"),
+            timeout=timeout,
         )
-        if deployment.status.conditions is None:
-            return False
-        for _condition in deployment.status.conditions:
-            if _condition.type == condition:
-                return _condition.status == "True"
-        return False
+        return pod_phase(pod)
+
+    def deployment_rollout(self, *, name, timeout=0):
+        """`rollout_progress` of the deployment, waiting up to `timeout` for
+        the rollout to complete"""
+        deployment = self._watched(
+            kind="deployment",
+            name=name,
+            predicate=lambda obj: rollout_progress(obj)["complete"],
+            timeout=timeout,
+        )
+        return rollout_progress(deployment)
 
     def ensure_redis(self):
         ret = self._ensure(
@@ -126,7 +255,7 @@ class DjangoKind:
             purpose="redis",
             existing=superget(self.status, "created.deployment.redis"),
         )
-        merge(
+        ret = merged(
             ret,
             self._ensure(
                 kind="service",
@@ -136,19 +265,51 @@ class DjangoKind:
         )
         return ret
 
+    def start_prepull(self):
+        if superget(self.spec, "imagePrePull.enabled", default=False):
+            _daemonset = self._ensure(
+                kind="daemonset",
+                purpose="prepull",
+                enrichments=self._prepull_enrichments(),
+            )
+            return superget(_daemonset, "daemonset.prepull")
+
+    def _prepull_enrichments(self):
+        return {
+            "spec": {
+                "template": {
+                    "spec": {"imagePullSecrets": self.spec.get("imagePullSecrets", [])}
+                }
+            }
+        }
+
+    def prepull_ready(self, name, *, timeout=0):
+        daemonset = self._watched(
+            kind="daemonset", name=name, predicate=daemonset_ready, timeout=timeout
+        )
+        return daemonset_ready(daemonset)
+
+    def clean_prepull(self, *, name):
+        self.delete_resource(kind="daemonset", name=name)
+
     def start_manage_commands(self):
         manage_commands = self.spec.get("initManageCommands", [])
         if manage_commands:
             return self.ensure_manage_commands(manage_commands=manage_commands)
 
-    def ensure_manage_commands(self, *, manage_commands):
-        enriched_commands = []
+    def _manage_commands_enrichments(self, *, manage_commands, key="initContainers"):
+        """`manage_commands` as containers of a pod, each named for its
+        command unless given as a (name, command) pair"""
+        containers = []
         env_from = self._get_env_from(spec=self.spec)
         for manage_command in manage_commands:
-            _manage_command = "-".join(manage_command)
-            enriched_commands.append(
+            if isinstance(manage_command, tuple):
+                name, manage_command = manage_command
+            else:
+                name = slugify("-".join(manage_command))
+            containers.append(
                 {
-                    "name": slugify(_manage_command),
+                    "name": name,
                     "image": self.image,
                     "command": ["python", "manage.py"] + manage_command,
                     "env": self.spec.get("env", []),
@@ -156,18 +317,72 @@ class DjangoKind:
                     "volumeMounts": self.spec.get("volumeMounts", []),
                 }
             )
-        enrichments = {
+        return {
             "spec": {
                 "imagePullSecrets": self.spec.get("imagePullSecrets", []),
                 "volumes": self.spec.get("volumes", []),
-                "initContainers": enriched_commands,
+                key: containers,
             }
         }
 
+    def manage_command_graph(self):
+        """The `manageCommands` as a graph, None when the spec has none"""
+        commands = self.spec.get("manageCommands")
+        if not commands:
+            return None
+        try:
+            return ManageCommandGraph(commands)
+        except (KeyError, ValueError) as e:
+            self.patch.status["condition"] = "degraded"
+            raise kopf.PermanentError(f"manageCommands are invalid: {e!r}")
+
+    def _manage_command_kwargs(self, command):
+        return {
+            "kind": "pod",
+            # each command's pod is a resource of its own, e.g. for drift
+            "purpose": f"manage-{command['name']}",
+            "template": "pod_manage.yaml",
+            "command_slug": command["name"],
+            "enrichments": self._manage_commands_enrichments(
+                manage_commands=[(command["name"], command["command"])],
+                key="containers",
+            ),
+        }
+
+    def start_manage_command(self, command):
+        """Run one of the `manageCommands` in a pod of its own"""
+        kwargs = self._manage_command_kwargs(command)
+        _pod = self._ensure(**kwargs)
+        return _pod["pod"][kwargs["purpose"]]
+
+    def pod_phases(self, names, *, timeout=0):
+        """{name: phase} of the pods, waiting up to `timeout` for any of them
+        to finish"""
+        pods = resource_cache.wait_for_any(
+            kind="pod",
+            namespace=self.namespace,
+            names=names,
+            predicate=lambda obj: pod_phase(obj) not in ("pending", "running"),
+            timeout=timeout,
+        )
+        phases = {}
+        for name, pod in pods.items():
+            if pod is None:
+                pod = (
+                    self.service("pod")
+                    .read_status(namespace=self.namespace, name=name)
+                    .to_dict()
+                )
+            phases[name] = pod_phase(pod)
+        return phases
+
+    def ensure_manage_commands(self, *, manage_commands):
         _pod = self._ensure(
             kind="pod",
             purpose="migrations",
-            enrichments=enrichments,
+            enrichments=self._manage_commands_enrichments(
+                manage_commands=manage_commands
+            ),
         )
         return superget(_pod, "pod.migrations")
 
@@ -186,6 +401,18 @@ class DjangoKind:
             existing = None
         return former, existing
 
+    def _hpa_kwargs(self, *, purpose, green_obj):
+        hpa_details = superget(self.spec, f"autoscalers.{purpose}", default={})
+        if not hpa_details.get("enabled", False):
+            return None
+        return {
+            "deployment_name": green_obj.metadata.name,
+            "cpu_threshold": hpa_details["cpuUtilizationThreshold"],
+            "max_replicas": superget(hpa_details, "replicas.maximum"),
+            "min_replicas": superget(hpa_details, "replicas.minimum"),
+            "current_replicas": green_obj.spec.replicas,
+        }
+
     def _migrate_resource(
         self,
         *,
@@ -218,23 +445,15 @@ class DjangoKind:
 
         if kind == "deployment":
             # create horizontal pod autoscaling if appropriate
-            hpa_details = superget(self.spec, f"autoscalers.{purpose}", default={})
-            if hpa_details.get("enabled", False):
-                hpa_kwargs = {
-                    "deployment_name": green_obj.metadata.name,
-                    "cpu_threshold": hpa_details["cpuUtilizationThreshold"],
-                    "max_replicas": superget(hpa_details, "replicas.maximum"),
-                    "min_replicas": superget(hpa_details, "replicas.minimum"),
-                    "current_replicas": green_obj.spec.replicas,
-                }
-
+            hpa_kwargs = self._hpa_kwargs(purpose=purpose, green_obj=green_obj)
+            if hpa_kwargs is not None:
                 if blue_name:
-                    blue_obj = DeploymentService(logger=self.logger).read(
+                    blue_obj = self.service("deployment").read(
                         namespace=self.namespace,
                         name=blue_name,
                     )
                     hpa_kwargs.update({"current_replicas": blue_obj.spec.replicas})
-                merge(
+                ret = merged(
                     ret,
                     self._ensure(
                         kind="horizontalpodautoscaler",
@@ -293,18 +512,21 @@ class DjangoKind:
             }
         }
 
-    def start_green(self, *, purpose):
+    def _green_enrichments(self, *, purpose):
         enrichments = self._base_enrichments(spec=self.spec, purpose=purpose)
         if purpose == "app":
+            probe = self.spec.get("appProbeSpec", {})
+            # built fresh above, so it can be filled in; `merged` would read
+            #  the tuple key as a path into the enrichments themselves
             enrichments["spec"]["template"]["spec"][("containers", 0)].update(
-                {
-                    "livenessProbe": self.spec.get("appProbeSpec", {}),
-                    "readinessProbe": self.spec.get("appProbeSpec", {}),
-                }
+                {"livenessProbe": probe, "readinessProbe": probe}
             )
+        return enrichments
+
+    def start_green(self, *, purpose):
         return self._migrate_resource(
             purpose=purpose,
-            enrichments=enrichments,
+            enrichments=self._green_enrichments(purpose=purpose),
             skip_delete=True,
         )
 
@@ -313,20 +535,6 @@ class DjangoKind:
             self.logger.debug(f"migrate {purpose} => doing delete")
             self.delete_resource(kind="deployment", name=blue)
 
-    def migrate_worker(self):
-        # worker data gathering
-        return self._migrate_resource(
-            purpose="worker",
-            enrichments=self._base_enrichments(spec=self.spec, purpose="worker"),
-        )
-
-    def migrate_beat(self):
-        # beat data gathering
-        return self._migrate_resource(
-            purpose="beat",
-            enrichments=self._base_enrichments(spec=self.spec, purpose="beat"),
-        )
-
     def migrate_service(self):
         ret = self._ensure(
             kind="service",
@@ -335,7 +543,7 @@ class DjangoKind:
 
         # create Ingress
         _, common_name = self.host.split(".", maxsplit=1)
-        merge(
+        ret = merged(
             ret,
             self._ensure(kind="ingress", purpose="app", common_name=common_name),
         )
@@ -0,0 +1,108 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import kopf
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+from django_operator.tracing import count_api_call
+
+# steps wait on the watch cache for up to `pipelineStep.watch` seconds, so the
+#  buckets reach well past the client library defaults
+STEP_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+step_duration = Histogram(
+    "django_operator_step_duration_seconds",
+    "Time spent in a pipeline step handler",
+    ["step", "outcome"],
+    buckets=STEP_BUCKETS,
+)
+waiting_retries = Counter(
+    "django_operator_waiting_step_retries_total",
+    "Times a waiting step found its resources not ready yet",
+    ["step"],
+)
+waiting_timeouts = Counter(
+    "django_operator_waiting_step_timeouts_total",
+    "Times a waiting step ran out of iterations",
+    ["step"],
+)
+api_latency = Histogram(
+    "django_operator_api_request_duration_seconds",
+    "Latency of kubernetes API calls made by the services",
+    ["method"],
+)
+api_errors = Counter(
+    "django_operator_api_request_errors_total",
+    "Kubernetes API calls made by the services which raised",
+    ["method", "status"],
+)
+drift_corrections = Counter(
+    "django_operator_drift_corrections_total",
+    "Resources found edited away from their manifest and restored",
+    ["kind"],
+)
+objects_per_step = Gauge(
+    "django_operator_objects",
+    "Django objects by the value of their pipeline label",
+    ["step"],
+)
+
+
+@contextmanager
+def time_step(name, *, pending=(kopf.TemporaryError,)):
+    """Observe a step handler; `pending` are the exceptions meaning "not yet"
+    rather than failure"""
+    start = time.perf_counter()
+    outcome = "done"
+    try:
+        yield
+    except pending:
+        outcome = "pending"
+        raise
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        step_duration.labels(step=name, outcome=outcome).observe(
+            time.perf_counter() - start
+        )
+
+
+@contextmanager
+def time_request(method):
+    count_api_call()
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        api_errors.labels(method=method, status=getattr(e, "status", None) or "").inc()
+        raise
+    finally:
+        api_latency.labels(method=method).observe(time.perf_counter() - start)
+
+
+class StepOccupancy:
+    """Which step each Django object is on, fed by the watch"""
+
+    def __init__(self, gauge):
+        self.gauge = gauge
+        self._lock = threading.Lock()
+        self._steps = {}
+
+    def observe(self, uid, step):
+        with self._lock:
+            former = self._steps.pop(uid, None)
+            if former is not None:
+                self.gauge.labels(step=former).dec()
+            if step is not None:
+                self._steps[uid] = step
+                self.gauge.labels(step=step).inc()
+
+
+step_occupancy = StepOccupancy(objects_per_step)
+
+
+def serve_metrics(port):
+    if port:
+        start_http_server(port)
@@ -1,11 +1,21 @@
+import asyncio
+import random
+from concurrent.futures import ThreadPoolExecutor
+
 import kopf
 
-from django_operator.utils import superget
+from django_operator.metrics import (
+    time_step,
+    waiting_retries,
+    waiting_timeouts,
+)
+from django_operator.tracing import new_trace, span, submit, timestamp, tracer
+from django_operator.utils import merge_patch, merge_patches, merged, superget
 
 
 class BasePipelineStep:
     name = None
-    attribute_kwargs = ("logger", "patch", "status", "retry", "spec")
+    attribute_kwargs = ("logger", "patch", "status", "retry", "runtime", "spec")
 
     def __init__(self, **kwargs):
         for attr in self.attribute_kwargs:
@@ -16,39 +26,249 @@ class BasePipelineStep:
     def handle(self):
         raise NotImplementedError()
 
+    async def handle_async(self, *, context):
+        # steps which don't reach the apiserver can run as they are
+        return self.handle(context=context)
+
 
 class BaseWaitingStep(BasePipelineStep):
     iterations_key = "pipelineStep.iterations"
     iterations_default = 20
     period_key = "pipelineStep.period"
     period_default = 6
+    # wall-clock seconds the step may take; by default as long as
+    #  `iterations` retries at a fixed `period` would
+    timeout_key = "pipelineStep.timeout"
+    # one of "fixed", "exponential" or "jitter" (decorrelated jitter)
+    backoff_key = "pipelineStep.backoff"
+    backoff_default = "fixed"
+    max_period_key = "pipelineStep.maxPeriod"
+    max_period_default = 60
+    # how long to block on the watch stream for readiness before yielding
+    watch_key = "pipelineStep.watch"
+    watch_default = 30
+    # sync steps hold one of the handlers' shared executor threads while they
+    #  block, so they only wait briefly and yield through the retry delay
+    sync_watch_default = 3
     pipeline_step_noun = "pipeline step"
 
+    def _iterations(self):
+        return superget(self.spec, self.iterations_key, default=self.iterations_default)
+
+    def _deadline(self):
+        timeout = superget(self.spec, self.timeout_key)
+        if timeout is None:
+            timeout = self._iterations() * self._period()
+        return timeout
+
+    def _remaining(self):
+        """Seconds left before the deadline, None when the runtime isn't known"""
+        if self.runtime is None:
+            return None
+        return self._deadline() - self.runtime.total_seconds()
+
+    def _overdue(self):
+        remaining = self._remaining()
+        if remaining is None:
+            return self.retry >= self._iterations()
+        return remaining <= 0
+
     def _check_timeout(self):
-        max_retries = superget(
-            self.spec, self.iterations_key, default=self.iterations_default
-        )
         self.logger.info(f"Retry count {self.retry}")
-        if self.retry >= max_retries:
+        if self._overdue():
+            waiting_timeouts.labels(step=self.name).inc()
             self.patch.status["condition"] = "degraded"
             raise kopf.PermanentError(
                 f"{self.pipeline_step_noun} took too long. "
                 "Manual intervention required!"
             )
 
-    def is_ready(self, *, context):
+    def is_ready(self, *, context, timeout=0):
+        raise NotImplementedError()
+
+    async def is_ready_async(self, *, context, timeout=0):
         raise NotImplementedError()
 
+    def _watch_timeout(self, *, use_async=False):
+        default = self.watch_default if use_async else self.sync_watch_default
+        return superget(self.spec, self.watch_key, default=default)
+
+    def _period(self):
+        return superget(self.spec, self.period_key, default=self.period_default)
+
+    def _backoff(self, attempt):
+        """The delay before retry number `attempt` (from 0)"""
+        strategy = superget(self.spec, self.backoff_key, default=self.backoff_default)
+        period = self._period()
+        cap = superget(self.spec, self.max_period_key, default=self.max_period_default)
+        if strategy == "exponential":
+            return min(period * 2**attempt, cap)
+        if strategy == "jitter":
+            # the previous delay isn't kept between retries, so its ceiling
+            #  stands in for it
+            ceiling = min(period * 3 ** (attempt + 1), cap)
+            return random.uniform(min(period, ceiling), ceiling)
+        return period
+
+    def retry_delay(self):
+        return self._backoff(self.retry)
+
+    def _not_ready(self):
+        self._check_timeout()
+        waiting_retries.labels(step=self.name).inc()
+        delay = self.retry_delay()
+        remaining = self._remaining()
+        if remaining is not None:
+            # check once more right at the deadline rather than well past it
+            delay = max(min(delay, remaining), 1)
+        raise kopf.TemporaryError(
+            f"The {self.pipeline_step_noun} is not complete. Waiting.",
+            delay=delay,
+        )
+
     def handle(self, *, context):
-        if not self.is_ready(context=context):
-            self._check_timeout()
-            period = superget(self.spec, self.period_key, default=self.period_default)
-            raise kopf.TemporaryError(
-                f"The {self.pipeline_step_noun} is not complete. Waiting.", delay=period
-            )
+        if not self.is_ready(context=context, timeout=self._watch_timeout()):
+            self._not_ready()
+        return {}
+
+    async def handle_async(self, *, context):
+        ready = await self.is_ready_async(
+            context=context, timeout=self._watch_timeout(use_async=True)
+        )
+        if not ready:
+            self._not_ready()
         return {}
 
 
+class StepPending(Exception):
+    """A step made progress that must be kept even though it isn't done"""
+
+    def __init__(self, message, *, context, delay):
+        super().__init__(message)
+        self.context = context
+        self.delay = delay
+
+
+# neither means the step failed, only that it has more to do
+PENDING = (kopf.TemporaryError, StepPending)
+
+
+class ParallelStepGroup(BasePipelineStep):
+    """Fan out to several independent sequences (lanes) of steps and fan back
+    in once every lane has finished.
+
+    The group occupies a single slot in `BasePipeline.steps` (and so a single
+    label value). Each invocation advances every unfinished lane as far as it
+    can, concurrently; how far each lane got is kept in the pipeline context
+    under `<name>_progress` until the whole group is done."""
+
+    lanes = []
+
+    @property
+    def progress_key(self):
+        return f"{self.name}_progress"
+
+    @classmethod
+    def member_names(cls):
+        return [step.name for lane in cls.lanes for step in lane]
+
+    def _run_lane(self, lane, position, context):
+        # the lanes share `context`; merging leaves it as it is
+        ret = {}
+        _context = context
+        while position < len(lane):
+            try:
+                step = lane[position](**self.kwargs)
+                with time_step(step.name):
+                    _ret = step.handle(context=_context)
+            except kopf.TemporaryError as e:
+                return position, ret, e
+            if _ret:
+                ret = merged(ret, _ret)
+                _context = merged(_context, _ret)
+            position += 1
+        return position, ret, None
+
+    async def _run_lane_async(self, lane, position, context):
+        # the lanes share `context`; merging leaves it as it is
+        ret = {}
+        _context = context
+        while position < len(lane):
+            try:
+                step = lane[position](**self.kwargs)
+                with time_step(step.name):
+                    _ret = await step.handle_async(context=_context)
+            except kopf.TemporaryError as e:
+                return position, ret, e
+            if _ret:
+                ret = merged(ret, _ret)
+                _context = merged(_context, _ret)
+            position += 1
+        return position, ret, None
+
+    def _pending_lanes(self, context):
+        progress = dict(context.get(self.progress_key) or {})
+        pending = {
+            str(index): (lane, progress.get(str(index), 0))
+            for index, lane in enumerate(self.lanes)
+            if progress.get(str(index), 0) < len(lane)
+        }
+        return progress, pending
+
+    def _fan_in(self, progress, outcomes):
+        ret = {}
+        delays = []
+        failure = None
+        for index, outcome in outcomes.items():
+            if isinstance(outcome, BaseException):
+                # the other lanes were let finish before giving up
+                failure = failure or outcome
+                continue
+            position, _ret, error = outcome
+            progress[index] = position
+            ret = merged(ret, _ret)
+            if error is not None:
+                delays.append(error.delay or 0)
+        if failure is not None:
+            raise failure
+        if delays:
+            ret[self.progress_key] = progress
+            raise StepPending(
+                f"{len(delays)} of the {self.name} steps are not complete. Waiting.",
+                context=ret,
+                delay=min(delays),
+            )
+        # tidy up the progress tracking
+        ret[self.progress_key] = None
+        return ret
+
+    def handle(self, *, context):
+        progress, pending = self._pending_lanes(context)
+        outcomes = {}
+        with ThreadPoolExecutor(max_workers=len(pending) or 1) as executor:
+            futures = {
+                index: submit(executor, self._run_lane, lane, position, context)
+                for index, (lane, position) in pending.items()
+            }
+            for index, future in futures.items():
+                try:
+                    outcomes[index] = future.result()
+                except Exception as e:
+                    outcomes[index] = e
+        return self._fan_in(progress, outcomes)
+
+    async def handle_async(self, *, context):
+        progress, pending = self._pending_lanes(context)
+        results = await asyncio.gather(
+            *[
+                self._run_lane_async(lane, position, context)
+                for lane, position in pending.values()
+            ],
+            return_exceptions=True,
+        )
+        return self._fan_in(progress, dict(zip(pending, results)))
+
+
 class StepDetails:
     def __init__(self, *, index, name, klass, next_step_name):
         self.index = index
@@ -62,8 +282,22 @@ class BasePipeline:
     waiting_step_name = "ready"
     complete_step_name = "done"
     steps = []
-    attribute_kwargs = ("logger", "patch", "status", "labels", "diff", "body")
+    attribute_kwargs = (
+        "logger",
+        "patch",
+        "status",
+        "labels",
+        "diff",
+        "body",
+        "retry",
+        "started",
+    )
     update_handler_name = "pipeline"
+    # finished steps kept in the context, across runs of the pipeline
+    history_limit = 20
+    # go straight on into the next step within the same handler call, rather
+    #  than waiting for kopf to deliver the label change; see `_chains_into`
+    chain_steps = False
 
     def __init__(self, **kwargs):
         self._spec = kwargs.pop("spec")
@@ -84,8 +318,15 @@ class BasePipeline:
         for step in cls.steps:
             if value == step.name:
                 return True
+            if value in getattr(step, "member_names", list)():
+                return True
         return False
 
+    @classmethod
+    def max_lanes(cls):
+        """The most threads any one step runs its lanes on"""
+        return max(len(getattr(step, "lanes", ())) for step in cls.steps)
+
     def initiate_pipeline(self):
         kopf.info(self.body, reason="Migrating", message="Enacting new config")
         self.logger.info(
@@ -96,11 +337,32 @@ class BasePipeline:
         self.patch.metadata.labels[self.label] = self.steps[0].name
 
     def finalize_pipeline(self, *, context):
-        self.patch.status[self.update_handler_name] = None
+        trace = context.get("trace")
+        history = context.get("history") or []
+        steps = [e for e in history if trace and e["traceId"] == trace["traceId"]]
+        if steps:
+            self._export(
+                span(
+                    trace=trace,
+                    name=self.update_handler_name,
+                    started=steps[0]["started"],
+                    finished=timestamp(),
+                    attributes=dict(self._span_attributes(), steps=len(steps)),
+                    root=True,
+                )
+            )
+        # the history outlives the run it describes
+        self.patch.status[self.update_handler_name] = {
+            key: None for key in context if key != "history"
+        }
         return None
 
     def resolve_step(self, step_name):
         step_names = [s.name for s in self.steps]
+        for step in self.steps:
+            if step_name in getattr(step, "member_names", list)():
+                # objects labeled mid-group resume the group as a whole
+                step_name = step.name
         step_index = step_names.index(step_name)
         step_klass = self.steps[step_index]
         if step_index + 1 == len(self.steps):
@@ -133,15 +395,144 @@ class BasePipeline:
         context = self.status.get(self.update_handler_name, {})
         return self.finalize_pipeline(context=context)
 
+    def _trace_key(self, step_name):
+        return (superget(self.body or {}, "metadata.uid"), step_name)
+
+    def _span_attributes(self):
+        body = self.body or {}
+        return {
+            "k8s.namespace.name": superget(body, "metadata.namespace"),
+            "django.name": superget(body, "metadata.name"),
+            "django.version": self.spec.get("version"),
+        }
+
+    def _export(self, *spans):
+        try:
+            tracer.export(list(spans))
+        except Exception as e:
+            # tracing mustn't hold up the pipeline
+            self.logger.warning(f"Exporting spans failed: {e}")
+
+    def _record_step(self, step_name, context, ret, *, started, attempts):
+        """Add the finished step to the history and export it as a span"""
+        trace = context.get("trace") or new_trace()
+        entry = {
+            "step": step_name,
+            "started": started,
+            "finished": timestamp(),
+            "attempts": attempts,
+            "apiCalls": tracer.take_calls(self._trace_key(step_name)),
+            "traceId": trace["traceId"],
+        }
+        history = list(context.get("history") or []) + [entry]
+        self._export(
+            span(
+                trace=trace,
+                name=step_name,
+                started=entry["started"],
+                finished=entry["finished"],
+                attributes=dict(
+                    self._span_attributes(),
+                    attempts=entry["attempts"],
+                    api_calls=entry["apiCalls"],
+                ),
+            )
+        )
+        return dict(ret or {}, trace=trace, history=history[-self.history_limit :])
+
+    def _chains_into(self, step_name):
+        if not self.chain_steps:
+            return False
+        if step_name == self.complete_step_name:
+            return True
+        step_klass = self.resolve_step(step_name).klass
+        if issubclass(step_klass, (BaseWaitingStep, ParallelStepGroup)):
+            # these count their retries and runtime from kopf's first call
+            #  of the handler, which is only about now on that first call
+            return not self.retry
+        return True
+
+    def _interrupted(self, e, done, step_name):
+        """What to raise for a step which failed or isn't finished; the steps
+        finished before it in this call are kept either way"""
+        if isinstance(e, kopf.PermanentError):
+            # the step won't be retried, so its calls would never be taken
+            tracer.take_calls(self._trace_key(step_name))
+        if isinstance(e, StepPending):
+            # hold on to what was done, then come back for the rest
+            done = merge_patches(
+                done or {}, e.context, self.status.get(self.update_handler_name)
+            )
+            e = kopf.TemporaryError(str(e), delay=e.delay)
+        if done:
+            self.patch.status[self.update_handler_name] = done
+        return e
+
+    def _step_done(self, step_details, context, done, ret, *, started, attempts):
+        """Record the step and move on; returns the context, everything done
+        in this call (as a patch of the context) and the step to chain into"""
+        ret = self._record_step(
+            step_details.name, context, ret, started=started, attempts=attempts
+        )
+        context = merge_patch(context, ret)
+        done = merge_patches(done or {}, ret, self.status.get(self.update_handler_name))
+        # set the label to trigger next step
+        next_step_name = step_details.next_step_name
+        self.patch.metadata.labels[self.label] = next_step_name
+        if not self._chains_into(next_step_name):
+            return context, done, None
+        if next_step_name == self.complete_step_name:
+            self.finalize_pipeline(context=context)
+            # this call's steps are only in the context
+            self.patch.status[self.update_handler_name]["history"] = context.get(
+                "history"
+            )
+            return context, None, None
+        self.logger.info(f"Going straight on to pipeline step {next_step_name!r}")
+        return context, done, next_step_name
+
     def _handle(self, step_name):
         # pull context from all prior handler run
         context = self.status.get(self.update_handler_name, {})
-        step_details = self.resolve_step(step_name)
-        # run the step handler
-        ret = step_details.klass(**self.kwargs).handle(context=context)
-        # set the label to trigger next step
-        self.patch.metadata.labels[self.label] = step_details.next_step_name
-        return ret
+        done = None
+        started = timestamp(self.started)
+        attempts = (self.retry or 0) + 1
+        while step_name is not None:
+            step_details = self.resolve_step(step_name)
+            # run the step handler
+            try:
+                with time_step(step_details.name, pending=PENDING), tracer.counting(
+                    self._trace_key(step_details.name)
+                ):
+                    ret = step_details.klass(**self.kwargs).handle(context=context)
+            except BaseException as e:
+                raise self._interrupted(e, done, step_details.name)
+            context, done, step_name = self._step_done(
+                step_details, context, done, ret, started=started, attempts=attempts
+            )
+            started, attempts = timestamp(), 1
+        return done
+
+    async def _handle_async(self, step_name):
+        context = self.status.get(self.update_handler_name, {})
+        done = None
+        started = timestamp(self.started)
+        attempts = (self.retry or 0) + 1
+        while step_name is not None:
+            step_details = self.resolve_step(step_name)
+            try:
+                step = step_details.klass(**self.kwargs)
+                with time_step(step_details.name, pending=PENDING), tracer.counting(
+                    self._trace_key(step_details.name)
+                ):
+                    ret = await step.handle_async(context=context)
+            except BaseException as e:
+                raise self._interrupted(e, done, step_details.name)
+            context, done, step_name = self._step_done(
+                step_details, context, done, ret, started=started, attempts=attempts
+            )
+            started, attempts = timestamp(), 1
+        return done
 
     def handle(self):
         # get label value
@@ -152,3 +543,12 @@ class BasePipeline:
         if step_name == self.complete_step_name:
             return self.handle_finalize()
         return self._handle(step_name)
+
+    async def handle_async(self):
+        step_name = self.labels.get(self.label)
+        self.logger.info(f"Running pipeline step {step_name!r}")
+        if step_name == self.waiting_step_name:
+            return self.handle_initiate()
+        if step_name == self.complete_step_name:
+            return self.handle_finalize()
+        return await self._handle_async(step_name)
@@ -1,13 +1,28 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import kopf
-from kubernetes.client.exceptions import ApiException
 
+from django_operator.async_kinds import AsyncDjangoKind
+from django_operator.clients import API_EXCEPTIONS
+from django_operator.drift import manifest_cache
 from django_operator.kinds import DjangoKind
+from django_operator.metrics import drift_corrections, waiting_timeouts
 from django_operator.pipelines.base import (
     BasePipeline,
     BasePipelineStep,
     BaseWaitingStep,
+    ParallelStepGroup,
+    StepPending,
+)
+from django_operator.scheduling import (
+    BULK,
+    manage_commands_scheduler,
+    request_priority,
 )
-from django_operator.utils import superget
+from django_operator.services import DjangoService
+from django_operator.utils import superget, supergetmany
 
 
 class DjangoKindMixin:
@@ -17,62 +32,377 @@ class DjangoKindMixin:
     @property
     def django(self):
         if self._django is None:
-            self._django = DjangoKind(**self.kwargs)
+            if self.kwargs.get("use_async"):
+                self._django = AsyncDjangoKind(**self.kwargs)
+            else:
+                self._django = DjangoKind(**self.kwargs)
         return self._django
 
 
-class StartManagementCommandsStep(BasePipelineStep, DjangoKindMixin):
-    name = "start-mgmt"
+class ManagementSlotMixin:
+    def _slot_kwargs(self):
+        return {"namespace": self.kwargs["namespace"], "name": self.kwargs["name"]}
+
+    def take_slot(self):
+        """Wait in line for one of the limited management command slots"""
+        position = manage_commands_scheduler.acquire(**self._slot_kwargs())
+        self.patch.status["mgmtQueuePosition"] = position or None
+        if position:
+            period = superget(self.spec, "pipelineStep.period", default=6)
+            raise kopf.TemporaryError(
+                f"Management commands are queued at position {position}. Waiting.",
+                delay=period,
+            )
+
+    def release_slot(self):
+        manage_commands_scheduler.release(**self._slot_kwargs())
+
+
+class ManageCommandGraphMixin:
+    """Running `manageCommands` in pods of their own. The pods started so far
+    are kept in the context as `mgmt_pods`, a list of {command, pod}, and the
+    phase of every command is reported in `status.manageCommands`."""
+
+    def _report(self, graph, phases):
+        self.patch.status["manageCommands"] = {
+            name: phases.get(name, "waiting") for name in graph.commands
+        }
+
+    def _launch(self, graph, phases, pods):
+        """Start the commands which may run now; returns all the pods"""
+        pods = list(pods)
+        for name in graph.runnable(phases):
+            self.logger.info(f"Starting management command {name}")
+            pod = self.django.start_manage_command(graph.commands[name])
+            pods.append({"command": name, "pod": pod})
+            phases[name] = "pending"
+        return pods
+
+    async def _launch_async(self, graph, phases, pods):
+        pods = list(pods)
+        for name in graph.runnable(phases):
+            self.logger.info(f"Starting management command {name}")
+            pod = await self.django.start_manage_command(graph.commands[name])
+            pods.append({"command": name, "pod": pod})
+            phases[name] = "pending"
+        return pods
+
+
+class StartImagePrePullStep(BasePipelineStep, DjangoKindMixin):
+    name = "start-prepull"
 
     def handle(self, *, context):
-        self.logger.info("Setting up redis deployment")
-        created = self.django.ensure_redis()
-        force_migrations = self.spec.get("alwaysRunMigrations")
-        mgmt_pod = None
-        migration_version = self.status.get("migrationVersion", "zero")
-        if not force_migrations and migration_version == self.django.version:
+        prepull = self.django.start_prepull()
+        if prepull:
+            self.logger.info(f"Pre-pulling {self.django.image} on every node")
+        return {"prepull_name": prepull}
+
+    async def handle_async(self, *, context):
+        prepull = await self.django.start_prepull()
+        if prepull:
+            self.logger.info(f"Pre-pulling {self.django.image} on every node")
+        return {"prepull_name": prepull}
+
+
+class StartManagementCommandsStep(
+    BasePipelineStep, DjangoKindMixin, ManagementSlotMixin, ManageCommandGraphMixin
+):
+    name = "start-mgmt"
+
+    def _needs_commands(self):
+        if self.spec.get("alwaysRunMigrations"):
+            self.logger.info("Beginning management commands")
+            return True
+        fingerprint = self.spec.get("migrationFingerprint")
+        if fingerprint:
+            # the migrations, not the version, decide
+            if fingerprint == self.status.get("migrationFingerprint"):
+                self.logger.info(
+                    f"Migrations unchanged since the last run ({fingerprint}), "
+                    "skipping management commands"
+                )
+                self.patch.status["migrationVersion"] = self.django.version
+                return False
+        elif self.status.get("migrationVersion", "zero") == self.django.version:
             self.logger.info(
                 f"Already migrated to version {self.django.version}, skipping "
                 "management commands"
             )
-        else:
-            self.logger.info("Beginning management commands")
-            mgmt_pod = self.django.start_manage_commands()
-        return {"mgmt_pod_name": mgmt_pod, "created": created}
+            return False
+        self.logger.info("Beginning management commands")
+        return True
+
+    def handle(self, *, context):
+        self.logger.info("Setting up redis deployment")
+        created = self.django.ensure_redis()
+        mgmt_pod = mgmt_pods = None
+        if self._needs_commands():
+            graph = self.django.manage_command_graph()
+            self.take_slot()
+            if graph is None:
+                mgmt_pod = self.django.start_manage_commands()
+            else:
+                phases = {}
+                mgmt_pods = self._launch(graph, phases, [])
+                self._report(graph, phases)
+        return {"mgmt_pod_name": mgmt_pod, "mgmt_pods": mgmt_pods, "created": created}
+
+    async def handle_async(self, *, context):
+        self.logger.info("Setting up redis deployment")
+        created = await self.django.ensure_redis()
+        mgmt_pod = mgmt_pods = None
+        if self._needs_commands():
+            graph = self.django.manage_command_graph()
+            self.take_slot()
+            if graph is None:
+                mgmt_pod = await self.django.start_manage_commands()
+            else:
+                phases = {}
+                mgmt_pods = await self._launch_async(graph, phases, [])
+                self._report(graph, phases)
+        return {"mgmt_pod_name": mgmt_pod, "mgmt_pods": mgmt_pods, "created": created}
 
 
-class AwaitManagementCommandsStep(BaseWaitingStep, DjangoKindMixin):
+class AwaitManagementCommandsStep(
+    BaseWaitingStep, DjangoKindMixin, ManagementSlotMixin, ManageCommandGraphMixin
+):
     name = "await-mgmt"
     iterations_key = "initManageTimeouts.iterations"
     period_key = "initManageTimeouts.period"
+    timeout_key = "initManageTimeouts.timeout"
+    backoff_key = "initManageTimeouts.backoff"
+    max_period_key = "initManageTimeouts.maxPeriod"
+    watch_key = "initManageTimeouts.watch"
     pipeline_step_noun = "management commands"
 
-    def is_ready(self, *, context):
+    def _succeeded(self, pod_phase):
+        if pod_phase in ("failed", "unknown", "succeeded"):
+            # let the next object in line run its commands
+            self.release_slot()
+        if pod_phase in ("failed", "unknown"):
+            self.patch.status["condition"] = "degraded"
+            raise kopf.PermanentError(
+                f"{self.pipeline_step_noun} have failed. "
+                "Manual intervention required!"
+            )
+        return pod_phase == "succeeded"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # `mgmt_pods` once commands were started by this check
+        self.launched = None
+
+    def _not_ready(self):
+        try:
+            super()._not_ready()
+        except kopf.PermanentError:
+            # timed out, the pipeline stops here; let the next object in line
+            #  run its commands
+            self.release_slot()
+            raise
+        except kopf.TemporaryError as e:
+            if self.launched is None:
+                raise
+            # the commands started must be waited on from now on
+            raise StepPending(
+                str(e), context={"mgmt_pods": self.launched}, delay=e.delay
+            )
+
+    def _failed(self, phases):
+        return sorted(
+            name for name, phase in phases.items() if phase in ("failed", "unknown")
+        )
+
+    def _settled(self, graph, phases):
+        """Whether every command succeeded; raises when any of them failed"""
+        failed = self._failed(phases)
+        done = graph.done(phases)
+        if failed or done:
+            self.release_slot()
+        self._report(graph, phases)
+        if failed:
+            self.patch.status["condition"] = "degraded"
+            raise kopf.PermanentError(
+                f"{self.pipeline_step_noun} {', '.join(failed)} have failed. "
+                "Manual intervention required!"
+            )
+        return done
+
+    def _stuck(self, graph, phases):
+        """Whether nothing can happen until a running command finishes"""
+        return not (
+            self._failed(phases) or graph.done(phases) or graph.runnable(phases)
+        )
+
+    def _running(self, pods, phases):
+        return [
+            entry
+            for entry in pods
+            if phases[entry["command"]] in ("pending", "running")
+        ]
+
+    def _command_phases(self, pods, *, timeout):
+        commands = {entry["pod"]: entry["command"] for entry in pods}
+        try:
+            phases = self.django.pod_phases(list(commands), timeout=timeout)
+        except API_EXCEPTIONS:
+            phases = dict.fromkeys(commands, "unknown")
+        return {commands[pod]: phase for pod, phase in phases.items()}
+
+    async def _command_phases_async(self, pods, *, timeout):
+        commands = {entry["pod"]: entry["command"] for entry in pods}
+        try:
+            phases = await self.django.pod_phases(list(commands), timeout=timeout)
+        except API_EXCEPTIONS:
+            phases = dict.fromkeys(commands, "unknown")
+        return {commands[pod]: phase for pod, phase in phases.items()}
+
+    def _pod_targets(self, pods):
+        return [{"kind": "pod", "name": entry["pod"]} for entry in pods]
+
+    def _graph_ready(self, pods, *, timeout):
+        graph = self.django.manage_command_graph()
+        phases = self._command_phases(pods, timeout=0)
+        if self._stuck(graph, phases):
+            running = self._running(pods, phases)
+            phases.update(self._command_phases(running, timeout=timeout))
+        if self._settled(graph, phases):
+            self.django.delete_resources(self._pod_targets(pods))
+            self._migrated()
+            return True
+        launched = self._launch(graph, phases, pods)
+        if len(launched) > len(pods):
+            self.launched = launched
+            self._report(graph, phases)
+        return False
+
+    async def _graph_ready_async(self, pods, *, timeout):
+        graph = self.django.manage_command_graph()
+        phases = await self._command_phases_async(pods, timeout=0)
+        if self._stuck(graph, phases):
+            running = self._running(pods, phases)
+            phases.update(await self._command_phases_async(running, timeout=timeout))
+        if self._settled(graph, phases):
+            await self.django.delete_resources(self._pod_targets(pods))
+            self._migrated()
+            return True
+        launched = await self._launch_async(graph, phases, pods)
+        if len(launched) > len(pods):
+            self.launched = launched
+            self._report(graph, phases)
+        return False
+
+    def _migrated(self):
+        self.patch.status["migrationVersion"] = self.django.version
+        # unset when the spec has none, as it can't be vouched for anymore
+        self.patch.status["migrationFingerprint"] = self.spec.get(
+            "migrationFingerprint"
+        )
+
+    def is_ready(self, *, context, timeout=0):
+        if context.get("mgmt_pods"):
+            return self._graph_ready(context["mgmt_pods"], timeout=timeout)
         mgmt_pod_name = context.get("mgmt_pod_name")
 
         if mgmt_pod_name:
             try:
-                pod_phase = self.django.pod_phase(mgmt_pod_name)
-            except ApiException:
+                pod_phase = self.django.pod_phase(mgmt_pod_name, timeout=timeout)
+            except API_EXCEPTIONS:
                 pod_phase = "unknown"
-            if pod_phase in ("failed", "unknown"):
-                self.patch.status["condition"] = "degraded"
-                raise kopf.PermanentError(
-                    f"{self.pipeline_step_noun} have failed. "
-                    "Manual intervention required!"
-                )
-            if pod_phase != "succeeded":
+            if not self._succeeded(pod_phase):
                 return False
             self.django.clean_manage_commands(pod_name=mgmt_pod_name)
-            self.patch.status["migrationVersion"] = self.django.version
+            self._migrated()
         return True
 
+    async def is_ready_async(self, *, context, timeout=0):
+        if context.get("mgmt_pods"):
+            return await self._graph_ready_async(context["mgmt_pods"], timeout=timeout)
+        mgmt_pod_name = context.get("mgmt_pod_name")
+
+        if mgmt_pod_name:
+            try:
+                pod_phase = await self.django.pod_phase(mgmt_pod_name, timeout=timeout)
+            except API_EXCEPTIONS:
+                pod_phase = "unknown"
+            if not self._succeeded(pod_phase):
+                return False
+            await self.django.clean_manage_commands(pod_name=mgmt_pod_name)
+            self._migrated()
+        return True
+
+
+class AwaitImagePrePullStep(BaseWaitingStep, DjangoKindMixin):
+    """Give the pre-pull a head start on the green deployments. Unlike the
+    other waiting steps, running out of time isn't a failure; the green
+    deployments pull whatever is still missing themselves."""
+
+    name = "await-prepull"
+    iterations_key = "imagePrePull.iterations"
+    iterations_default = 10
+    period_key = "imagePrePull.period"
+    timeout_key = "imagePrePull.timeout"
+    backoff_key = "imagePrePull.backoff"
+    max_period_key = "imagePrePull.maxPeriod"
+    watch_key = "imagePrePull.watch"
+    pipeline_step_noun = "image pre-pull"
+
+    def _not_ready(self):
+        if self._overdue():
+            waiting_timeouts.labels(step=self.name).inc()
+            self.logger.warning(
+                f"The {self.pipeline_step_noun} took too long, going on without it"
+            )
+            return
+        super()._not_ready()
+
+    def is_ready(self, *, context, timeout=0):
+        prepull = context.get("prepull_name")
+        if not prepull:
+            return True
+        try:
+            return self.django.prepull_ready(prepull, timeout=timeout)
+        except API_EXCEPTIONS as e:
+            self.logger.warning(f"Checking the {self.pipeline_step_noun} failed: {e}")
+            return False
+
+    async def is_ready_async(self, *, context, timeout=0):
+        prepull = context.get("prepull_name")
+        if not prepull:
+            return True
+        try:
+            return await self.django.prepull_ready(prepull, timeout=timeout)
+        except API_EXCEPTIONS as e:
+            self.logger.warning(f"Checking the {self.pipeline_step_noun} failed: {e}")
+            return False
+
+    def handle(self, *, context):
+        ret = super().handle(context=context)
+        if context.get("prepull_name"):
+            # the images stay on the nodes
+            self.django.clean_prepull(name=context["prepull_name"])
+        return ret
+
+    async def handle_async(self, *, context):
+        ret = await super().handle_async(context=context)
+        if context.get("prepull_name"):
+            await self.django.clean_prepull(name=context["prepull_name"])
+        return ret
+
 
 class StartGreenDeploymentStep(BasePipelineStep, DjangoKindMixin):
     def handle(self, *, context):
-        blue = superget(self.status, f"created.deployment.{self.purpose}")
         self.logger.info(f"Setting up green {self.purpose} deployment")
         created = self.django.start_green(purpose=self.purpose)
+        return self._green_context(created)
+
+    async def handle_async(self, *, context):
+        self.logger.info(f"Setting up green {self.purpose} deployment")
+        created = await self.django.start_green(purpose=self.purpose)
+        return self._green_context(created)
+
+    def _green_context(self, created):
+        blue = superget(self.status, f"created.deployment.{self.purpose}")
         green = superget(created, f"deployment.{self.purpose}")
         if blue == green:
             # don't bonk out the thing you just created! (just in case the
@@ -82,11 +412,48 @@ class StartGreenDeploymentStep(BasePipelineStep, DjangoKindMixin):
 
 
 class AwaitGreenDeploymentStep(BaseWaitingStep, DjangoKindMixin):
-    def is_ready(self, *, context):
-        return self.django.deployment_reached_condition(
-            condition="Available",
+    # come back soon while replicas are coming up, back off when they stall
+    progress_delay = 2
+    backoff_default = "exponential"
+    # the lanes of a group share the patch
+    _patch_lock = threading.Lock()
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.rollout = None
+
+    def _track_rollout(self, progress):
+        summary = {k: v for k, v in progress.items() if k != "complete"}
+        previous = superget(self.status, f"rollout.{self.purpose}") or {}
+        stalled = 0
+        if {k: previous.get(k) for k in summary} == summary:
+            stalled = previous.get("stalled", 0) + 1
+        self.rollout = dict(summary, stalled=stalled)
+        with self._patch_lock:
+            self.patch.status.setdefault("rollout", {})[self.purpose] = self.rollout
+        return progress["complete"]
+
+    def retry_delay(self):
+        if self.rollout is None:
+            return super().retry_delay()
+        stalled = self.rollout["stalled"]
+        if not stalled:
+            return self.progress_delay
+        return self._backoff(stalled - 1)
+
+    def is_ready(self, *, context, timeout=0):
+        progress = self.django.deployment_rollout(
             name=superget(context, f"created.deployment.{self.purpose}"),
+            timeout=timeout,
         )
+        return self._track_rollout(progress)
+
+    async def is_ready_async(self, *, context, timeout=0):
+        progress = await self.django.deployment_rollout(
+            name=superget(context, f"created.deployment.{self.purpose}"),
+            timeout=timeout,
+        )
+        return self._track_rollout(progress)
 
 
 class StartGreenAppStep(StartGreenDeploymentStep):
@@ -120,6 +487,15 @@ class AwaitGreenBeatStep(AwaitGreenDeploymentStep):
     period_default = 3
 
 
+class GreenDeploymentsStep(ParallelStepGroup):
+    name = "green"
+    lanes = [
+        [StartGreenAppStep, AwaitGreenAppStep],
+        [StartGreenWorkerStep, AwaitGreenWorkerStep],
+        [StartGreenBeatStep, AwaitGreenBeatStep],
+    ]
+
+
 class MigrateServiceStep(BasePipelineStep, DjangoKindMixin):
     name = "migrate-service"
 
@@ -129,12 +505,17 @@ class MigrateServiceStep(BasePipelineStep, DjangoKindMixin):
         self.patch.status["version"] = self.django.version
         return {"created": created}
 
+    async def handle_async(self, *, context):
+        self.logger.info("Migrating service to green app deployment")
+        created = await self.django.migrate_service()
+        self.patch.status["version"] = self.django.version
+        return {"created": created}
+
 
 class CompleteMigrationStep(BasePipelineStep, DjangoKindMixin):
     name = "cleanup"
 
-    def handle(self, *, context):
-        created = context.get("created")
+    def _is_complete(self, created):
         create_targets = [
             "deployment.app",
             "deployment.beat",
@@ -147,36 +528,71 @@ class CompleteMigrationStep(BasePipelineStep, DjangoKindMixin):
         for purpose in ("app", "worker"):
             if superget(self.spec, f"autoscalers.{purpose}.enabled", default=False):
                 create_targets.append(f"horizontalpodautoscaler.{purpose}")
-        complete = all([superget(created, t) is not None for t in create_targets])
+        found = supergetmany(created, create_targets)
+        return all([name is not None for name in found.values()])
+
+    def _blue_targets(self, context):
+        blues = supergetmany(context, ["blue_beat", "blue_worker", "blue_app"])
+        return [
+            {"kind": "deployment", "name": blue}
+            for blue in blues.values()
+            if blue is not None
+        ]
+
+    def _hpa_targets(self, created):
+        hpas = supergetmany(
+            created,
+            ["horizontalpodautoscaler.app", "horizontalpodautoscaler.worker"],
+        )
+        return [
+            {"kind": "horizontalpodautoscaler", "name": hpa}
+            for hpa in hpas.values()
+            if hpa is not None
+        ]
+
+    def _rollback_targets(self, context, created):
+        # created green resources that aren't part of the blue deployment
+        targets = []
+        for purpose in ("beat", "worker", "app"):
+            _green = superget(created, f"deployment.{purpose}")
+            _blue = superget(self.status, f"created.deployment.{purpose}")
+            if _green is not None and _green != _blue:
+                targets.append({"kind": "deployment", "name": _green})
+        mgmt_pod_name = superget(context, "mgmt_pod_name")
+        if mgmt_pod_name is not None:
+            targets.append({"kind": "pod", "name": mgmt_pod_name})
+        for entry in context.get("mgmt_pods") or []:
+            targets.append({"kind": "pod", "name": entry["pod"]})
+        return targets
+
+    def handle(self, *, context):
+        created = context.get("created")
+        complete = self._is_complete(created)
 
         if complete:
             self.patch.status["created"] = created
-            # remove the blue resources
-            for purpose in ("beat", "worker", "app"):
-                self.logger.info(f"Removing blue {purpose} deployment")
-                self.django.clean_blue(
-                    purpose="app", blue=superget(context, f"blue_{purpose}")
-                )
-            # delete HPAs
-            for purpose in ("app", "worker"):
-                _hpa = superget(created, f"horizontalpodautoscaler.{purpose}")
-                if _hpa is not None:
-                    self.django.unprotect_resource(
-                        kind="horizontalpodautoscaler",
-                        name=_hpa
-                    )
+            self.logger.info("Removing blue deployments")
+            self.django.delete_resources(self._blue_targets(context))
+            self.django.unprotect_resources(self._hpa_targets(created))
             self.logger.info("All that was green is now blue")
         else:
-            # remove any created green resources (that aren't part of the blue deployment)
             self.logger.info("Migration was incomplete, rolling back to prior state")
-            for purpose in ("beat", "worker", "app"):
-                _green = superget(created, f"deployment.{purpose}")
-                _blue = superget(self.status, f"created.deployment.{purpose}")
-                if _green != _blue:
-                    self.django.delete_resource(kind="deployment", name=_green)
-            self.django.delete_resource(
-                kind="pod", name=superget(context, "mgmt_pod_name")
-            )
+            self.django.delete_resources(self._rollback_targets(context, created))
+        return {"migration_complete": complete}
+
+    async def handle_async(self, *, context):
+        created = context.get("created")
+        complete = self._is_complete(created)
+
+        if complete:
+            self.patch.status["created"] = created
+            self.logger.info("Removing blue deployments")
+            await self.django.delete_resources(self._blue_targets(context))
+            await self.django.unprotect_resources(self._hpa_targets(created))
+            self.logger.info("All that was green is now blue")
+        else:
+            self.logger.info("Migration was incomplete, rolling back to prior state")
+            await self.django.delete_resources(self._rollback_targets(context, created))
         return {"migration_complete": complete}
 
 
@@ -187,22 +603,31 @@ class MonitorException(Exception):
 class MigrationPipeline(BasePipeline, DjangoKindMixin):
     label = "migration-step"
     steps = [
+        StartImagePrePullStep,
         StartManagementCommandsStep,
         AwaitManagementCommandsStep,
-        StartGreenAppStep,
-        AwaitGreenAppStep,
-        StartGreenWorkerStep,
-        AwaitGreenWorkerStep,
-        StartGreenBeatStep,
-        AwaitGreenBeatStep,
+        AwaitImagePrePullStep,
+        GreenDeploymentsStep,
         MigrateServiceStep,
         CompleteMigrationStep,
     ]
     update_handler_name = "migration_pipeline"
+    chain_steps = True
+
+    @staticmethod
+    def _initial_status(spec):
+        """The status fields every migration starts out from"""
+        return {
+            "pipelineSpec": dict(spec),
+            "condition": "migrating",
+            "rollout": None,
+            "manageCommands": None,
+        }
 
     def initiate_pipeline(self):
         super().initiate_pipeline()
-        self.patch.status["condition"] = "migrating"
+        for key, value in self._initial_status(self.spec).items():
+            self.patch.status[key] = value
         return {}
 
     def finalize_pipeline(self, *, context):
@@ -222,28 +647,194 @@ class MigrationPipeline(BasePipeline, DjangoKindMixin):
             self.patch.status["pipelineSpec"] = self._spec
         super().finalize_pipeline(context=context)
 
-    def monitor(self):
+    def _created_by_kind(self):
+        """{kind: {name: purpose}} of the resources in `status.created`"""
+        return {
+            kind: {name: purpose for purpose, name in data.items()}
+            for kind, data in (self.status.get("created") or {}).items()
+        }
+
+    def _list_owned(self, kind):
+        try:
+            return self.django.list_owned(kind)
+        except API_EXCEPTIONS:
+            # fall back to looking the resources up one by one
+            return {}
+
+    async def _list_owned_async(self, kind):
+        try:
+            return await self.django.list_owned(kind)
+        except API_EXCEPTIONS:
+            return {}
+
+    def _orphans(self, kind, listed, expected):
+        # green deployments from a migration which didn't finish
+        if kind != "deployment":
+            return []
+        return sorted(listed.keys() - expected.keys())
+
+    def _find_problems(self):
+        problem = False
+        for kind, expected in self._created_by_kind().items():
+            listed = self._list_owned(kind)
+            # resources made before the instance label existed aren't listed
+            for name in expected.keys() - listed.keys():
+                try:
+                    self.django.read_resource(
+                        kind=kind, purpose=expected[name], name=name
+                    )
+                except API_EXCEPTIONS:
+                    self.logger.error(f"{expected[name]} {kind} {name} missing.")
+                    problem = True
+            for name in self._orphans(kind, listed, expected):
+                self.logger.info(f"Removing orphaned {kind} {name}")
+                self.django.delete_resource(kind=kind, name=name)
+        return problem
+
+    async def _find_problems_async(self):
         problem = False
-        for kind, data in self.status.get("created").items():
-            for purpose, name in data.items():
+        for kind, expected in self._created_by_kind().items():
+            listed = await self._list_owned_async(kind)
+            for name in expected.keys() - listed.keys():
                 try:
-                    obj = self.django.read_resource(
-                        kind=kind, purpose=purpose, name=name
+                    await self.django.read_resource(
+                        kind=kind, purpose=expected[name], name=name
                     )
-                except ApiException:
-                    self.logger.error(f"{purpose} {kind} {name} missing.")
+                except API_EXCEPTIONS:
+                    self.logger.error(f"{expected[name]} {kind} {name} missing.")
                     problem = True
+            for name in self._orphans(kind, listed, expected):
+                self.logger.info(f"Removing orphaned {kind} {name}")
+                await self.django.delete_resource(kind=kind, name=name)
+        return problem
+
+    def monitor(self):
+        # checking every object at startup mustn't crowd out the migrations
+        with request_priority(BULK):
+            problem = self._find_problems()
         if problem:
-            # start the pipeline
-            kopf.warn(self.body, reason="Migrating", message="Something is missing...")
-            self.initiate_pipeline()
-            raise MonitorException()
+            self._restart_from_monitor()
 
-    def unprotect_all(self):
-        if self.status.get("created") is None:
-            self.logger.debug(f"No resources created?")
+    async def monitor_async(self):
+        with request_priority(BULK):
+            problem = await self._find_problems_async()
+        if problem:
+            self._restart_from_monitor()
+
+    @classmethod
+    def observe_slot(
+        cls, *, event_type, namespace, name, labels, condition=None, owned=True
+    ):
+        """Keep the management command slots in step with the objects as the
+        watch sees them. Objects of other shards are seen too, so that the
+        slots their replicas hold count against the limits here."""
+        step = labels.get(cls.label)
+        slot = {"namespace": namespace, "name": name}
+        # a degraded object stays on its step until someone steps in
+        holding = (
+            event_type != "DELETED"
+            and condition != "degraded"
+            and step == AwaitManagementCommandsStep.name
+        )
+        if not owned:
+            if holding:
+                manage_commands_scheduler.hold_elsewhere(**slot)
+            else:
+                manage_commands_scheduler.release(**slot)
+            return
+        moved = manage_commands_scheduler.holds_elsewhere(**slot)
+        steps = (StartManagementCommandsStep.name, AwaitManagementCommandsStep.name)
+        if event_type == "DELETED" or condition == "degraded" or step not in steps:
+            manage_commands_scheduler.release(**slot)
+        elif holding and (event_type is None or moved):
+            # commands that were running before the operator (re)started, or
+            #  on the replica this one took the object over from
+            manage_commands_scheduler.restore(**slot)
+
+    def _restart_from_monitor(self):
+        # start the pipeline
+        kopf.warn(self.body, reason="Migrating", message="Something is missing...")
+        self.initiate_pipeline()
+        raise MonitorException()
+
+    @classmethod
+    def restart(cls, *, owner, logger):
+        """Kick off the pipeline for a Django object from outside of its own
+        handlers (i.e. when the watch reports that a resource went missing)"""
+        kopf.warn(owner, reason="Migrating", message="Something is missing...")
+        DjangoService(logger=logger).patch(**cls._restart_patch(owner))
+
+    @staticmethod
+    def correct_drift(*, kind, body, logger):
+        """Write the manifest back over a resource which the watch reports
+        was edited away from it; only that resource, the pipeline is left be"""
+        service = DjangoKind.kind_services[kind]
+        metadata = body["metadata"]
+        found = manifest_cache.drift(
+            kind=kind,
+            body=body,
+            digest=(metadata.get("annotations") or {}).get(service.hash_annotation),
+        )
+        if found is None:
             return
-        for kind, data in self.status.get("created").items():
-            for purpose, name in data.items():
-                self.logger.debug(f"Unprotect {purpose} {name}")
-                self.django.unprotect_resource(kind=kind, name=name)
+        manifest, paths = found
+        namespace, name = metadata["namespace"], metadata["name"]
+        corrections = manifest_cache.corrected(
+            kind=kind, namespace=namespace, name=name
+        )
+        logger.warning(f"{kind} {name} drifted at {', '.join(paths)}, restoring it")
+        if corrections >= manifest_cache.max_corrections:
+            logger.error(f"{kind} {name} keeps drifting, restoring it one last time")
+        try:
+            service(logger=logger).restore(namespace=namespace, body=manifest)
+        except API_EXCEPTIONS as e:
+            logger.error(f"restoring {kind} {name} failed: {e}")
+            return
+        drift_corrections.labels(kind=kind).inc()
+
+    @classmethod
+    def _restart_patch(cls, owner):
+        return {
+            "namespace": owner["metadata"]["namespace"],
+            "name": owner["metadata"]["name"],
+            "body": {
+                "metadata": {"labels": {cls.label: cls.steps[0].name}},
+                "status": cls._initial_status(owner.get("spec") or {}),
+            },
+        }
+
+    def _unprotect_targets(self, expected, listed):
+        targets = [
+            {"kind": kind, "name": name, "obj": obj}
+            for kind in listed
+            for name, obj in listed[kind].items()
+        ]
+        # resources made before the instance label existed aren't listed
+        targets.extend(
+            {"kind": kind, "name": name}
+            for kind in expected
+            for name in expected[kind].keys() - listed[kind].keys()
+        )
+        return targets
+
+    def unprotect_all(self):
+        # every owned kind is listed, `created` may be missing or behind
+        #  (e.g. when deleted mid-migration)
+        kinds = list(self.django.kind_services)
+        with ThreadPoolExecutor(max_workers=len(kinds)) as executor:
+            listed = dict(zip(kinds, executor.map(self._list_owned, kinds)))
+        targets = self._unprotect_targets(self._created_by_kind(), listed)
+        self.logger.debug(f"Unprotect {len(targets)} resources")
+        self.django.unprotect_resources(targets)
+
+    async def unprotect_all_async(self):
+        kinds = list(self.django.kind_services)
+        listed = dict(
+            zip(
+                kinds,
+                await asyncio.gather(*[self._list_owned_async(kind) for kind in kinds]),
+            )
+        )
+        targets = self._unprotect_targets(self._created_by_kind(), listed)
+        self.logger.debug(f"Unprotect {len(targets)} resources")
+        await self.django.unprotect_resources(targets)
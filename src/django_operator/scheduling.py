@@ -0,0 +1,233 @@
+import asyncio
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django_operator.settings import (
+    API_BURST,
+    API_QPS,
+    API_RETRIES,
+    MANAGE_COMMANDS_LIMIT,
+    MANAGE_COMMANDS_NAMESPACE_LIMIT,
+)
+
+
+class SlotScheduler:
+    """Caps how many holders run at once, globally and per namespace.
+
+    Callers poll `acquire` until it grants them a slot; those that can't be
+    admitted yet keep their place in a FIFO queue. A waiter whose namespace is
+    at its limit doesn't hold up waiters from other namespaces behind it.
+    Slots held by other operator replicas count against the limits too.
+    A limit of 0 means unlimited."""
+
+    def __init__(self, *, limit=0, namespace_limit=0):
+        self.limit = limit
+        self.namespace_limit = namespace_limit
+        self._lock = threading.Lock()
+        self._holders = {}
+        # key -> namespace, in order of arrival
+        self._queue = OrderedDict()
+        # key -> namespace of the slots other replicas hold
+        self._elsewhere = {}
+
+    def _held(self):
+        return len(self._holders) + len(self._elsewhere)
+
+    def _has_room(self, namespace):
+        if self.limit and self._held() >= self.limit:
+            return False
+        if self.namespace_limit:
+            held = sum(
+                1
+                for holders in (self._holders, self._elsewhere)
+                for ns in holders.values()
+                if ns == namespace
+            )
+            if held >= self.namespace_limit:
+                return False
+        return True
+
+    def _admit(self):
+        for key, namespace in list(self._queue.items()):
+            if self.limit and self._held() >= self.limit:
+                break
+            if self._has_room(namespace):
+                del self._queue[key]
+                self._holders[key] = namespace
+
+    def acquire(self, *, namespace, name):
+        """0 once the slot is held, else the 1-based place in the queue"""
+        key = (namespace, name)
+        with self._lock:
+            if key not in self._holders:
+                self._queue.setdefault(key, namespace)
+                self._admit()
+            if key in self._holders:
+                return 0
+            return list(self._queue).index(key) + 1
+
+    def restore(self, *, namespace, name):
+        """Hold a slot regardless of the limits; for work which was already
+        running when the operator started"""
+        key = (namespace, name)
+        with self._lock:
+            self._queue.pop(key, None)
+            self._elsewhere.pop(key, None)
+            self._holders[key] = namespace
+
+    def release(self, *, namespace, name):
+        key = (namespace, name)
+        with self._lock:
+            held = self._holders.pop(key, None) is not None
+            queued = self._queue.pop(key, None) is not None
+            elsewhere = self._elsewhere.pop(key, None) is not None
+            if held or queued or elsewhere:
+                self._admit()
+
+    def hold_elsewhere(self, *, namespace, name):
+        """Count a slot as held by another replica (rather than this one)"""
+        key = (namespace, name)
+        with self._lock:
+            self._holders.pop(key, None)
+            self._queue.pop(key, None)
+            self._elsewhere[key] = namespace
+
+    def holds_elsewhere(self, *, namespace, name):
+        return (namespace, name) in self._elsewhere
+
+    def holds(self, *, namespace, name):
+        return (namespace, name) in self._holders
+
+    def clear(self):
+        with self._lock:
+            self._holders = {}
+            self._queue = OrderedDict()
+            self._elsewhere = {}
+
+
+manage_commands_scheduler = SlotScheduler(
+    limit=MANAGE_COMMANDS_LIMIT, namespace_limit=MANAGE_COMMANDS_NAMESPACE_LIMIT
+)
+
+
+# API call priorities, most urgent first
+CRITICAL = "critical"
+NORMAL = "normal"
+BULK = "bulk"
+PRIORITIES = (CRITICAL, NORMAL, BULK)
+
+_priority = contextvars.ContextVar("request_priority", default=NORMAL)
+
+
+@contextmanager
+def request_priority(priority):
+    """API calls made within the block (and threads or tasks started from it)
+    wait for the rate limiter at `priority`"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def retry_after(e):
+    """Seconds the apiserver asked us to wait in `e`, if it said"""
+    headers = getattr(e, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """Token bucket shared by every API call, refilled at `qps` up to
+    `burst`. Calls which have to wait for a token are let through by priority;
+    none goes ahead while a more urgent one is waiting. A `qps` of 0 means
+    unlimited.
+
+    A 429 from the apiserver holds back every call for as long as it asked
+    (`Retry-After`), after which the call is retried up to `retries` times."""
+
+    def __init__(self, *, qps=0, burst=1, retries=0, clock=time.monotonic):
+        self.qps = qps
+        self.burst = max(burst, 1)
+        self.retries = retries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = float(self.burst)
+        self._updated = clock()
+        self._held_until = 0
+        self._waiting = dict.fromkeys(PRIORITIES, 0)
+
+    def _reserve(self, priority):
+        """0 if a token was taken, else the seconds to wait before asking again"""
+        with self._lock:
+            now = self._clock()
+            if now < self._held_until:
+                return self._held_until - now
+            if not self.qps:
+                return 0
+            elapsed = now - self._updated
+            self._tokens = min(self.burst, self._tokens + elapsed * self.qps)
+            self._updated = now
+            ahead = PRIORITIES[: PRIORITIES.index(priority)]
+            if self._tokens >= 1 and not any(self._waiting[p] for p in ahead):
+                self._tokens -= 1
+                return 0
+            if self._tokens >= 1:
+                # let the more urgent call have it
+                return 1 / self.qps
+            return (1 - self._tokens) / self.qps
+
+    def _wait(self, priority, delta):
+        with self._lock:
+            self._waiting[priority] += delta
+
+    def acquire(self):
+        priority = _priority.get()
+        waiting = False
+        try:
+            while True:
+                delay = self._reserve(priority)
+                if not delay:
+                    return
+                if not waiting:
+                    self._wait(priority, 1)
+                    waiting = True
+                time.sleep(delay)
+        finally:
+            if waiting:
+                self._wait(priority, -1)
+
+    async def acquire_async(self):
+        priority = _priority.get()
+        waiting = False
+        try:
+            while True:
+                delay = self._reserve(priority)
+                if not delay:
+                    return
+                if not waiting:
+                    self._wait(priority, 1)
+                    waiting = True
+                await asyncio.sleep(delay)
+        finally:
+            if waiting:
+                self._wait(priority, -1)
+
+    def retry_throttled(self, e, *, attempt):
+        """Whether a call which raised `e` should be made again"""
+        if getattr(e, "status", None) != 429 or attempt >= self.retries:
+            return False
+        delay = retry_after(e)
+        if delay is None:
+            delay = min(2**attempt, 30)
+        with self._lock:
+            self._held_until = max(self._held_until, self._clock() + delay)
+        return True
+
+
+api_rate_limiter = RateLimiter(qps=API_QPS, burst=API_BURST, retries=API_RETRIES)
@@ -1,40 +1,73 @@
-from pathlib import Path
+import json
 
-import kubernetes.client
 import yaml
 from kubernetes.client.exceptions import ApiException, ApiValueError
 
-from django_operator.utils import adopt_sans_labels, merge, superget
+from django_operator.clients import get_api, registry
+from django_operator.drift import manifest_cache
+from django_operator.metrics import time_request
+from django_operator.scheduling import (
+    CRITICAL,
+    api_rate_limiter,
+    request_priority,
+)
+from django_operator.templates import template_cache
+from django_operator.utils import (
+    adopt_sans_labels,
+    manifest_hash,
+    merged,
+    superget,
+)
+from django_operator.watches import resource_cache
 
 # The useful page
 # https://github.com/kubernetes-client/python/blob/master/kubernetes/README.md
 
 
 class BaseService:
+    hash_annotation = "django.thismatters.github/desired-hash"
+    # uid of the Django object a resource was made for
+    instance_label = "django.thismatters.github/instance"
+    list_method = None
     read_method = None
     delete_method = None
     patch_method = None
     post_method = None
     read_status_method = None
     api_klass = "CoreV1Api"
+    # opt into server-side apply by setting these
+    server_side_apply = False
+    apply_path = None
+    apply_response_type = None
+    field_manager = "django-operator"
+    # as the watch handlers name it
+    kind = None
 
-    def __init__(self, *, logger):
+    def __init__(self, *, logger, configuration=None):
         self.logger = logger
-        self.client = getattr(kubernetes.client, self.api_klass)()
+        self.configuration = configuration
+        self.client = get_api(self.api_klass, configuration=configuration)
 
     def __transact(self, method_name, **kwargs):
         if method_name is None:
             raise NotImplementedError
-        _method = getattr(self.client, method_name)
-        try:
-            obj = _method(**kwargs)
-        except ApiException:
-            self.logger.debug(f"ApiException: {kwargs.get('body', 'no body')}")
-            raise
-        except ApiValueError:
-            self.logger.debug(f"ApiValueError: {kwargs}")
-            raise
-        return obj
+        # methods the generated client lacks are implemented on the service
+        _method = getattr(self.client, method_name, None) or getattr(self, method_name)
+        attempt = 0
+        while True:
+            api_rate_limiter.acquire()
+            try:
+                with time_request(method_name):
+                    return _method(**kwargs)
+            except ApiException as e:
+                if not api_rate_limiter.retry_throttled(e, attempt=attempt):
+                    self.logger.debug(f"ApiException: {kwargs.get('body', 'no body')}")
+                    raise
+            except ApiValueError:
+                self.logger.debug(f"ApiValueError: {kwargs}")
+                raise
+            attempt += 1
+            self.logger.debug(f"{method_name} was throttled, retrying")
 
     def _patch(self, **kwargs):
         return self.__transact(self.patch_method, **kwargs)
@@ -45,6 +78,31 @@ class BaseService:
     def _post(self, **kwargs):
         return self.__transact(self.post_method, **kwargs)
 
+    def server_side_apply_request(self, *, namespace, name, body):
+        # the generated client can't send apply patches, so go around it
+        return self.client.api_client.call_api(
+            self.apply_path,
+            "PATCH",
+            path_params={"namespace": namespace, "name": name},
+            query_params=[("fieldManager", self.field_manager), ("force", "true")],
+            header_params={
+                "Accept": "application/json",
+                "Content-Type": "application/apply-patch+yaml",
+            },
+            body=json.dumps(body),
+            response_type=self.apply_response_type,
+            auth_settings=["BearerToken"],
+            _return_http_data_only=True,
+        )
+
+    def _apply(self, **kwargs):
+        return self.__transact("server_side_apply_request", **kwargs)
+
+    def uses_server_side_apply(self):
+        return self.server_side_apply and registry.supports_server_side_apply(
+            configuration=self.configuration
+        )
+
     def _delete(self, **kwargs):
         # remove the protect annotation
         try:
@@ -53,6 +111,11 @@ class BaseService:
             return {}
 
     def unprotect(self, *, namespace, name, obj=None):
+        # deletions are held up until this is done
+        with request_priority(CRITICAL):
+            self._unprotect(namespace=namespace, name=name, obj=obj)
+
+    def _unprotect(self, *, namespace, name, obj):
         if obj is None:
             try:
                 obj = self._read(namespace=namespace, name=name)
@@ -71,28 +134,40 @@ class BaseService:
                 namespace=namespace,
                 name=name,
             )
-        except (ApiException,) as e:
-            self.logger.error(f"removing finalizers failed for {name}")
-            self.logger.error(f"{e}")
+        except ApiException as e:
+            if e.status == 404:
+                # deleted in the meantime
+                return
+            # the resource would be stuck on the finalizer, this must be retried
+            self.logger.error(f"removing finalizers failed for {name}: {e}")
+            raise
 
     def read_status(self, **kwargs):
-        return self.__transact(self.read_status_method, **kwargs)
+        # readiness checks keep migrations moving
+        with request_priority(CRITICAL):
+            return self.__transact(self.read_status_method, **kwargs)
 
     def read(self, **kwargs):
         return self._read(**kwargs)
 
+    def _list(self, **kwargs):
+        return self.__transact(self.list_method, **kwargs)
+
+    def list_owned(self, *, namespace, instance):
+        return self._list(
+            namespace=namespace,
+            label_selector=f"{self.instance_label}={instance}",
+        ).items
+
     def _render_manifest(self, *, template, **kwargs):
-        _template = Path("manifests") / template
-        # get template
-        with open(_template) as f:
-            # render template
-            text = f.read().format(**kwargs)
-        return yaml.safe_load(text)
+        return template_cache.render(template, **kwargs)
 
     def _enrich_manifest(self, *, body, enrichments):
         if enrichments:
             try:
-                merge(body, enrichments)
+                # list items of the same name (env, volumes, ...) from the
+                #  enrichments override those in the template
+                body = merged(body, enrichments, list_key="name")
             except ValueError as e:
                 self.logger.debug(f"merge failed: {e}")
                 raise
@@ -110,10 +185,59 @@ class BaseService:
         else:
             raise Exception("wtf")  # config error
         _body = self._enrich_manifest(body=_body, enrichments=enrichments)
+        # the kopf helpers write into the metadata, which may be shared with
+        #  the template or the enrichments, so give it containers of its own
+        _body = merged(_body, {"metadata": {"labels": {}, "annotations": {}}})
         adopt_sans_labels(_body, owner=parent, labels=("migration-step",))
+        # resources adopted by other resources inherit the label instead
+        _body["metadata"]["labels"].setdefault(
+            self.instance_label, superget(parent, "metadata.uid")
+        )
+        _body.setdefault("metadata", {}).setdefault("annotations", {})[
+            self.hash_annotation
+        ] = manifest_hash(_body)
         self.logger.debug(f"{_body}")
         return _body
 
+    def _is_current(self, *, obj, body):
+        """Whether the live object was last written with this very manifest"""
+        annotations = obj.metadata.annotations or {}
+        desired = body["metadata"]["annotations"][self.hash_annotation]
+        return annotations.get(self.hash_annotation) == desired
+
+    def _seen_current(self, *, namespace, body):
+        """Whether the watch last saw the resource carrying this very manifest;
+        the live object must still be read to be sure"""
+        cached = resource_cache.get(
+            kind=self.kind, namespace=namespace, name=superget(body, "metadata.name")
+        )
+        if cached is None:
+            return False
+        annotations = cached["metadata"].get("annotations") or {}
+        desired = body["metadata"]["annotations"][self.hash_annotation]
+        return annotations.get(self.hash_annotation) == desired
+
+    def _remember(self, *, body, purpose):
+        """Keep the manifest for checking watch events against"""
+        manifest_cache.remember(
+            uid=body["metadata"]["labels"].get(self.instance_label),
+            kind=self.kind,
+            purpose=purpose,
+            body=body,
+            digest=body["metadata"]["annotations"][self.hash_annotation],
+        )
+
+    def _forget(self, *, namespace, name):
+        manifest_cache.forget(kind=self.kind, namespace=namespace, name=name)
+
+    def restore(self, *, namespace, body):
+        """Write `body`, the manifest last ensured, back over a drifted
+        resource"""
+        name = superget(body, "metadata.name")
+        if self.uses_server_side_apply():
+            return self._apply(namespace=namespace, name=name, body=body)
+        return self._patch(namespace=namespace, name=name, body=body)
+
     def ensure(
         self,
         *,
@@ -135,6 +259,20 @@ class BaseService:
                 enrichments=enrichments,
                 **kwargs,
             )
+            self._remember(body=_body, purpose=kwargs.get("purpose"))
+            if self.uses_server_side_apply():
+                name = superget(_body, "metadata.name")
+                if self._seen_current(namespace=namespace, body=_body):
+                    # a read rather than a write when nothing changed
+                    try:
+                        _obj = self._read(namespace=namespace, name=name)
+                    except ApiException:
+                        _obj = None
+                    if _obj is not None and self._is_current(obj=_obj, body=_body):
+                        self.logger.debug(f"{name} is unchanged, skipping apply")
+                        return _obj
+                # one request creates or updates, no read needed
+                return self._apply(namespace=namespace, name=name, body=_body)
             if not existing:
                 # use the name of the resource to check for existance
                 existing = superget(_body, "metadata.name")
@@ -153,6 +291,10 @@ class BaseService:
             if delete:
                 self.unprotect(namespace=namespace, name=existing, obj=_obj)
                 obj = self._delete(namespace=namespace, name=existing)
+                self._forget(namespace=namespace, name=existing)
+            elif self._is_current(obj=_obj, body=_body):
+                self.logger.debug(f"{existing} is unchanged, skipping patch")
+                obj = _obj
             else:
                 # do patch
                 obj = self._patch(namespace=namespace, name=existing, body=_body)
@@ -163,42 +305,142 @@ class BaseService:
 
 
 class DeploymentService(BaseService):
+    kind = "deployment"
+    list_method = "list_namespaced_deployment"
     read_method = "read_namespaced_deployment"
     delete_method = "delete_namespaced_deployment"
     patch_method = "patch_namespaced_deployment"
     post_method = "create_namespaced_deployment"
     read_status_method = "read_namespaced_deployment_status"
     api_klass = "AppsV1Api"
+    server_side_apply = True
+    apply_path = "/apis/apps/v1/namespaces/{namespace}/deployments/{name}"
+    apply_response_type = "V1Deployment"
+
+
+class DaemonSetService(BaseService):
+    kind = "daemonset"
+    list_method = "list_namespaced_daemon_set"
+    read_method = "read_namespaced_daemon_set"
+    delete_method = "delete_namespaced_daemon_set"
+    patch_method = "patch_namespaced_daemon_set"
+    post_method = "create_namespaced_daemon_set"
+    read_status_method = "read_namespaced_daemon_set_status"
+    api_klass = "AppsV1Api"
+    server_side_apply = True
+    apply_path = "/apis/apps/v1/namespaces/{namespace}/daemonsets/{name}"
+    apply_response_type = "V1DaemonSet"
 
 
 class ServiceService(BaseService):
+    kind = "service"
+    list_method = "list_namespaced_service"
     read_method = "read_namespaced_service"
     delete_method = "delete_namespaced_service"
     patch_method = "patch_namespaced_service"
     post_method = "create_namespaced_service"
+    server_side_apply = True
+    apply_path = "/api/v1/namespaces/{namespace}/services/{name}"
+    apply_response_type = "V1Service"
 
 
 class IngressService(BaseService):
+    kind = "ingress"
+    list_method = "list_namespaced_ingress"
     read_method = "read_namespaced_ingress"
     delete_method = "delete_namespaced_ingress"
     patch_method = "patch_namespaced_ingress"
     post_method = "create_namespaced_ingress"
     api_klass = "NetworkingV1Api"
+    server_side_apply = True
+    apply_path = "/apis/networking.k8s.io/v1/namespaces/{namespace}/ingresses/{name}"
+    apply_response_type = "V1Ingress"
 
 
 class PodService(BaseService):
     """Now _this_ is what I call pod servicing!"""
 
+    kind = "pod"
+    list_method = "list_namespaced_pod"
     read_method = "read_namespaced_pod"
     delete_method = "delete_namespaced_pod"
     patch_method = "patch_namespaced_pod"
     post_method = "create_namespaced_pod"
     read_status_method = "read_namespaced_pod_status"
+    server_side_apply = True
+    apply_path = "/api/v1/namespaces/{namespace}/pods/{name}"
+    apply_response_type = "V1Pod"
 
 
 class HorizontalPodAutoscalerService(BaseService):
+    kind = "horizontalpodautoscaler"
+    list_method = "list_namespaced_horizontal_pod_autoscaler"
     read_method = "read_namespaced_horizontal_pod_autoscaler"
     delete_method = "delete_namespaced_horizontal_pod_autoscaler"
     patch_method = "patch_namespaced_horizontal_pod_autoscaler"
     post_method = "create_namespaced_horizontal_pod_autoscaler"
     api_klass = "AutoscalingV1Api"
+    server_side_apply = True
+    apply_path = (
+        "/apis/autoscaling/v1/namespaces/{namespace}/horizontalpodautoscalers/{name}"
+    )
+    apply_response_type = "V1HorizontalPodAutoscaler"
+
+
+class DjangoService(BaseService):
+    """For patching Django objects from outside of their own handlers"""
+
+    list_method = "list_cluster_custom_object"
+    read_method = "get_namespaced_custom_object"
+    patch_method = "patch_namespaced_custom_object"
+    api_klass = "CustomObjectsApi"
+    group = "thismatters.github"
+    version = "v1alpha"
+    plural = "djangos"
+
+    def _custom_object_kwargs(self, **kwargs):
+        kwargs.update(
+            {"group": self.group, "version": self.version, "plural": self.plural}
+        )
+        return kwargs
+
+    def _read(self, **kwargs):
+        return super()._read(**self._custom_object_kwargs(**kwargs))
+
+    def _patch(self, **kwargs):
+        return super()._patch(**self._custom_object_kwargs(**kwargs))
+
+    def _list(self, **kwargs):
+        return super()._list(**self._custom_object_kwargs(**kwargs))
+
+    def patch(self, **kwargs):
+        return self._patch(**kwargs)
+
+    def list_all(self):
+        """Every Django object in the cluster, as dicts"""
+        return self._list()["items"]
+
+
+class LeaseService(BaseService):
+    list_method = "list_namespaced_lease"
+    read_method = "read_namespaced_lease"
+    delete_method = "delete_namespaced_lease"
+    patch_method = "patch_namespaced_lease"
+    post_method = "create_namespaced_lease"
+    api_klass = "CoordinationV1Api"
+
+    def renew(self, *, namespace, body):
+        """Patch the lease, creating it the first time"""
+        name = body["metadata"]["name"]
+        try:
+            return self._patch(namespace=namespace, name=name, body=body)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+        return self._post(namespace=namespace, body=body)
+
+    def list_labelled(self, *, namespace, label, value):
+        return self._list(namespace=namespace, label_selector=f"{label}={value}").items
+
+    def release(self, *, namespace, name):
+        return self._delete(namespace=namespace, name=name)
@@ -0,0 +1,60 @@
+import os
+import socket
+
+
+def _flag(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# run the pipeline handlers as coroutines on kopf's event loop rather than in
+#  its thread pool; needs `kubernetes_asyncio`
+ASYNC_HANDLERS = _flag("DJANGO_OPERATOR_ASYNC")
+
+# where prometheus can scrape the operator's metrics; 0 turns the endpoint off
+METRICS_PORT = int(os.environ.get("DJANGO_OPERATOR_METRICS_PORT", 9090))
+
+# management command pods that may run at once, across the cluster and within
+#  one namespace; they tend to share a database. 0 (the default) is unlimited,
+#  e.g. DJANGO_OPERATOR_MGMT_NAMESPACE_LIMIT=1 runs one at a time. Sharded
+#  replicas count the slots held by each other's objects from the watch, so
+#  the limits hold across the group, bar two replicas admitting in the moment
+#  before either sees the other's object move on to its commands
+MANAGE_COMMANDS_LIMIT = int(os.environ.get("DJANGO_OPERATOR_MGMT_LIMIT", 0))
+MANAGE_COMMANDS_NAMESPACE_LIMIT = int(
+    os.environ.get("DJANGO_OPERATOR_MGMT_NAMESPACE_LIMIT", 0)
+)
+
+# client side flow control for every API call: sustained calls per second
+#  (0 is unlimited), how many may go at once after a lull, and how often a
+#  call the apiserver throttled (429) is retried
+API_QPS = float(os.environ.get("DJANGO_OPERATOR_API_QPS", 100))
+API_BURST = int(os.environ.get("DJANGO_OPERATOR_API_BURST", 200))
+API_RETRIES = int(os.environ.get("DJANGO_OPERATOR_API_RETRIES", 5))
+
+# how many resources are unprotected or deleted at once
+FAN_OUT_LIMIT = int(os.environ.get("DJANGO_OPERATOR_FAN_OUT_LIMIT", 8))
+
+# where pipeline step spans go: `stdout`, `file:<path>` or the dotted path of a
+#  `django_operator.tracing.SpanExporter` subclass. Empty exports nothing
+TRACE_EXPORTER = os.environ.get("DJANGO_OPERATOR_TRACE_EXPORTER", "")
+
+# seconds between checks that each settled object's resources are present,
+#  as a backstop to the watches
+MONITOR_INTERVAL = int(os.environ.get("DJANGO_OPERATOR_MONITOR_INTERVAL", 120))
+
+# how many rendered manifests are kept to check watch events against for drift
+DRIFT_CACHE_SIZE = int(os.environ.get("DJANGO_OPERATOR_DRIFT_CACHE_SIZE", 8192))
+
+# sharding across operator replicas: replicas of the same group split the
+#  Django objects between them by consistent hashing of their uids, holding
+#  one Lease each (in the namespace below) to show they are alive. Empty
+#  turns sharding off and the one replica acts on everything
+SHARD_GROUP = os.environ.get("DJANGO_OPERATOR_SHARD_GROUP", "")
+SHARD_IDENTITY = (
+    os.environ.get("DJANGO_OPERATOR_SHARD_IDENTITY") or socket.gethostname()
+)
+SHARD_NAMESPACE = os.environ.get("DJANGO_OPERATOR_SHARD_NAMESPACE", "django-operator")
+SHARD_LEASE_SECONDS = int(os.environ.get("DJANGO_OPERATOR_SHARD_LEASE_SECONDS", 15))
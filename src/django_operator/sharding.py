@@ -0,0 +1,318 @@
+import bisect
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+
+import kopf
+
+from django_operator.clients import API_EXCEPTIONS
+from django_operator.scheduling import BULK, request_priority
+from django_operator.services import BaseService, DjangoService, LeaseService
+from django_operator.settings import (
+    SHARD_GROUP,
+    SHARD_IDENTITY,
+    SHARD_LEASE_SECONDS,
+    SHARD_NAMESPACE,
+)
+from django_operator.utils import slugify
+from django_operator.watches import owner_uid
+
+GROUP_LABEL = "django.thismatters.github/shard-group"
+# set on Django objects by the replica which takes them over
+SHARD_ANNOTATION = "django.thismatters.github/shard"
+# each replica holds Django objects with a kopf finalizer of its own: kopf
+#  drops its finalizer from objects none of its handlers match, so a shared
+#  one would be taken off by any replica but the owner
+SHARD_FINALIZER_PREFIX = "django.thismatters.github/shard-"
+# the one kopf uses when not sharded
+KOPF_FINALIZER = "kopf.zalando.org/KopfFinalizerMarker"
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+def _finalizers_patch(metadata, finalizers, **fields):
+    patch = dict(fields, finalizers=finalizers)
+    if metadata.get("resourceVersion"):
+        # the list is replaced whole, so only over the version it was read from
+        patch["resourceVersion"] = metadata["resourceVersion"]
+    return {"metadata": patch}
+
+
+class HashRing:
+    """Consistent hashing of keys onto members; when a member joins or
+    leaves only the keys on its arcs of the ring move"""
+
+    def __init__(self, members=(), *, vnodes=64):
+        self.members = frozenset(members)
+        points = sorted(
+            (_hash(f"{member}#{index}"), member)
+            for member in self.members
+            for index in range(vnodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._members = [member for _, member in points]
+
+    def owner(self, key):
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._members[index]
+
+
+class ShardMembership:
+    """Which Django objects this replica acts on.
+
+    Each replica renews a Lease of its own every third of `lease_seconds`;
+    the replicas whose leases haven't run out make up the ring. Objects a
+    replica gains when the ring changes are annotated, which gets kopf to
+    resume them there. A replica that can't renew its lease for a whole
+    `lease_seconds` lets go of everything, as the others will have taken
+    over by then."""
+
+    def __init__(
+        self,
+        *,
+        group=SHARD_GROUP,
+        identity=SHARD_IDENTITY,
+        namespace=SHARD_NAMESPACE,
+        lease_seconds=SHARD_LEASE_SECONDS,
+        clock=None,
+    ):
+        self.group = group
+        self.identity = identity
+        self.namespace = namespace
+        self.lease_seconds = lease_seconds
+        self.clock = clock or (lambda: datetime.now(timezone.utc))
+        self.ring = HashRing([identity])
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._renewed = None
+        # the ring before the last change whose gains are yet to be taken over
+        self._pending = None
+
+    @property
+    def enabled(self):
+        return bool(self.group)
+
+    @property
+    def renew_period(self):
+        return self.lease_seconds / 3
+
+    @property
+    def lease_name(self):
+        return f"{self.group}-{self.identity}"
+
+    @property
+    def finalizer(self):
+        return f"{SHARD_FINALIZER_PREFIX}{slugify(self.identity)}"[:253]
+
+    def owns(self, uid):
+        if not self.enabled or uid is None:
+            return True
+        with self._lock:
+            return self.ring.owner(uid) == self.identity
+
+    def owns_body(self, body):
+        """Django objects go by their uid, their resources by the uid of the
+        Django object they were made for"""
+        metadata = body.get("metadata") or {}
+        uid = (metadata.get("labels") or {}).get(BaseService.instance_label)
+        if uid is None:
+            uid = owner_uid(body) or metadata.get("uid")
+        return self.owns(uid)
+
+    def in_shard(self, body, **_):
+        """kopf filter"""
+        return self.owns_body(body)
+
+    def _lease(self, now):
+        return {
+            "apiVersion": "coordination.k8s.io/v1",
+            "kind": "Lease",
+            "metadata": {"name": self.lease_name, "labels": {GROUP_LABEL: self.group}},
+            "spec": {
+                "holderIdentity": self.identity,
+                "leaseDurationSeconds": self.lease_seconds,
+                "renewTime": now.strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            },
+        }
+
+    def _live_members(self, leases, now):
+        members = {self.identity}
+        for lease in leases:
+            spec = lease.spec
+            if not spec.holder_identity or spec.renew_time is None:
+                continue
+            duration = timedelta(
+                seconds=spec.lease_duration_seconds or self.lease_seconds
+            )
+            if spec.renew_time + duration > now:
+                members.add(spec.holder_identity)
+        return members
+
+    def _set_ring(self, ring):
+        with self._lock:
+            previous, self.ring = self.ring, ring
+        return previous
+
+    def refresh(self, *, logger):
+        """Renew the lease and rebuild the ring from the live leases; returns
+        the former ring when the members changed"""
+        service = LeaseService(logger=logger)
+        now = self.clock()
+        service.renew(namespace=self.namespace, body=self._lease(now))
+        self._renewed = now
+        leases = service.list_labelled(
+            namespace=self.namespace, label=GROUP_LABEL, value=self.group
+        )
+        members = self._live_members(leases, now)
+        if members == self.ring.members:
+            return None
+        logger.info(f"shard {self.group} members are now {sorted(members)}")
+        return self._set_ring(HashRing(members))
+
+    def rebalance(self, *, previous, logger):
+        """Annotate the Django objects gained from `previous`"""
+        service = DjangoService(logger=logger)
+        with request_priority(BULK):
+            for obj in service.list_all():
+                metadata = obj["metadata"]
+                if previous.owner(metadata["uid"]) == self.identity or not self.owns(
+                    metadata["uid"]
+                ):
+                    continue
+                logger.debug(f"taking over {metadata['namespace']}/{metadata['name']}")
+                finalizers = list(metadata.get("finalizers") or [])
+                if self.finalizer not in finalizers:
+                    # held before the former owner lets go of it
+                    finalizers.append(self.finalizer)
+                service.patch(
+                    namespace=metadata["namespace"],
+                    name=metadata["name"],
+                    body=_finalizers_patch(
+                        metadata,
+                        finalizers,
+                        annotations={SHARD_ANNOTATION: self.identity},
+                    ),
+                )
+
+    def _foreign_finalizer(self, finalizer):
+        if finalizer == self.finalizer:
+            return False
+        return finalizer == KOPF_FINALIZER or finalizer.startswith(
+            SHARD_FINALIZER_PREFIX
+        )
+
+    def release_finalizers(self, *, body, logger):
+        """Take the finalizers of other (and departed) replicas off a Django
+        object whose deletion this replica has handled, so that it can go"""
+        metadata = body["metadata"]
+        finalizers = list(metadata.get("finalizers") or [])
+        kept = [f for f in finalizers if not self._foreign_finalizer(f)]
+        if kept == finalizers:
+            return
+        DjangoService(logger=logger).patch(
+            namespace=metadata["namespace"],
+            name=metadata["name"],
+            body=_finalizers_patch(metadata, kept),
+        )
+
+    def _expired(self):
+        return self._renewed is None or self.clock() - self._renewed > timedelta(
+            seconds=self.lease_seconds
+        )
+
+    def tick(self, *, logger):
+        try:
+            previous = self.refresh(logger=logger)
+        except API_EXCEPTIONS as e:
+            logger.error(f"renewing the shard lease failed: {e}")
+            if self._expired() and self.ring.members:
+                logger.error("shard lease ran out, letting go of every object")
+                self._set_ring(HashRing())
+            return
+        if self._pending is None:
+            self._pending = previous
+        if self._pending is not None:
+            try:
+                self.rebalance(previous=self._pending, logger=logger)
+            except API_EXCEPTIONS as e:
+                logger.error(f"taking over objects failed, will retry: {e}")
+            else:
+                self._pending = None
+
+    def _run(self, logger):
+        while not self._stop.wait(self.renew_period):
+            self.tick(logger=logger)
+
+    def join(self, *, logger):
+        """Announce this replica and give the others a renewal to notice it
+        before acting on anything"""
+        LeaseService(logger=logger).renew(
+            namespace=self.namespace, body=self._lease(self.clock())
+        )
+        self._stop.wait(self.renew_period)
+        self.refresh(logger=logger)
+        self._thread = threading.Thread(
+            target=self._run, args=(logger,), name="shard-membership", daemon=True
+        )
+        self._thread.start()
+
+    def leave(self, *, logger):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._set_ring(HashRing())
+        LeaseService(logger=logger).release(
+            namespace=self.namespace, name=self.lease_name
+        )
+
+    def configure(self, settings):
+        """Keep kopf from writing its state into objects of other shards, from
+        releasing their finalizers, and from pausing for its peers, which are
+        expected here"""
+        settings.peering.standalone = True
+        settings.persistence.finalizer = self.finalizer
+        settings.persistence.diffbase_storage = ShardedDiffBaseStorage(membership=self)
+        settings.persistence.progress_storage = ShardedProgressStorage(membership=self)
+
+
+class ShardedDiffBaseStorage(kopf.AnnotationsDiffBaseStorage):
+    """kopf's default diff base storage, which leaves objects of other shards
+    alone. kopf stores the diff base whenever no handler matches, so without
+    this a replica would hide changes from the owner of an object."""
+
+    def __init__(self, *, membership, **kwargs):
+        super().__init__(**kwargs)
+        self.membership = membership
+
+    def store(self, *, body, **kwargs):
+        if self.membership.owns_body(body):
+            super().store(body=body, **kwargs)
+
+
+class ShardedProgressStorage(kopf.SmartProgressStorage):
+    """kopf's default progress storage, which leaves objects of other shards
+    alone"""
+
+    def __init__(self, *, membership, **kwargs):
+        super().__init__(**kwargs)
+        self.membership = membership
+
+    def store(self, *, body, **kwargs):
+        if self.membership.owns_body(body):
+            super().store(body=body, **kwargs)
+
+    def purge(self, *, body, **kwargs):
+        if self.membership.owns_body(body):
+            super().purge(body=body, **kwargs)
+
+    def touch(self, *, body, **kwargs):
+        if self.membership.owns_body(body):
+            super().touch(body=body, **kwargs)
+
+
+shard_membership = ShardMembership()
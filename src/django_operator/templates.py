@@ -0,0 +1,121 @@
+import functools
+import string
+import threading
+from pathlib import Path
+
+import yaml
+
+_SENTINEL = "__djop_placeholder_{}__"
+
+
+@functools.lru_cache(maxsize=1024)
+def _plain_scalar(text):
+    # an unquoted placeholder takes on whatever type yaml would give the text
+    return yaml.safe_load(text)
+
+
+class Placeholder:
+    """A scalar from a template with `str.format` fields left in it"""
+
+    def __init__(self, parts, *, plain):
+        self.parts = parts
+        self.plain = plain
+
+    def render(self, kwargs):
+        text = "".join(
+            kwargs[field] if is_field else field for is_field, field in self.parts
+        )
+        if self.plain:
+            return _plain_scalar(text)
+        return text
+
+
+class CompiledTemplate:
+    """A manifest template parsed once, with its placeholders located.
+
+    Rendering fills in the placeholders while copying the parsed structure;
+    it gives the same result as `yaml.safe_load(text.format(**kwargs))`
+    without any file I/O or yaml parsing."""
+
+    def __init__(self, text):
+        sentinels = {}
+        _text = []
+        for literal, field, _, _ in string.Formatter().parse(text):
+            _text.append(literal)
+            if field is not None:
+                sentinel = _SENTINEL.format(len(sentinels))
+                sentinels[sentinel] = field
+                _text.append(sentinel)
+        self.fields = frozenset(sentinels.values())
+        self._sentinels = sentinels
+        self._loader = yaml.SafeLoader("")
+        node = yaml.compose("".join(_text), Loader=yaml.SafeLoader)
+        self.tree = self._compile(node)
+
+    def _split(self, value):
+        parts = []
+        remainder = value
+        for sentinel, field in self._sentinels.items():
+            if sentinel not in remainder:
+                continue
+            before, remainder = remainder.split(sentinel, maxsplit=1)
+            if before:
+                parts.append((False, before))
+            parts.append((True, field))
+        if remainder:
+            parts.append((False, remainder))
+        return parts
+
+    def _compile(self, node):
+        if isinstance(node, yaml.MappingNode):
+            return {
+                self._compile(key): self._compile(value) for key, value in node.value
+            }
+        if isinstance(node, yaml.SequenceNode):
+            return [self._compile(item) for item in node.value]
+        if any(sentinel in node.value for sentinel in self._sentinels):
+            return Placeholder(self._split(node.value), plain=node.style is None)
+        return self._loader.construct_object(node, deep=True)
+
+    def _render(self, tree, kwargs):
+        if isinstance(tree, dict):
+            return {key: self._render(value, kwargs) for key, value in tree.items()}
+        if isinstance(tree, list):
+            return [self._render(item, kwargs) for item in tree]
+        if isinstance(tree, Placeholder):
+            return tree.render(kwargs)
+        return tree
+
+    def render(self, **kwargs):
+        # same coercion (and KeyError for missing values) as `str.format`
+        _kwargs = {field: f"{kwargs[field]}" for field in self.fields}
+        return self._render(self.tree, _kwargs)
+
+
+class TemplateCache:
+    def __init__(self, *, directory="manifests"):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+        self._templates = {}
+
+    def load(self, template):
+        with open(self.directory / template) as f:
+            return CompiledTemplate(f.read())
+
+    def preload(self):
+        for path in sorted(self.directory.glob("*.yaml")):
+            self.get(path.name)
+
+    def get(self, template):
+        compiled = self._templates.get(template)
+        if compiled is None:
+            compiled = self.load(template)
+            with self._lock:
+                compiled = self._templates.setdefault(template, compiled)
+        return compiled
+
+    def render(self, template, **kwargs):
+        return self.get(template).render(**kwargs)
+
+
+template_cache = TemplateCache()
@@ -5,6 +5,12 @@ class MockLogger:
     def debug(self, *args, **kwargs):
         pass
 
+    def warning(self, *args, **kwargs):
+        pass
+
+    def error(self, *args, **kwargs):
+        pass
+
 
 class PropObject:
     def __init__(self, dct):
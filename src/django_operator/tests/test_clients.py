@@ -0,0 +1,104 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import kubernetes.client
+from kubernetes.client.exceptions import ApiException
+
+from django_operator.clients import ClientRegistry
+from django_operator.services import DeploymentService, PodService
+
+
+class ClientRegistryTestCase(TestCase):
+    def test_api_reused(self):
+        registry = ClientRegistry()
+        api = registry.get_api("CoreV1Api")
+        self.assertIsInstance(api, kubernetes.client.CoreV1Api)
+        self.assertIs(registry.get_api("CoreV1Api"), api)
+
+    def test_api_client_shared_across_groups(self):
+        registry = ClientRegistry()
+        core = registry.get_api("CoreV1Api")
+        apps = registry.get_api("AppsV1Api")
+        self.assertIsNot(core, apps)
+        self.assertIs(core.api_client, apps.api_client)
+
+    def test_pool_maxsize(self):
+        registry = ClientRegistry(pool_maxsize=7)
+        api = registry.get_api("CoreV1Api")
+        self.assertEqual(api.api_client.configuration.connection_pool_maxsize, 7)
+
+    def test_keyed_by_credentials(self):
+        registry = ClientRegistry()
+        configuration = kubernetes.client.Configuration()
+        configuration.host = "https://elsewhere"
+        default = registry.get_api("CoreV1Api")
+        other = registry.get_api("CoreV1Api", configuration=configuration)
+        self.assertIsNot(default, other)
+        self.assertEqual(other.api_client.configuration.host, "https://elsewhere")
+        self.assertIs(registry.get_api("CoreV1Api", configuration=configuration), other)
+
+    def test_configuration_left_alone(self):
+        registry = ClientRegistry(pool_maxsize=7)
+        configuration = kubernetes.client.Configuration()
+        configuration.connection_pool_maxsize = 2
+        api = registry.get_api("CoreV1Api", configuration=configuration)
+        self.assertEqual(api.api_client.configuration.connection_pool_maxsize, 7)
+        self.assertEqual(configuration.connection_pool_maxsize, 2)
+
+    def test_configure_resets(self):
+        registry = ClientRegistry(pool_maxsize=3)
+        api = registry.get_api("CoreV1Api")
+        registry.configure(pool_maxsize=9)
+        _api = registry.get_api("CoreV1Api")
+        self.assertIsNot(api, _api)
+        self.assertEqual(_api.api_client.configuration.connection_pool_maxsize, 9)
+
+    def test_services_share_client(self):
+        self.assertIs(
+            PodService(logger=None).client.api_client,
+            DeploymentService(logger=None).client.api_client,
+        )
+
+    @patch.object(kubernetes.client.VersionApi, "get_code")
+    def test_server_side_apply_support(self, p_get_code):
+        for major, minor, supported in (
+            ("1", "21", False),
+            ("1", "22", True),
+            ("1", "24+", True),
+        ):
+            registry = ClientRegistry()
+            p_get_code.return_value = kubernetes.client.VersionInfo(
+                major=major,
+                minor=minor,
+                build_date="",
+                compiler="",
+                git_commit="",
+                git_tree_state="",
+                git_version="",
+                go_version="",
+                platform="",
+            )
+            self.assertEqual(registry.supports_server_side_apply(), supported)
+
+    @patch.object(kubernetes.client.VersionApi, "get_code")
+    def test_server_version_unknown(self, p_get_code):
+        p_get_code.side_effect = [
+            ApiException(status=503),
+            kubernetes.client.VersionInfo(
+                major="1",
+                minor="22",
+                build_date="",
+                compiler="",
+                git_commit="",
+                git_tree_state="",
+                git_version="",
+                go_version="",
+                platform="",
+            ),
+        ]
+        registry = ClientRegistry()
+        self.assertFalse(registry.supports_server_side_apply())
+        # a failed lookup isn't kept, the version is asked for again
+        self.assertTrue(registry.supports_server_side_apply())
+        self.assertTrue(registry.supports_server_side_apply())
+        self.assertEqual(p_get_code.call_count, 2)
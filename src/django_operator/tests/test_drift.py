@@ -0,0 +1,252 @@
+import copy
+from functools import partial
+from unittest import TestCase
+from unittest.mock import patch
+
+import yaml
+from kubernetes.client.exceptions import ApiException
+
+from django_operator.clients import registry
+from django_operator.drift import ManifestCache, drifted_paths, manifest_cache
+from django_operator.pipelines.migration import MigrationPipeline
+from django_operator.services import BaseService, DeploymentService
+from django_operator.templates import TemplateCache
+from django_operator.tests.base import MockLogger
+from django_operator.tests.test_templates import MANIFESTS, TEMPLATE_KWARGS
+
+PARENT = {
+    "apiVersion": "thismatters.github/v1alpha",
+    "kind": "Django",
+    "metadata": {"name": "django", "namespace": "test", "uid": "abc"},
+}
+
+
+def manifest(name="app-1", replicas=1, cpu="500m"):
+    return {
+        "apiVersion": "apps/v1",
+        "kind": "Deployment",
+        "metadata": {"name": name, "namespace": "test"},
+        "spec": {
+            "replicas": replicas,
+            "template": {
+                "spec": {
+                    "containers": [
+                        {"name": "app", "resources": {"requests": {"cpu": cpu}}}
+                    ]
+                }
+            },
+        },
+    }
+
+
+class DriftedPathsTestCase(TestCase):
+    def test_unchanged(self):
+        live = manifest()
+        live["spec"]["strategy"] = {"type": "RollingUpdate"}
+        live["spec"]["template"]["spec"]["containers"][0]["imagePullPolicy"] = "Always"
+        self.assertEqual(drifted_paths(manifest()["spec"], live["spec"], "spec"), [])
+
+    def test_changed(self):
+        self.assertEqual(
+            drifted_paths(manifest()["spec"], manifest(replicas=0)["spec"], "spec"),
+            ["spec.replicas"],
+        )
+
+    def test_quantities(self):
+        self.assertEqual(
+            drifted_paths(manifest(cpu="1000m")["spec"], manifest(cpu="1")["spec"]),
+            [],
+        )
+        self.assertEqual(
+            drifted_paths(manifest()["spec"], manifest(cpu="1")["spec"], "spec"),
+            ["spec.template.spec.containers[0].resources.requests.cpu"],
+        )
+
+    def test_lists(self):
+        self.assertEqual(drifted_paths({"a": [1, 2]}, {"a": [1]}), ["a"])
+        self.assertEqual(drifted_paths({"a": [1, 2]}, {"a": [1, 3]}), ["a[1]"])
+        self.assertEqual(drifted_paths({"a": [1]}, {"a": "1"}), ["a"])
+
+    def test_unset(self):
+        self.assertEqual(drifted_paths({"a": None, "b": {}, "c": []}, {}), [])
+        self.assertEqual(drifted_paths({"a": {"b": 1}}, {}), ["a"])
+
+
+class ManifestCacheTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = ManifestCache(maxsize=2)
+
+    def _remember(self, uid="abc", purpose="app", body=None, digest="1"):
+        self.cache.remember(
+            uid=uid,
+            kind="deployment",
+            purpose=purpose,
+            body=body or manifest(),
+            digest=digest,
+        )
+
+    def _drift(self, body, digest="1"):
+        return self.cache.drift(kind="deployment", body=body, digest=digest)
+
+    def test_remember(self):
+        self._remember()
+        self.assertEqual(
+            self.cache.desired(kind="deployment", namespace="test", name="app-1"),
+            manifest(),
+        )
+
+    def test_unowned(self):
+        self._remember(uid=None)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_replaced(self):
+        # the green deployment takes the place of the blue one
+        self._remember()
+        self._remember(body=manifest(name="app-2"))
+        self.assertEqual(len(self.cache), 1)
+        self.assertIsNone(
+            self.cache.desired(kind="deployment", namespace="test", name="app-1")
+        )
+
+    def test_evicted(self):
+        self._remember(purpose="app", body=manifest(name="app"))
+        self._remember(purpose="worker", body=manifest(name="worker"))
+        self._remember(purpose="beat", body=manifest(name="beat"))
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNone(
+            self.cache.desired(kind="deployment", namespace="test", name="app")
+        )
+
+    def test_forget(self):
+        self._remember()
+        self.cache.forget(kind="deployment", namespace="test", name="app-1")
+        self.assertEqual(len(self.cache), 0)
+
+    def test_drift(self):
+        self._remember()
+        self.assertIsNone(self._drift(manifest()))
+        self.assertEqual(
+            self._drift(manifest(replicas=0)), (manifest(), ["spec.replicas"])
+        )
+
+    def test_drift_served_fields(self):
+        # `metrics` isn't a field of autoscaling/v1, the apiserver drops it
+        hpa = TemplateCache(directory=MANIFESTS).render(
+            "horizontalpodautoscaler.yaml", **TEMPLATE_KWARGS
+        )
+        self.cache.remember(
+            uid="abc",
+            kind="horizontalpodautoscaler",
+            purpose="app",
+            body=hpa,
+            digest="1",
+        )
+        live = copy.deepcopy(hpa)
+        del live["spec"]["metrics"]
+        drift = partial(self.cache.drift, kind="horizontalpodautoscaler", digest="1")
+        self.assertIsNone(drift(body=live))
+        live["spec"]["maxReplicas"] = 3
+        self.assertEqual(drift(body=live), (hpa, ["spec.maxReplicas"]))
+
+    def test_drift_unknown(self):
+        self.assertIsNone(self._drift(manifest(replicas=0)))
+
+    def test_drift_stale(self):
+        self._remember(digest="2")
+        self.assertIsNone(self._drift(manifest(replicas=0), digest="1"))
+
+    def test_drift_corrections(self):
+        self._remember()
+        for _ in range(ManifestCache.max_corrections):
+            self.assertIsNotNone(self._drift(manifest(replicas=0)))
+            self.cache.corrected(kind="deployment", namespace="test", name="app-1")
+        self.assertIsNone(self._drift(manifest(replicas=0)))
+        # a new manifest is worth another try
+        self._remember()
+        self.assertIsNotNone(self._drift(manifest(replicas=0)))
+
+    def test_drift_corrections_reset(self):
+        self._remember()
+        self.cache.corrected(kind="deployment", namespace="test", name="app-1")
+        self.assertIsNone(self._drift(manifest()))
+        self.assertEqual(
+            self.cache.corrected(kind="deployment", namespace="test", name="app-1"), 1
+        )
+
+
+class CorrectDriftTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = patch.object(
+            registry, "supports_server_side_apply", return_value=False
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(
+            manifest_cache.forget, kind="deployment", namespace="test", name="app-1"
+        )
+        self.service = DeploymentService(logger=MockLogger())
+        with patch.object(DeploymentService, "_read"), patch.object(
+            DeploymentService, "_patch"
+        ):
+            self.service.ensure(
+                namespace="test",
+                body=yaml.safe_dump(manifest()),
+                parent=PARENT,
+                purpose="app",
+            )
+        self.desired = manifest_cache.desired(
+            kind="deployment", namespace="test", name="app-1"
+        )
+
+    def _live(self, **kwargs):
+        live = manifest(**kwargs)
+        live["metadata"] = copy.deepcopy(self.desired["metadata"])
+        return live
+
+    def test_remembered(self):
+        self.assertEqual(
+            self.desired["metadata"]["labels"][BaseService.instance_label], "abc"
+        )
+
+    @patch.object(DeploymentService, "_delete")
+    @patch.object(DeploymentService, "unprotect")
+    @patch.object(DeploymentService, "_read")
+    def test_forgotten(self, p_read, p_unprotect, p_delete):
+        p_read.return_value.metadata.name = "app-1"
+        self.service.ensure(namespace="test", existing="app-1", delete=True)
+        self.assertIsNone(
+            manifest_cache.desired(kind="deployment", namespace="test", name="app-1")
+        )
+
+    @patch.object(DeploymentService, "_patch")
+    def test_correct_drift(self, p_patch):
+        MigrationPipeline.correct_drift(
+            kind="deployment", body=self._live(), logger=MockLogger()
+        )
+        p_patch.assert_not_called()
+        MigrationPipeline.correct_drift(
+            kind="deployment", body=self._live(replicas=0), logger=MockLogger()
+        )
+        p_patch.assert_called_once_with(
+            namespace="test", name="app-1", body=self.desired
+        )
+
+    @patch.object(DeploymentService, "_apply")
+    def test_correct_drift_apply(self, p_apply):
+        registry.supports_server_side_apply.return_value = True
+        MigrationPipeline.correct_drift(
+            kind="deployment", body=self._live(replicas=0), logger=MockLogger()
+        )
+        p_apply.assert_called_once_with(
+            namespace="test", name="app-1", body=self.desired
+        )
+
+    @patch.object(DeploymentService, "_patch")
+    def test_correct_drift_failed(self, p_patch):
+        p_patch.side_effect = ApiException(status=403)
+        MigrationPipeline.correct_drift(
+            kind="deployment", body=self._live(replicas=0), logger=MockLogger()
+        )
+        p_patch.assert_called_once()
@@ -1,8 +1,20 @@
+import time
 from unittest import TestCase
 from unittest.mock import call, patch
 
-from django_operator.kinds import DjangoKind
-from django_operator.services import DeploymentService, PodService
+from kubernetes.client import V1Deployment, V1ObjectMeta
+from kubernetes.client.exceptions import ApiException
+
+from django_operator.kinds import (
+    DjangoKind,
+    ManageCommandGraph,
+    ResourceErrors,
+)
+from django_operator.services import (
+    DaemonSetService,
+    DeploymentService,
+    PodService,
+)
 from django_operator.tests.base import MockLogger, PropObject
 
 
@@ -131,3 +143,185 @@ class DjangoKindTestCase(TestCase):
                 ),
             ]
         )
+
+    @patch.object(DaemonSetService, "ensure")
+    def test_start_prepull(self, p_ensure):
+        spec = {
+            "host": "test.somewhere.com",
+            "clusterIssuer": "letsencrypt",
+            "version": "6.9.421",
+            "image": "testimage",
+            "imagePullSecrets": [{"name": "registry"}],
+        }
+        kwargs = dict(logger=MockLogger(), status={}, patch={}, body={})
+        django_kind = DjangoKind(spec=spec, namespace="test", **kwargs)
+        self.assertIsNone(django_kind.start_prepull())
+        p_ensure.assert_not_called()
+
+        p_ensure.return_value.metadata.name = "prepull"
+        spec["imagePrePull"] = {"enabled": True}
+        django_kind = DjangoKind(spec=spec, namespace="test", **kwargs)
+        self.assertEqual(django_kind.start_prepull(), "prepull")
+        self.assertEqual(
+            p_ensure.call_args.kwargs["enrichments"],
+            {
+                "spec": {
+                    "template": {"spec": {"imagePullSecrets": [{"name": "registry"}]}}
+                }
+            },
+        )
+        self.assertEqual(
+            p_ensure.call_args.kwargs["template"], "daemonset_prepull.yaml"
+        )
+
+    def test_green_enrichments_app(self):
+        probe = {"httpGet": {"path": "/", "port": 8000}}
+        django_kind = DjangoKind(
+            logger=MockLogger(),
+            status={},
+            patch={},
+            body={},
+            spec={
+                "host": "test.somewhere.com",
+                "clusterIssuer": "letsencrypt",
+                "version": "6.9.421",
+                "image": "testimage",
+                "commands": {"app": {"command": ["gunicorn"]}},
+                "appProbeSpec": probe,
+            },
+            namespace="test",
+        )
+        container = django_kind._green_enrichments(purpose="app")["spec"]["template"][
+            "spec"
+        ][("containers", 0)]
+        self.assertEqual(container["command"], ["gunicorn"])
+        self.assertEqual(container["livenessProbe"], probe)
+        self.assertEqual(container["readinessProbe"], probe)
+
+
+class ManageCommandGraphTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.graph = ManageCommandGraph(
+            [
+                {"name": "migrate", "command": ["migrate"]},
+                {"command": ["collectstatic", "--no-input"]},
+                {"name": "seed", "command": ["loaddata", "x"], "after": ["migrate"]},
+            ]
+        )
+
+    def test_names(self):
+        self.assertEqual(
+            list(self.graph.commands), ["migrate", "collectstatic---no-input", "seed"]
+        )
+
+    def test_runnable(self):
+        self.assertEqual(
+            self.graph.runnable({}), ["migrate", "collectstatic---no-input"]
+        )
+        phases = {"migrate": "running", "collectstatic---no-input": "succeeded"}
+        self.assertEqual(self.graph.runnable(phases), [])
+        phases["migrate"] = "succeeded"
+        self.assertEqual(self.graph.runnable(phases), ["seed"])
+        self.assertFalse(self.graph.done(phases))
+        phases["seed"] = "succeeded"
+        self.assertTrue(self.graph.done(phases))
+
+    def test_invalid(self):
+        for commands in (
+            [{"command": ["migrate"]}, {"command": ["migrate"]}],
+            [{"command": ["migrate"], "after": ["nope"]}],
+            [
+                {"name": "a", "command": ["a"], "after": ["b"]},
+                {"name": "b", "command": ["b"], "after": ["a"]},
+            ],
+        ):
+            with self.subTest(commands=commands), self.assertRaises(ValueError):
+                ManageCommandGraph(commands)
+
+    @patch.object(PodService, "ensure")
+    def test_start_manage_command(self, p_ensure):
+        django_kind = DjangoKind(
+            logger=MockLogger(),
+            status={},
+            patch={},
+            body={},
+            spec={
+                "host": "test.somewhere.com",
+                "clusterIssuer": "letsencrypt",
+                "version": "6.9.421",
+                "image": "testimage",
+            },
+            namespace="test",
+        )
+        p_ensure.return_value.metadata.name = "manage-seed-6-9-421"
+        pod = django_kind.start_manage_command(self.graph.commands["seed"])
+        self.assertEqual(pod, "manage-seed-6-9-421")
+        kwargs = p_ensure.call_args.kwargs
+        self.assertEqual(kwargs["template"], "pod_manage.yaml")
+        self.assertEqual(kwargs["command_slug"], "seed")
+        self.assertEqual(kwargs["purpose"], "manage-seed")
+        (container,) = kwargs["enrichments"]["spec"]["containers"]
+        self.assertEqual(container["name"], "seed")
+        self.assertEqual(container["command"], ["python", "manage.py", "loaddata", "x"])
+
+
+class DjangoKindFanOutTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.django_kind = DjangoKind(
+            logger=MockLogger(),
+            status={},
+            patch={},
+            body={},
+            spec={
+                "host": "test.somewhere.com",
+                "clusterIssuer": "letsencrypt",
+                "version": "6.9.421",
+                "image": "testimage",
+            },
+            namespace="test",
+        )
+        self.targets = [{"kind": "deployment", "name": f"app-{i}"} for i in range(8)]
+
+    @patch.object(DjangoKind, "unprotect_resource")
+    def test_overlaps(self, p_unprotect):
+        p_unprotect.side_effect = lambda **_: time.sleep(0.1)
+        start = time.perf_counter()
+        self.django_kind.unprotect_resources(self.targets)
+        # about one round trip rather than eight
+        self.assertLess(time.perf_counter() - start, 0.4)
+        self.assertEqual(p_unprotect.call_count, 8)
+
+    @patch.object(DjangoKind, "delete_resource")
+    def test_errors_gathered(self, p_delete):
+        def delete(*, kind, name):
+            if name in ("app-2", "app-5"):
+                raise ValueError(name)
+
+        p_delete.side_effect = delete
+        with self.assertRaises(ResourceErrors) as e:
+            self.django_kind.delete_resources(self.targets)
+        self.assertEqual(
+            set(e.exception.errors), {("deployment", "app-2"), ("deployment", "app-5")}
+        )
+        # a failure doesn't stop the rest
+        self.assertEqual(p_delete.call_count, 8)
+
+    @patch.object(DeploymentService, "_patch")
+    def test_unprotect_errors(self, p_patch):
+        def patch_(*, body, namespace, name):
+            if name == "app-3":
+                raise ApiException(status=500)
+            if name == "app-4":
+                raise ApiException(status=404)
+
+        p_patch.side_effect = patch_
+        protected = V1Deployment(
+            metadata=V1ObjectMeta(finalizers=["django.thismatters.github/protector"])
+        )
+        targets = [dict(target, obj=protected) for target in self.targets]
+        # the delete handler must fail, and be retried, while a finalizer stays
+        with self.assertRaises(ResourceErrors) as e:
+            self.django_kind.unprotect_resources(targets)
+        self.assertEqual(set(e.exception.errors), {("deployment", "app-3")})
@@ -0,0 +1,71 @@
+from unittest import TestCase
+
+import kopf
+from kubernetes.client.exceptions import ApiException
+from prometheus_client import REGISTRY, Gauge
+
+from django_operator.metrics import StepOccupancy, time_request, time_step
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TimeStepTestCase(TestCase):
+    def _count(self, outcome):
+        return _sample(
+            "django_operator_step_duration_seconds_count",
+            step="test-step",
+            outcome=outcome,
+        )
+
+    def test_outcomes(self):
+        before = {o: self._count(o) for o in ("done", "pending", "error")}
+        with time_step("test-step"):
+            pass
+        with self.assertRaises(kopf.TemporaryError):
+            with time_step("test-step"):
+                raise kopf.TemporaryError("not yet")
+        with self.assertRaises(kopf.PermanentError):
+            with time_step("test-step"):
+                raise kopf.PermanentError("nope")
+        for outcome in ("done", "pending", "error"):
+            self.assertEqual(self._count(outcome), before[outcome] + 1)
+
+
+class TimeRequestTestCase(TestCase):
+    def test_errors_by_status(self):
+        method = "read_namespaced_test"
+        before = _sample(
+            "django_operator_api_request_errors_total", method=method, status="404"
+        )
+        with time_request(method):
+            pass
+        with self.assertRaises(ApiException):
+            with time_request(method):
+                raise ApiException(status=404)
+        self.assertEqual(
+            _sample(
+                "django_operator_api_request_duration_seconds_count", method=method
+            ),
+            2,
+        )
+        self.assertEqual(
+            _sample(
+                "django_operator_api_request_errors_total", method=method, status="404"
+            ),
+            before + 1,
+        )
+
+
+class StepOccupancyTestCase(TestCase):
+    def test_observe(self):
+        gauge = Gauge("test_objects", "", ["step"], registry=None)
+        occupancy = StepOccupancy(gauge)
+        occupancy.observe(uid="a", step="ready")
+        occupancy.observe(uid="b", step="ready")
+        occupancy.observe(uid="a", step="start-mgmt")
+        self.assertEqual(gauge.labels(step="ready")._value.get(), 1)
+        self.assertEqual(gauge.labels(step="start-mgmt")._value.get(), 1)
+        occupancy.observe(uid="a", step=None)
+        self.assertEqual(gauge.labels(step="start-mgmt")._value.get(), 0)
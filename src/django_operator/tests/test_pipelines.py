@@ -1,10 +1,42 @@
-from unittest import TestCase
-from unittest.mock import patch
+import asyncio
+import time
+from datetime import datetime, timedelta
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import call, patch
 
 import kopf
+from kubernetes.client import V1Deployment, V1ObjectMeta, V1Service
+from kubernetes.client.exceptions import ApiException
 
-from django_operator.pipelines.base import BasePipeline, BaseWaitingStep
+from django_operator.async_kinds import AsyncDjangoKind
+from django_operator.kinds import DjangoKind
+from django_operator.metrics import time_request
+from django_operator.pipelines.base import (
+    BasePipeline,
+    BasePipelineStep,
+    BaseWaitingStep,
+    ParallelStepGroup,
+    StepPending,
+)
+from django_operator.pipelines.migration import (
+    AwaitGreenAppStep,
+    AwaitImagePrePullStep,
+    AwaitManagementCommandsStep,
+    MigrationPipeline,
+    MonitorException,
+    StartManagementCommandsStep,
+)
+from django_operator.services import DjangoService
 from django_operator.tests.base import MockLogger, MockPatch
+from django_operator.tracing import SpanExporter, tracer
+
+
+class ListExporter(SpanExporter):
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
 
 
 class ThingWithName:
@@ -21,6 +53,76 @@ class OtherThingWithName(ThingWithName):
     name = "i-also-have-a-name"
 
 
+class SleepyStep(BasePipelineStep):
+    name = "sleepy"
+    duration = 0
+    calls = []
+
+    def handle(self, *, context):
+        self.calls.append(self.name)
+        time.sleep(self.duration)
+        return {"created": {self.name: self.duration}}
+
+
+class ShortStep(SleepyStep):
+    name = "short"
+    duration = 0.1
+
+
+class MediumStep(SleepyStep):
+    name = "medium"
+    duration = 0.2
+
+
+class LongStep(SleepyStep):
+    name = "long"
+    duration = 0.3
+
+
+class AsyncSleepyStep(SleepyStep):
+    async def handle_async(self, *, context):
+        self.calls.append(self.name)
+        await asyncio.sleep(self.duration)
+        return {"created": {self.name: self.duration}}
+
+
+class AsyncShortStep(AsyncSleepyStep, ShortStep):
+    pass
+
+
+class AsyncMediumStep(AsyncSleepyStep, MediumStep):
+    pass
+
+
+class AsyncLongStep(AsyncSleepyStep, LongStep):
+    pass
+
+
+class NotReadyStep(BaseWaitingStep):
+    name = "not-ready"
+
+    def is_ready(self, *, context, timeout=0):
+        return False
+
+    async def is_ready_async(self, *, context, timeout=0):
+        return False
+
+
+class GroupStep(ParallelStepGroup):
+    name = "group"
+    lanes = [[ShortStep, MediumStep], [LongStep]]
+
+
+class PendingGroupStep(ParallelStepGroup):
+    name = "pending-group"
+    lanes = [[ShortStep, NotReadyStep], [MediumStep]]
+
+
+class AsyncGroupStep(ParallelStepGroup):
+    name = "group"
+    lanes = [[AsyncShortStep, AsyncMediumStep], [AsyncLongStep]]
+
+
 class BasePipelineTestCase(TestCase):
     def setUp(self):
         super().setUp()
@@ -171,12 +273,266 @@ class BasePipelineTestCase(TestCase):
         pipeline = BasePipeline(**self.kwargs)
         ret = pipeline._handle("i-have-a-name")
         p_step_handle.assert_called_once_with(context=ctx)
-        self.assertEqual(ret, {"good": "stuff"})
+        self.assertEqual(ret["good"], "stuff")
         self.assertEqual(
             self.kwargs["patch"].metadata.labels,
             {"test-pipeline": "i-also-have-a-name"},
         )
 
+    @patch.object(BasePipeline, "label", "test-pipeline")
+    @patch.object(BasePipeline, "steps", [ThingWithName, OtherThingWithName])
+    @patch.object(BasePipeline, "history_limit", 2)
+    @patch.object(ThingWithName, "handle")
+    def test__handle_history(self, p_step_handle):
+        def handle(**_):
+            with time_request("read_namespaced_thing"):
+                pass
+            return {}
+
+        p_step_handle.side_effect = handle
+        exporter = ListExporter()
+        self.kwargs.update(
+            {
+                "body": {"metadata": {"uid": "uid-1", "name": "a", "namespace": "b"}},
+                "spec": {"version": "1.2"},
+                "retry": 2,
+                "started": datetime(2026, 1, 1, 12, 0, 0),
+            }
+        )
+        trace = {"traceId": "1" * 32, "spanId": "2" * 16}
+        ctx = {"trace": trace, "history": [{"step": "older"}, {"step": "old"}]}
+        self.kwargs["status"] = {"pipeline": ctx}
+        with patch.object(tracer, "exporter", exporter):
+            ret = BasePipeline(**self.kwargs)._handle("i-have-a-name")
+        self.assertEqual(ret["trace"], trace)
+        self.assertEqual(
+            [entry["step"] for entry in ret["history"]], ["old", "i-have-a-name"]
+        )
+        entry = ret["history"][-1]
+        self.assertEqual(entry["started"], "2026-01-01T12:00:00+00:00")
+        self.assertEqual(entry["attempts"], 3)
+        self.assertEqual(entry["apiCalls"], 1)
+        (span,) = exporter.spans
+        self.assertEqual(span["name"], "i-have-a-name")
+        self.assertEqual(span["traceId"], trace["traceId"])
+        self.assertEqual(span["parentSpanId"], trace["spanId"])
+        self.assertEqual(
+            span["attributes"],
+            {
+                "k8s.namespace.name": "b",
+                "django.name": "a",
+                "django.version": "1.2",
+                "attempts": 3,
+                "api_calls": 1,
+            },
+        )
+
+    @patch.object(BasePipeline, "steps", [ThingWithName, OtherThingWithName])
+    @patch.object(ThingWithName, "handle")
+    def test__handle_permanent_error_drops_calls(self, p_step_handle):
+        def handle(**_):
+            with time_request("read_namespaced_thing"):
+                pass
+            raise kopf.PermanentError("gave up")
+
+        p_step_handle.side_effect = handle
+        self.kwargs["body"] = {"metadata": {"uid": "uid-2"}}
+        with self.assertRaises(kopf.PermanentError):
+            BasePipeline(**self.kwargs)._handle("i-have-a-name")
+        self.assertNotIn(("uid-2", "i-have-a-name"), tracer._calls)
+
+    def test_finalize_pipeline(self):
+        exporter = ListExporter()
+        trace = {"traceId": "1" * 32, "spanId": "2" * 16}
+        history = [
+            {"step": "old", "traceId": "0" * 32, "started": "2026-01-01T10:00:00"},
+            {"step": "a", "traceId": "1" * 32, "started": "2026-01-01T12:00:00"},
+            {"step": "b", "traceId": "1" * 32, "started": "2026-01-01T12:01:00"},
+        ]
+        ctx = {"trace": trace, "history": history, "created": {}}
+        with patch.object(tracer, "exporter", exporter):
+            BasePipeline(**self.kwargs).finalize_pipeline(context=ctx)
+        # everything but the history is cleared
+        self.assertEqual(
+            self.kwargs["patch"].status["pipeline"], {"trace": None, "created": None}
+        )
+        (span,) = exporter.spans
+        self.assertEqual(span["spanId"], trace["spanId"])
+        self.assertIsNone(span["parentSpanId"])
+        self.assertEqual(span["attributes"]["steps"], 2)
+
+    @patch.object(BasePipeline, "steps", [ThingWithName, GroupStep])
+    def test_group_step_names(self):
+        self.assertTrue(BasePipeline.is_step_name("group"))
+        # member names are recognized, and resume the whole group
+        self.assertTrue(BasePipeline.is_step_name("long"))
+        pipeline = BasePipeline(**self.kwargs)
+        deets = pipeline.resolve_step("medium")
+        self.assertEqual(deets.klass, GroupStep)
+        self.assertEqual(deets.next_step_name, "done")
+
+    @patch.object(BasePipeline, "label", "test-pipeline")
+    @patch.object(BasePipeline, "steps", [PendingGroupStep])
+    def test__handle_pending(self):
+        self.kwargs.update({"retry": 0, "spec": {"pipelineStep": {"watch": 0}}})
+        pipeline = BasePipeline(**self.kwargs)
+        with self.assertRaises(kopf.TemporaryError):
+            pipeline._handle("pending-group")
+        self.assertEqual(self.kwargs["patch"].metadata.labels, {})
+        self.assertEqual(
+            self.kwargs["patch"].status["pipeline"]["pending-group_progress"],
+            {"0": 1, "1": 1},
+        )
+
+    @patch.object(BasePipeline, "label", "test-pipeline")
+    @patch.object(BasePipeline, "steps", [ShortStep, MediumStep])
+    @patch.object(BasePipeline, "chain_steps", True)
+    def test__handle_chained(self):
+        SleepyStep.calls = []
+        self.kwargs["status"] = {"pipeline": {"created": {"old": 0}}}
+        ret = BasePipeline(**self.kwargs)._handle("short")
+        self.assertIsNone(ret)
+        self.assertEqual(SleepyStep.calls, ["short", "medium"])
+        self.assertEqual(self.kwargs["patch"].metadata.labels["test-pipeline"], "done")
+        # finalized in the same call, keeping the history of both steps
+        context = self.kwargs["patch"].status["pipeline"]
+        self.assertEqual(context["created"], None)
+        self.assertEqual(
+            [entry["step"] for entry in context["history"]], ["short", "medium"]
+        )
+
+    @patch.object(BasePipeline, "label", "test-pipeline")
+    @patch.object(BasePipeline, "steps", [SleepyStep, PendingGroupStep])
+    @patch.object(BasePipeline, "chain_steps", True)
+    def test__handle_chained_pending(self):
+        self.kwargs.update({"retry": 0, "spec": {"pipelineStep": {"watch": 0}}})
+        with self.assertRaises(kopf.TemporaryError):
+            BasePipeline(**self.kwargs)._handle("sleepy")
+        self.assertEqual(
+            self.kwargs["patch"].metadata.labels["test-pipeline"], "pending-group"
+        )
+        # the finished step is kept along with the progress of the pending one
+        context = self.kwargs["patch"].status["pipeline"]
+        self.assertEqual(context["created"], {"sleepy": 0, "short": 0.1, "medium": 0.2})
+        self.assertEqual(context["pending-group_progress"], {"0": 1, "1": 1})
+        self.assertEqual([entry["step"] for entry in context["history"]], ["sleepy"])
+
+    @patch.object(BasePipeline, "label", "test-pipeline")
+    @patch.object(BasePipeline, "steps", [SleepyStep, PendingGroupStep])
+    @patch.object(BasePipeline, "chain_steps", True)
+    def test__handle_chained_retried(self):
+        # waiting steps only go on from the first call of the handler
+        SleepyStep.calls = []
+        self.kwargs.update({"retry": 1, "spec": {"pipelineStep": {"watch": 0}}})
+        ret = BasePipeline(**self.kwargs)._handle("sleepy")
+        self.assertEqual(SleepyStep.calls, ["sleepy"])
+        self.assertEqual(ret["created"], {"sleepy": 0})
+        self.assertEqual(
+            self.kwargs["patch"].metadata.labels["test-pipeline"], "pending-group"
+        )
+
+
+class ParallelStepGroupTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        SleepyStep.calls = []
+        self.kwargs = {
+            "logger": MockLogger(),
+            "patch": MockPatch(),
+            "status": {},
+            "spec": {"pipelineStep": {"watch": 0}},
+            "retry": 0,
+        }
+
+    def test_fan_out_fan_in(self):
+        start = time.perf_counter()
+        ret = GroupStep(**self.kwargs).handle(context={})
+        elapsed = time.perf_counter() - start
+        self.assertEqual(
+            ret,
+            {
+                "created": {"short": 0.1, "medium": 0.2, "long": 0.3},
+                "group_progress": None,
+            },
+        )
+        # the lanes overlap, so this takes about as long as the slowest lane
+        #  (0.3s) rather than the sum of the steps (0.6s)
+        self.assertLess(elapsed, 0.45)
+
+    def test_pending(self):
+        with self.assertRaises(StepPending) as e:
+            PendingGroupStep(**self.kwargs).handle(context={})
+        self.assertEqual(e.exception.delay, 6)
+        self.assertEqual(
+            e.exception.context,
+            {
+                "created": {"short": 0.1, "medium": 0.2},
+                "pending-group_progress": {"0": 1, "1": 1},
+            },
+        )
+        # come back around; finished steps are not run again
+        SleepyStep.calls = []
+        with self.assertRaises(StepPending):
+            PendingGroupStep(**self.kwargs).handle(context=e.exception.context)
+        self.assertEqual(SleepyStep.calls, [])
+
+    def test_lane_failure(self):
+        self.kwargs["retry"] = 100
+        with self.assertRaises(kopf.PermanentError):
+            PendingGroupStep(**self.kwargs).handle(context={})
+        self.assertIn("medium", SleepyStep.calls)
+
+
+class AsyncParallelStepGroupTestCase(IsolatedAsyncioTestCase):
+    def setUp(self):
+        super().setUp()
+        SleepyStep.calls = []
+        self.kwargs = {
+            "logger": MockLogger(),
+            "patch": MockPatch(),
+            "status": {},
+            "spec": {"pipelineStep": {"watch": 0}},
+            "retry": 0,
+        }
+
+    async def test_fan_out_fan_in(self):
+        start = time.perf_counter()
+        ret = await AsyncGroupStep(**self.kwargs).handle_async(context={})
+        elapsed = time.perf_counter() - start
+        self.assertEqual(
+            ret,
+            {
+                "created": {"short": 0.1, "medium": 0.2, "long": 0.3},
+                "group_progress": None,
+            },
+        )
+        self.assertLess(elapsed, 0.45)
+
+    async def test_sync_steps(self):
+        # steps without an async flavour still run
+        ret = await GroupStep(**self.kwargs).handle_async(context={})
+        self.assertEqual(ret["created"], {"short": 0.1, "medium": 0.2, "long": 0.3})
+
+    async def test_pending(self):
+        with self.assertRaises(StepPending) as e:
+            await PendingGroupStep(**self.kwargs).handle_async(context={})
+        self.assertEqual(
+            e.exception.context["pending-group_progress"], {"0": 1, "1": 1}
+        )
+
+    @patch.object(BasePipeline, "label", "test-pipeline")
+    @patch.object(BasePipeline, "steps", [PendingGroupStep])
+    async def test_pipeline_pending(self):
+        self.kwargs.update({"labels": {}, "diff": (), "body": {}})
+        pipeline = BasePipeline(**self.kwargs)
+        with self.assertRaises(kopf.TemporaryError):
+            await pipeline._handle_async("pending-group")
+        self.assertEqual(self.kwargs["patch"].metadata.labels, {})
+        self.assertEqual(
+            self.kwargs["patch"].status["pipeline"]["pending-group_progress"],
+            {"0": 1, "1": 1},
+        )
+
 
 class BaseWaitingStepTestCase(TestCase):
     def setUp(self):
@@ -198,7 +554,7 @@ class BaseWaitingStepTestCase(TestCase):
         step = BaseWaitingStep(**self.kwargs)
         with self.assertRaises(kopf.TemporaryError):
             step.handle(context={"stuff": "happened"})
-        p_is_ready.assert_called_once_with(context={"stuff": "happened"})
+        p_is_ready.assert_called_once_with(context={"stuff": "happened"}, timeout=3)
         p_check_timeout.assert_called_once_with()
 
     @patch.object(BaseWaitingStep, "is_ready")
@@ -207,7 +563,23 @@ class BaseWaitingStepTestCase(TestCase):
         p_is_ready.return_value = True
         step = BaseWaitingStep(**self.kwargs)
         self.assertEqual(step.handle(context={"stuff": "happened"}), {})
-        p_is_ready.assert_called_once_with(context={"stuff": "happened"})
+        p_is_ready.assert_called_once_with(context={"stuff": "happened"}, timeout=3)
+
+    @patch.object(BaseWaitingStep, "is_ready")
+    @patch.object(BaseWaitingStep, "_check_timeout")
+    def test_handle_watch_specified(self, p_check_timeout, p_is_ready):
+        p_is_ready.return_value = True
+        self.kwargs["spec"] = {"pipelineStep": {"watch": 5}}
+        step = BaseWaitingStep(**self.kwargs)
+        step.handle(context={})
+        p_is_ready.assert_called_once_with(context={}, timeout=5)
+
+    @patch.object(BaseWaitingStep, "is_ready_async")
+    def test_handle_async_waits_longer(self, p_is_ready_async):
+        p_is_ready_async.return_value = True
+        step = BaseWaitingStep(**self.kwargs)
+        self.assertEqual(asyncio.run(step.handle_async(context={})), {})
+        p_is_ready_async.assert_called_once_with(context={}, timeout=30)
 
     @patch.object(BaseWaitingStep, "iterations_default", 10)
     def test_check_timeout_fine(self):
@@ -231,3 +603,454 @@ class BaseWaitingStepTestCase(TestCase):
         step = BaseWaitingStep(**self.kwargs)
         with self.assertRaises(kopf.PermanentError):
             step._check_timeout()
+
+    def test_check_timeout_deadline(self):
+        self.kwargs["retry"] = 50
+        self.kwargs["runtime"] = timedelta(seconds=110)
+        self.kwargs["spec"] = {"pipelineStep": {"timeout": 120}}
+        step = BaseWaitingStep(**self.kwargs)
+        # the retry count no longer matters
+        step._check_timeout()
+        self.kwargs["runtime"] = timedelta(seconds=120)
+        step = BaseWaitingStep(**self.kwargs)
+        with self.assertRaises(kopf.PermanentError):
+            step._check_timeout()
+
+    def test_check_timeout_deadline_default(self):
+        self.kwargs["runtime"] = timedelta(seconds=60)
+        self.kwargs["spec"] = {"pipelineStep": {"iterations": 10, "period": 5}}
+        step = BaseWaitingStep(**self.kwargs)
+        with self.assertRaises(kopf.PermanentError):
+            step._check_timeout()
+
+    def test_backoff(self):
+        self.kwargs["spec"] = {"pipelineStep": {"period": 5, "maxPeriod": 30}}
+        step = BaseWaitingStep(**self.kwargs)
+        self.assertEqual([step._backoff(n) for n in range(4)], [5, 5, 5, 5])
+        self.kwargs["spec"]["pipelineStep"]["backoff"] = "exponential"
+        step = BaseWaitingStep(**self.kwargs)
+        self.assertEqual([step._backoff(n) for n in range(4)], [5, 10, 20, 30])
+        self.kwargs["spec"]["pipelineStep"]["backoff"] = "jitter"
+        step = BaseWaitingStep(**self.kwargs)
+        delays = [step._backoff(0) for _ in range(50)]
+        self.assertTrue(all(5 <= delay <= 15 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+        self.assertTrue(all(5 <= step._backoff(3) <= 30 for _ in range(50)))
+
+    @patch.object(BaseWaitingStep, "is_ready")
+    def test_delay_stops_at_deadline(self, p_is_ready):
+        p_is_ready.return_value = False
+        self.kwargs["runtime"] = timedelta(seconds=100)
+        self.kwargs["spec"] = {"pipelineStep": {"timeout": 103, "period": 6}}
+        step = BaseWaitingStep(**self.kwargs)
+        with self.assertRaises(kopf.TemporaryError) as e:
+            step.handle(context={})
+        self.assertEqual(e.exception.delay, 3)
+
+
+class MigrationPipelineTestCase(TestCase):
+    @patch("django_operator.pipelines.migration.kopf.warn")
+    @patch.object(DjangoService, "patch")
+    def test_restart(self, p_patch, p_warn):
+        owner = {
+            "metadata": {"name": "django", "namespace": "test"},
+            "spec": {"version": "1.2"},
+        }
+        MigrationPipeline.restart(owner=owner, logger=MockLogger())
+        p_warn.assert_called_once()
+        p_patch.assert_called_once_with(
+            namespace="test",
+            name="django",
+            body={
+                "metadata": {"labels": {"migration-step": "start-prepull"}},
+                "status": {
+                    "pipelineSpec": {"version": "1.2"},
+                    "condition": "migrating",
+                    "rollout": None,
+                    "manageCommands": None,
+                },
+            },
+        )
+
+
+class MigrationPipelineOwnedTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.pipeline = MigrationPipeline(
+            logger=MockLogger(),
+            patch=MockPatch(),
+            labels={},
+            diff=(),
+            body={"metadata": {"uid": "abc"}},
+            namespace="test",
+            spec={
+                "host": "test.somewhere.com",
+                "clusterIssuer": "letsencrypt",
+                "version": "6.9.420",
+                "image": "testimage",
+            },
+            status={
+                "created": {
+                    "deployment": {"app": "app-1", "redis": "redis"},
+                    "service": {"app": "app"},
+                }
+            },
+        )
+        self.listed = {
+            "deployment": {
+                "app-1": V1Deployment(metadata=V1ObjectMeta(name="app-1")),
+                "app-0": V1Deployment(metadata=V1ObjectMeta(name="app-0")),
+            },
+            "service": {"app": V1Service(metadata=V1ObjectMeta(name="app"))},
+        }
+
+    def _patch_django(self, method, **kwargs):
+        patcher = patch.object(DjangoKind, method, **kwargs)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def test_monitor(self):
+        self._patch_django("list_owned", side_effect=lambda kind: self.listed[kind])
+        p_read = self._patch_django("read_resource")
+        p_delete = self._patch_django("delete_resource")
+        self.pipeline.monitor()
+        # only what the listing didn't turn up is read
+        p_read.assert_called_once_with(kind="deployment", purpose="redis", name="redis")
+        p_delete.assert_called_once_with(kind="deployment", name="app-0")
+
+    @patch.object(MigrationPipeline, "initiate_pipeline")
+    @patch("django_operator.pipelines.migration.kopf.warn")
+    def test_monitor_missing(self, p_warn, p_initiate):
+        self._patch_django("list_owned", return_value={})
+        self._patch_django("read_resource", side_effect=ApiException(status=404))
+        with self.assertRaises(MonitorException):
+            self.pipeline.monitor()
+        p_initiate.assert_called_once()
+
+    def test_unprotect_all(self):
+        self._patch_django(
+            "list_owned", side_effect=lambda kind: self.listed.get(kind, {})
+        )
+        p_unprotect = self._patch_django("unprotect_resource")
+        self.pipeline.unprotect_all()
+        listed = self.listed["deployment"]
+        p_unprotect.assert_has_calls(
+            [
+                call(kind="deployment", name="app-1", obj=listed["app-1"]),
+                call(kind="deployment", name="app-0", obj=listed["app-0"]),
+                call(kind="deployment", name="redis"),
+                call(kind="service", name="app", obj=self.listed["service"]["app"]),
+            ],
+            any_order=True,
+        )
+        self.assertEqual(p_unprotect.call_count, 4)
+
+    def test_unprotect_all_without_created(self):
+        self.pipeline.status = {}
+        self._patch_django(
+            "list_owned", side_effect=lambda kind: self.listed.get(kind, {})
+        )
+        p_unprotect = self._patch_django("unprotect_resource")
+        self.pipeline.unprotect_all()
+        self.assertEqual(
+            sorted(c.kwargs["name"] for c in p_unprotect.call_args_list),
+            ["app", "app-0", "app-1"],
+        )
+
+
+class AwaitGreenDeploymentStepTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.kwargs = {
+            "logger": MockLogger(),
+            "patch": MockPatch(),
+            "status": {},
+            "spec": {"pipelineStep": {"period": 6}},
+            "retry": 0,
+        }
+        self.progress = {
+            "observedGeneration": 1,
+            "desired": 3,
+            "updated": 1,
+            "ready": 0,
+            "available": 0,
+            "complete": False,
+        }
+
+    def _check(self, progress):
+        step = AwaitGreenAppStep(**self.kwargs)
+        ready = step._track_rollout(progress)
+        # what was written is what the next check will see
+        self.kwargs["status"] = {
+            "rollout": dict(self.kwargs["patch"].status["rollout"])
+        }
+        self.kwargs["patch"] = MockPatch()
+        return ready, step.retry_delay()
+
+    def test_delay_backs_off_when_stalled(self):
+        self.assertEqual(self._check(self.progress), (False, 2))
+        self.assertEqual(self._check(self.progress), (False, 6))
+        self.assertEqual(self._check(self.progress), (False, 12))
+        self.assertEqual(
+            self.kwargs["status"]["rollout"]["app"],
+            {
+                "observedGeneration": 1,
+                "desired": 3,
+                "updated": 1,
+                "ready": 0,
+                "available": 0,
+                "stalled": 2,
+            },
+        )
+        # progress resets the back-off
+        self.progress["ready"] = 1
+        self.assertEqual(self._check(self.progress), (False, 2))
+        for _ in range(10):
+            _, delay = self._check(self.progress)
+        self.assertEqual(delay, 60)
+
+    def test_complete(self):
+        self.progress.update({"updated": 3, "ready": 3, "available": 3})
+        self.progress["complete"] = True
+        self.assertTrue(self._check(self.progress)[0])
+
+
+class AwaitImagePrePullStepTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.kwargs = {
+            "logger": MockLogger(),
+            "patch": MockPatch(),
+            "status": {},
+            "body": {},
+            "namespace": "test",
+            "spec": {
+                "host": "test.somewhere.com",
+                "clusterIssuer": "letsencrypt",
+                "version": "6.9.420",
+                "image": "testimage",
+                "imagePrePull": {"period": 6, "iterations": 2, "watch": 0},
+            },
+            "retry": 0,
+        }
+        self.context = {"prepull_name": "prepull"}
+
+    @patch.object(DjangoKind, "clean_prepull")
+    @patch.object(DjangoKind, "prepull_ready")
+    def test_disabled(self, p_ready, p_clean):
+        self.assertEqual(AwaitImagePrePullStep(**self.kwargs).handle(context={}), {})
+        p_ready.assert_not_called()
+        p_clean.assert_not_called()
+
+    @patch.object(DjangoKind, "clean_prepull")
+    @patch.object(DjangoKind, "prepull_ready")
+    def test_ready(self, p_ready, p_clean):
+        p_ready.return_value = True
+        AwaitImagePrePullStep(**self.kwargs).handle(context=self.context)
+        p_ready.assert_called_once_with("prepull", timeout=0)
+        p_clean.assert_called_once_with(name="prepull")
+
+    @patch.object(DjangoKind, "clean_prepull")
+    @patch.object(DjangoKind, "prepull_ready")
+    def test_not_ready(self, p_ready, p_clean):
+        p_ready.return_value = False
+        with self.assertRaises(kopf.TemporaryError) as e:
+            AwaitImagePrePullStep(**self.kwargs).handle(context=self.context)
+        self.assertEqual(e.exception.delay, 6)
+        p_clean.assert_not_called()
+
+    @patch.object(DjangoKind, "clean_prepull")
+    @patch.object(DjangoKind, "prepull_ready")
+    def test_overdue(self, p_ready, p_clean):
+        # taking too long holds up the migration no further
+        p_ready.side_effect = ApiException(status=500)
+        self.kwargs["retry"] = 2
+        self.assertEqual(
+            AwaitImagePrePullStep(**self.kwargs).handle(context=self.context), {}
+        )
+        self.assertNotIn("condition", self.kwargs["patch"].status)
+        p_clean.assert_called_once_with(name="prepull")
+
+
+class MigrationFingerprintTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.kwargs = {
+            "logger": MockLogger(),
+            "patch": MockPatch(),
+            "status": {"migrationVersion": "6.9.419", "migrationFingerprint": "abc"},
+            "body": {},
+            "namespace": "test",
+            "name": "django",
+            "spec": {
+                "host": "test.somewhere.com",
+                "clusterIssuer": "letsencrypt",
+                "version": "6.9.420",
+                "image": "testimage",
+                "migrationFingerprint": "abc",
+            },
+            "retry": 0,
+        }
+
+    def _needs_commands(self):
+        return StartManagementCommandsStep(**self.kwargs)._needs_commands()
+
+    def test_unchanged(self):
+        self.assertFalse(self._needs_commands())
+        self.assertEqual(self.kwargs["patch"].status["migrationVersion"], "6.9.420")
+
+    def test_changed(self):
+        self.kwargs["spec"]["migrationFingerprint"] = "def"
+        self.assertTrue(self._needs_commands())
+        # even for the version last migrated to
+        self.kwargs["status"]["migrationVersion"] = "6.9.420"
+        self.assertTrue(self._needs_commands())
+
+    def test_forced(self):
+        self.kwargs["spec"]["alwaysRunMigrations"] = True
+        self.assertTrue(self._needs_commands())
+
+    def test_unset(self):
+        # down to the version then
+        del self.kwargs["spec"]["migrationFingerprint"]
+        self.assertTrue(self._needs_commands())
+        self.kwargs["status"]["migrationVersion"] = "6.9.420"
+        self.assertFalse(self._needs_commands())
+
+    @patch.object(DjangoKind, "clean_manage_commands")
+    @patch.object(DjangoKind, "pod_phase")
+    def test_recorded(self, p_pod_phase, p_clean):
+        p_pod_phase.return_value = "succeeded"
+        self.kwargs["spec"]["migrationFingerprint"] = "def"
+        step = AwaitManagementCommandsStep(**self.kwargs)
+        self.assertTrue(step.is_ready(context={"mgmt_pod_name": "migrations"}))
+        self.assertEqual(self.kwargs["patch"].status["migrationFingerprint"], "def")
+        self.assertEqual(self.kwargs["patch"].status["migrationVersion"], "6.9.420")
+
+
+MANAGE_COMMAND_PODS = [
+    {"command": "migrate", "pod": "manage-migrate"},
+    {"command": "static", "pod": "manage-static"},
+]
+
+
+def manage_command_kwargs(**kwargs):
+    return dict(
+        {
+            "logger": MockLogger(),
+            "patch": MockPatch(),
+            "status": {},
+            "body": {},
+            "namespace": "test",
+            "name": "django",
+            "spec": {
+                "host": "test.somewhere.com",
+                "clusterIssuer": "letsencrypt",
+                "version": "6.9.420",
+                "image": "testimage",
+                "manageCommands": [
+                    {"name": "migrate", "command": ["migrate"]},
+                    {"name": "static", "command": ["collectstatic"]},
+                    {"name": "seed", "command": ["loaddata"], "after": ["migrate"]},
+                ],
+                "initManageTimeouts": {"watch": 0},
+            },
+            "retry": 0,
+        },
+        **kwargs,
+    )
+
+
+@patch.object(DjangoKind, "delete_resources")
+@patch.object(DjangoKind, "pod_phases")
+@patch.object(DjangoKind, "start_manage_command")
+class ManageCommandGraphStepTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.kwargs = manage_command_kwargs()
+        self.pods = MANAGE_COMMAND_PODS
+
+    def _reported(self):
+        return self.kwargs["patch"].status["manageCommands"]
+
+    @patch.object(StartManagementCommandsStep, "take_slot")
+    @patch.object(DjangoKind, "ensure_redis")
+    def test_start(self, p_redis, p_take_slot, p_start, p_phases, p_delete):
+        p_start.side_effect = lambda command: f"manage-{command['name']}"
+        ret = StartManagementCommandsStep(**self.kwargs).handle(context={})
+        # the independent commands start together
+        self.assertEqual(ret["mgmt_pods"], self.pods)
+        self.assertIsNone(ret["mgmt_pod_name"])
+        self.assertEqual(
+            self._reported(),
+            {"migrate": "pending", "static": "pending", "seed": "waiting"},
+        )
+
+    def test_dependents_started(self, p_start, p_phases, p_delete):
+        p_start.return_value = "manage-seed"
+        p_phases.return_value = {
+            "manage-migrate": "succeeded",
+            "manage-static": "running",
+        }
+        with self.assertRaises(StepPending) as e:
+            AwaitManagementCommandsStep(**self.kwargs).handle(
+                context={"mgmt_pods": self.pods}
+            )
+        self.assertEqual(
+            e.exception.context["mgmt_pods"],
+            self.pods + [{"command": "seed", "pod": "manage-seed"}],
+        )
+        self.assertEqual(
+            self._reported(),
+            {"migrate": "succeeded", "static": "running", "seed": "pending"},
+        )
+
+    def test_waiting(self, p_start, p_phases, p_delete):
+        p_phases.return_value = {
+            "manage-migrate": "running",
+            "manage-static": "running",
+        }
+        with self.assertRaises(kopf.TemporaryError):
+            AwaitManagementCommandsStep(**self.kwargs).handle(
+                context={"mgmt_pods": self.pods}
+            )
+        p_start.assert_not_called()
+
+    def test_done(self, p_start, p_phases, p_delete):
+        pods = self.pods + [{"command": "seed", "pod": "manage-seed"}]
+        p_phases.return_value = {entry["pod"]: "succeeded" for entry in pods}
+        step = AwaitManagementCommandsStep(**self.kwargs)
+        self.assertEqual(step.handle(context={"mgmt_pods": pods}), {})
+        p_delete.assert_called_once_with(
+            [{"kind": "pod", "name": entry["pod"]} for entry in pods]
+        )
+        self.assertEqual(self.kwargs["patch"].status["migrationVersion"], "6.9.420")
+
+    def test_failed(self, p_start, p_phases, p_delete):
+        p_phases.return_value = {"manage-migrate": "failed", "manage-static": "running"}
+        with self.assertRaises(kopf.PermanentError) as e:
+            AwaitManagementCommandsStep(**self.kwargs).handle(
+                context={"mgmt_pods": self.pods}
+            )
+        self.assertIn("migrate", str(e.exception))
+        self.assertEqual(self.kwargs["patch"].status["condition"], "degraded")
+        self.assertEqual(self._reported()["migrate"], "failed")
+        p_start.assert_not_called()
+
+
+class AsyncManageCommandGraphStepTestCase(IsolatedAsyncioTestCase):
+    @patch.object(AsyncDjangoKind, "pod_phases")
+    @patch.object(AsyncDjangoKind, "start_manage_command")
+    async def test_dependents_started(self, p_start, p_phases):
+        p_start.return_value = "manage-seed"
+        p_phases.return_value = {
+            "manage-migrate": "succeeded",
+            "manage-static": "running",
+        }
+        step = AwaitManagementCommandsStep(**manage_command_kwargs(use_async=True))
+        with self.assertRaises(StepPending) as e:
+            await step.handle_async(context={"mgmt_pods": MANAGE_COMMAND_PODS})
+        self.assertEqual(
+            e.exception.context["mgmt_pods"],
+            MANAGE_COMMAND_PODS + [{"command": "seed", "pod": "manage-seed"}],
+        )
@@ -0,0 +1,278 @@
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch
+
+import kopf
+from kubernetes.client.exceptions import ApiException
+
+from django_operator.pipelines.migration import (
+    AwaitManagementCommandsStep,
+    MigrationPipeline,
+    StartManagementCommandsStep,
+)
+from django_operator.scheduling import (
+    BULK,
+    CRITICAL,
+    NORMAL,
+    RateLimiter,
+    SlotScheduler,
+    manage_commands_scheduler,
+    request_priority,
+)
+from django_operator.tests.base import MockLogger, MockPatch
+
+
+class SlotSchedulerTestCase(TestCase):
+    def test_global_limit(self):
+        scheduler = SlotScheduler(limit=2)
+        self.assertEqual(scheduler.acquire(namespace="a", name="x"), 0)
+        self.assertEqual(scheduler.acquire(namespace="b", name="x"), 0)
+        self.assertEqual(scheduler.acquire(namespace="c", name="x"), 1)
+        self.assertEqual(scheduler.acquire(namespace="d", name="x"), 2)
+        # asking again doesn't lose your place
+        self.assertEqual(scheduler.acquire(namespace="d", name="x"), 2)
+        scheduler.release(namespace="a", name="x")
+        # first in line gets the slot, whether or not it's the one asking
+        self.assertEqual(scheduler.acquire(namespace="d", name="x"), 1)
+        self.assertTrue(scheduler.holds(namespace="c", name="x"))
+
+    def test_namespace_limit(self):
+        scheduler = SlotScheduler(limit=3, namespace_limit=1)
+        self.assertEqual(scheduler.acquire(namespace="a", name="x"), 0)
+        self.assertEqual(scheduler.acquire(namespace="a", name="y"), 1)
+        # the full namespace doesn't hold up others behind it
+        self.assertEqual(scheduler.acquire(namespace="b", name="x"), 0)
+        scheduler.release(namespace="a", name="x")
+        self.assertTrue(scheduler.holds(namespace="a", name="y"))
+
+    def test_unlimited(self):
+        scheduler = SlotScheduler()
+        for name in range(100):
+            self.assertEqual(scheduler.acquire(namespace="a", name=name), 0)
+
+    def test_release_queued(self):
+        scheduler = SlotScheduler(limit=1)
+        scheduler.acquire(namespace="a", name="x")
+        scheduler.acquire(namespace="b", name="x")
+        self.assertEqual(scheduler.acquire(namespace="c", name="x"), 2)
+        scheduler.release(namespace="b", name="x")
+        self.assertEqual(scheduler.acquire(namespace="c", name="x"), 1)
+
+    def test_held_elsewhere(self):
+        scheduler = SlotScheduler(limit=2, namespace_limit=1)
+        scheduler.hold_elsewhere(namespace="a", name="x")
+        self.assertEqual(scheduler.acquire(namespace="a", name="y"), 1)
+        self.assertEqual(scheduler.acquire(namespace="b", name="x"), 0)
+        self.assertEqual(scheduler.acquire(namespace="c", name="x"), 2)
+        scheduler.release(namespace="a", name="x")
+        self.assertTrue(scheduler.holds(namespace="a", name="y"))
+        # an object this replica loses to another
+        scheduler.hold_elsewhere(namespace="a", name="y")
+        self.assertFalse(scheduler.holds(namespace="a", name="y"))
+        self.assertEqual(scheduler.acquire(namespace="c", name="x"), 1)
+
+    def test_restore_ignores_limits(self):
+        scheduler = SlotScheduler(limit=1)
+        scheduler.restore(namespace="a", name="x")
+        scheduler.restore(namespace="b", name="x")
+        self.assertEqual(scheduler.acquire(namespace="c", name="x"), 1)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimiterTestCase(TestCase):
+    def test_burst_then_rate(self):
+        clock = FakeClock()
+        limiter = RateLimiter(qps=10, burst=2, clock=clock)
+        self.assertEqual(limiter._reserve(NORMAL), 0)
+        self.assertEqual(limiter._reserve(NORMAL), 0)
+        self.assertAlmostEqual(limiter._reserve(NORMAL), 0.1)
+        clock.now += 0.05
+        self.assertAlmostEqual(limiter._reserve(NORMAL), 0.05)
+        clock.now += 0.05
+        self.assertEqual(limiter._reserve(NORMAL), 0)
+
+    def test_unlimited(self):
+        limiter = RateLimiter(clock=FakeClock())
+        for _ in range(1000):
+            self.assertEqual(limiter._reserve(BULK), 0)
+
+    def test_priority(self):
+        clock = FakeClock()
+        limiter = RateLimiter(qps=10, burst=1, clock=clock)
+        self.assertEqual(limiter._reserve(BULK), 0)
+        # a readiness check is waiting for the next token
+        limiter._wait(CRITICAL, 1)
+        clock.now += 0.1
+        self.assertGreater(limiter._reserve(BULK), 0)
+        self.assertGreater(limiter._reserve(NORMAL), 0)
+        self.assertEqual(limiter._reserve(CRITICAL), 0)
+        limiter._wait(CRITICAL, -1)
+        clock.now += 0.1
+        self.assertEqual(limiter._reserve(BULK), 0)
+
+    def test_request_priority(self):
+        limiter = RateLimiter()
+        with patch.object(limiter, "_reserve", return_value=0) as p_reserve:
+            limiter.acquire()
+            with request_priority(BULK):
+                limiter.acquire()
+        self.assertEqual(
+            [c.args for c in p_reserve.call_args_list], [(NORMAL,), (BULK,)]
+        )
+
+    def test_retry_throttled(self):
+        clock = FakeClock()
+        limiter = RateLimiter(retries=2, clock=clock)
+        throttled = ApiException(status=429)
+        throttled.headers = {"Retry-After": "3"}
+        self.assertTrue(limiter.retry_throttled(throttled, attempt=0))
+        # everyone holds off
+        self.assertEqual(limiter._reserve(CRITICAL), 3)
+        clock.now += 3
+        self.assertEqual(limiter._reserve(NORMAL), 0)
+        # without a Retry-After the hold backs off
+        throttled.headers = {}
+        self.assertTrue(limiter.retry_throttled(throttled, attempt=1))
+        self.assertEqual(limiter._reserve(NORMAL), 2)
+        self.assertFalse(limiter.retry_throttled(throttled, attempt=2))
+        self.assertFalse(limiter.retry_throttled(ApiException(status=500), attempt=0))
+
+
+class ManagementSlotStepTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        manage_commands_scheduler.clear()
+        self.addCleanup(manage_commands_scheduler.clear)
+        self.kwargs = {
+            "logger": MockLogger(),
+            "patch": MockPatch(),
+            "status": {},
+            "spec": {"initManageCommands": [["migrate"]]},
+            "retry": 0,
+            "namespace": "test",
+            "name": "django",
+        }
+
+    @patch.object(manage_commands_scheduler, "limit", 1)
+    def test_queued(self):
+        manage_commands_scheduler.acquire(namespace="other", name="django")
+        with self.assertRaises(kopf.TemporaryError):
+            StartManagementCommandsStep(**self.kwargs).take_slot()
+        self.assertEqual(self.kwargs["patch"].status["mgmtQueuePosition"], 1)
+
+        manage_commands_scheduler.release(namespace="other", name="django")
+        StartManagementCommandsStep(**self.kwargs).take_slot()
+        self.assertIsNone(self.kwargs["patch"].status["mgmtQueuePosition"])
+
+    def test_released_when_done(self):
+        manage_commands_scheduler.acquire(namespace="test", name="django")
+        step = AwaitManagementCommandsStep(**self.kwargs)
+        self.assertFalse(step._succeeded("running"))
+        self.assertTrue(
+            manage_commands_scheduler.holds(namespace="test", name="django")
+        )
+        self.assertTrue(step._succeeded("succeeded"))
+        self.assertFalse(
+            manage_commands_scheduler.holds(namespace="test", name="django")
+        )
+
+    @patch.object(AwaitManagementCommandsStep, "is_ready", return_value=False)
+    @patch.object(manage_commands_scheduler, "namespace_limit", 1)
+    def test_released_on_timeout(self, p_ready):
+        manage_commands_scheduler.acquire(namespace="test", name="django")
+        self.assertEqual(
+            manage_commands_scheduler.acquire(namespace="test", name="other"), 1
+        )
+        step = AwaitManagementCommandsStep(**dict(self.kwargs, retry=1))
+        with self.assertRaises(kopf.TemporaryError):
+            step.handle(context={})
+        self.assertTrue(
+            manage_commands_scheduler.holds(namespace="test", name="django")
+        )
+        step = AwaitManagementCommandsStep(**dict(self.kwargs, retry=20))
+        with self.assertRaises(kopf.PermanentError):
+            step.handle(context={})
+        self.assertFalse(
+            manage_commands_scheduler.holds(namespace="test", name="django")
+        )
+        # the next one in line gets to go
+        self.assertTrue(manage_commands_scheduler.holds(namespace="test", name="other"))
+
+    def test_observe_slot(self):
+        slot = {"namespace": "test", "name": "django"}
+        MigrationPipeline.observe_slot(
+            event_type=None, labels={"migration-step": "await-mgmt"}, **slot
+        )
+        self.assertTrue(manage_commands_scheduler.holds(**slot))
+        MigrationPipeline.observe_slot(
+            event_type="MODIFIED", labels={"migration-step": "green"}, **slot
+        )
+        self.assertFalse(manage_commands_scheduler.holds(**slot))
+        MigrationPipeline.observe_slot(
+            event_type=None,
+            labels={"migration-step": "await-mgmt"},
+            condition="degraded",
+            **slot,
+        )
+        self.assertFalse(manage_commands_scheduler.holds(**slot))
+
+    def test_observe_slot_other_shard(self):
+        slot = {"namespace": "test", "name": "django"}
+        other = {"namespace": "test", "name": "other"}
+        labels = {"migration-step": "await-mgmt"}
+        MigrationPipeline.observe_slot(
+            event_type="MODIFIED", labels=labels, owned=False, **slot
+        )
+        self.assertFalse(manage_commands_scheduler.holds(**slot))
+        # the namespace limit holds across replicas
+        with patch.object(manage_commands_scheduler, "namespace_limit", 1):
+            self.assertEqual(manage_commands_scheduler.acquire(**other), 1)
+            MigrationPipeline.observe_slot(
+                event_type="MODIFIED",
+                labels={"migration-step": "green"},
+                owned=False,
+                **slot,
+            )
+            self.assertTrue(manage_commands_scheduler.holds(**other))
+
+    def test_observe_slot_taken_over(self):
+        slot = {"namespace": "test", "name": "django"}
+        labels = {"migration-step": "await-mgmt"}
+        MigrationPipeline.observe_slot(
+            event_type="MODIFIED", labels=labels, owned=False, **slot
+        )
+        MigrationPipeline.observe_slot(event_type="MODIFIED", labels=labels, **slot)
+        self.assertTrue(manage_commands_scheduler.holds(**slot))
+        self.assertFalse(manage_commands_scheduler.holds_elsewhere(**slot))
+
+
+class AsyncManagementSlotStepTestCase(IsolatedAsyncioTestCase):
+    def setUp(self):
+        super().setUp()
+        manage_commands_scheduler.clear()
+        self.addCleanup(manage_commands_scheduler.clear)
+
+    @patch.object(AwaitManagementCommandsStep, "is_ready_async", return_value=False)
+    async def test_released_on_timeout(self, p_ready):
+        manage_commands_scheduler.acquire(namespace="test", name="django")
+        step = AwaitManagementCommandsStep(
+            logger=MockLogger(),
+            patch=MockPatch(),
+            status={},
+            spec={"initManageCommands": [["migrate"]]},
+            retry=20,
+            namespace="test",
+            name="django",
+            use_async=True,
+        )
+        with self.assertRaises(kopf.PermanentError):
+            await step.handle_async(context={})
+        self.assertFalse(
+            manage_commands_scheduler.holds(namespace="test", name="django")
+        )
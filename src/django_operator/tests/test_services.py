@@ -0,0 +1,323 @@
+from unittest import IsolatedAsyncioTestCase, TestCase, skipIf
+from unittest.mock import AsyncMock, patch
+
+from kubernetes.client import V1Deployment, V1ObjectMeta
+from kubernetes.client.exceptions import ApiException
+
+from django_operator.clients import (
+    async_registry,
+    kubernetes_asyncio,
+    registry,
+)
+from django_operator.scheduling import CRITICAL, RateLimiter, _priority
+from django_operator.services import BaseService, DeploymentService
+from django_operator.tests.base import MockLogger
+from django_operator.watches import resource_cache
+
+MANIFEST = """
+apiVersion: apps/v1
+kind: Deployment
+metadata:
+  name: app
+spec:
+  replicas: 1
+"""
+
+PARENT = {
+    "apiVersion": "thismatters.github/v1alpha",
+    "kind": "Django",
+    "metadata": {"name": "django", "namespace": "test", "uid": "abc"},
+}
+
+
+class BaseServiceEnsureTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = patch.object(
+            registry, "supports_server_side_apply", return_value=False
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = DeploymentService(logger=MockLogger())
+
+    def _desired_hash(self, body=MANIFEST):
+        _body = self.service._get_manifest(
+            body=body,
+            template=None,
+            parent=PARENT,
+            namespace="test",
+            enrichments=None,
+        )
+        return _body["metadata"]["annotations"][BaseService.hash_annotation]
+
+    def _live(self, annotations=None):
+        return V1Deployment(metadata=V1ObjectMeta(name="app", annotations=annotations))
+
+    @patch.object(DeploymentService, "_post")
+    @patch.object(DeploymentService, "_patch")
+    @patch.object(DeploymentService, "_read")
+    def test_post_when_missing(self, p_read, p_patch, p_post):
+        p_read.side_effect = ApiException(status=404)
+        self.service.ensure(namespace="test", body=MANIFEST, parent=PARENT)
+        p_patch.assert_not_called()
+        p_post.assert_called_once()
+        body = p_post.call_args.kwargs["body"]
+        self.assertIn(BaseService.hash_annotation, body["metadata"]["annotations"])
+
+    @patch.object(DeploymentService, "_post")
+    @patch.object(DeploymentService, "_patch")
+    @patch.object(DeploymentService, "_read")
+    def test_patch_when_changed(self, p_read, p_patch, p_post):
+        p_read.return_value = self._live({BaseService.hash_annotation: "stale"})
+        self.service.ensure(namespace="test", body=MANIFEST, parent=PARENT)
+        p_patch.assert_called_once()
+        p_post.assert_not_called()
+
+    @patch.object(DeploymentService, "_post")
+    @patch.object(DeploymentService, "_patch")
+    @patch.object(DeploymentService, "_read")
+    def test_skip_when_unchanged(self, p_read, p_patch, p_post):
+        live = self._live({BaseService.hash_annotation: self._desired_hash()})
+        p_read.return_value = live
+        obj = self.service.ensure(namespace="test", body=MANIFEST, parent=PARENT)
+        self.assertIs(obj, live)
+        p_patch.assert_not_called()
+        p_post.assert_not_called()
+
+    def test_instance_label(self):
+        _body = self.service._get_manifest(
+            body=MANIFEST,
+            template=None,
+            parent=PARENT,
+            namespace="test",
+            enrichments=None,
+        )
+        self.assertEqual(_body["metadata"]["labels"][BaseService.instance_label], "abc")
+
+    def test_list_owned(self):
+        with patch.object(self.service.client, "list_namespaced_deployment") as p_list:
+            self.service.list_owned(namespace="test", instance="abc")
+        p_list.assert_called_once_with(
+            namespace="test", label_selector=f"{BaseService.instance_label}=abc"
+        )
+
+    def test_throttled_retry(self):
+        throttled = ApiException(status=429)
+        throttled.headers = {"Retry-After": "0"}
+        limiter = RateLimiter(retries=1)
+        with patch("django_operator.services.api_rate_limiter", limiter):
+            with patch.object(
+                self.service.client,
+                "read_namespaced_deployment",
+                side_effect=[throttled, "obj"],
+            ) as p_read:
+                self.assertEqual(self.service.read(namespace="test", name="app"), "obj")
+            self.assertEqual(p_read.call_count, 2)
+            with patch.object(
+                self.service.client,
+                "read_namespaced_deployment",
+                side_effect=[throttled, throttled],
+            ):
+                with self.assertRaises(ApiException):
+                    self.service.read(namespace="test", name="app")
+
+    def test_read_status_priority(self):
+        priorities = []
+        with patch.object(
+            self.service.client,
+            "read_namespaced_deployment_status",
+            side_effect=lambda **_: priorities.append(_priority.get()),
+        ):
+            self.service.read_status(namespace="test", name="app")
+        self.assertEqual(priorities, [CRITICAL])
+
+    def test_hash_tracks_content(self):
+        self.assertEqual(self._desired_hash(), self._desired_hash())
+        self.assertNotEqual(
+            self._desired_hash(),
+            self._desired_hash(MANIFEST.replace("replicas: 1", "replicas: 2")),
+        )
+
+
+class BaseServiceApplyTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = patch.object(
+            registry, "supports_server_side_apply", return_value=True
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = DeploymentService(logger=MockLogger())
+
+    @patch.object(DeploymentService, "_post")
+    @patch.object(DeploymentService, "_patch")
+    @patch.object(DeploymentService, "_read")
+    def test_single_request(self, p_read, p_patch, p_post):
+        with patch.object(self.service.client.api_client, "call_api") as p_call_api:
+            self.service.ensure(namespace="test", body=MANIFEST, parent=PARENT)
+        p_read.assert_not_called()
+        p_patch.assert_not_called()
+        p_post.assert_not_called()
+        p_call_api.assert_called_once()
+        args, kwargs = p_call_api.call_args
+        self.assertEqual(
+            args, ("/apis/apps/v1/namespaces/{namespace}/deployments/{name}", "PATCH")
+        )
+        self.assertEqual(kwargs["path_params"], {"namespace": "test", "name": "app"})
+        self.assertIn(("fieldManager", "django-operator"), kwargs["query_params"])
+        self.assertEqual(
+            kwargs["header_params"]["Content-Type"], "application/apply-patch+yaml"
+        )
+        self.assertEqual(kwargs["response_type"], "V1Deployment")
+
+    @patch.object(DeploymentService, "_read")
+    def test_skip_when_seen_unchanged(self, p_read):
+        self.addCleanup(resource_cache.clear)
+        _body = self.service._get_manifest(
+            body=MANIFEST,
+            template=None,
+            parent=PARENT,
+            namespace="test",
+            enrichments=None,
+        )
+        annotations = _body["metadata"]["annotations"]
+        live = V1Deployment(metadata=V1ObjectMeta(name="app", annotations=annotations))
+        p_read.return_value = live
+        resource_cache.observe(
+            kind="deployment",
+            event_type="ADDED",
+            body={
+                "metadata": {
+                    "name": "app",
+                    "namespace": "test",
+                    "annotations": annotations,
+                }
+            },
+        )
+        with patch.object(self.service.client.api_client, "call_api") as p_call_api:
+            obj = self.service.ensure(namespace="test", body=MANIFEST, parent=PARENT)
+        self.assertIs(obj, live)
+        p_call_api.assert_not_called()
+        # the cache may be behind, the live object has the last word
+        live.metadata.annotations = {}
+        with patch.object(self.service.client.api_client, "call_api") as p_call_api:
+            self.service.ensure(namespace="test", body=MANIFEST, parent=PARENT)
+        p_call_api.assert_called_once()
+
+    @patch.object(DeploymentService, "server_side_apply", False)
+    @patch.object(DeploymentService, "_patch")
+    @patch.object(DeploymentService, "_read")
+    def test_opt_out(self, p_read, p_patch):
+        p_read.return_value = V1Deployment(metadata=V1ObjectMeta(name="app"))
+        self.service.ensure(namespace="test", body=MANIFEST, parent=PARENT)
+        p_read.assert_called_once()
+        p_patch.assert_called_once()
+
+    @patch.object(DeploymentService, "_delete")
+    @patch.object(DeploymentService, "_read")
+    def test_delete_unaffected(self, p_read, p_delete):
+        p_read.return_value = V1Deployment(metadata=V1ObjectMeta(name="app"))
+        self.service.ensure(namespace="test", existing="app", delete=True)
+        p_delete.assert_called_once_with(namespace="test", name="app")
+
+
+@skipIf(kubernetes_asyncio is None, "kubernetes_asyncio is not installed")
+class AsyncBaseServiceTestCase(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        from django_operator.async_services import AsyncDeploymentService
+
+        self.service_klass = AsyncDeploymentService
+        patcher = patch.object(
+            async_registry, "supports_server_side_apply", AsyncMock(return_value=False)
+        )
+        self.p_supports = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = AsyncDeploymentService(logger=MockLogger())
+
+    async def asyncTearDown(self):
+        await async_registry.close()
+        await super().asyncTearDown()
+
+    async def test_post_when_missing(self):
+        from kubernetes_asyncio.client.exceptions import ApiException
+
+        with patch.object(
+            self.service.client,
+            "read_namespaced_deployment",
+            AsyncMock(side_effect=ApiException(status=404)),
+        ), patch.object(
+            self.service.client, "create_namespaced_deployment", AsyncMock()
+        ) as p_post:
+            await self.service.ensure(namespace="test", body=MANIFEST, parent=PARENT)
+        p_post.assert_awaited_once()
+        body = p_post.call_args.kwargs["body"]
+        self.assertIn(BaseService.hash_annotation, body["metadata"]["annotations"])
+
+    async def test_skip_when_unchanged(self):
+        _body = self.service._get_manifest(
+            body=MANIFEST,
+            template=None,
+            parent=PARENT,
+            namespace="test",
+            enrichments=None,
+        )
+        live = V1Deployment(
+            metadata=V1ObjectMeta(
+                name="app", annotations=_body["metadata"]["annotations"]
+            )
+        )
+        with patch.object(
+            self.service.client,
+            "read_namespaced_deployment",
+            AsyncMock(return_value=live),
+        ), patch.object(
+            self.service.client, "patch_namespaced_deployment", AsyncMock()
+        ) as p_patch:
+            obj = await self.service.ensure(
+                namespace="test", body=MANIFEST, parent=PARENT
+            )
+        self.assertIs(obj, live)
+        p_patch.assert_not_awaited()
+
+    async def test_server_side_apply(self):
+        self.p_supports.return_value = True
+        with patch.object(
+            self.service.client, "patch_namespaced_deployment", AsyncMock()
+        ) as p_patch:
+            await self.service.ensure(namespace="test", body=MANIFEST, parent=PARENT)
+        p_patch.assert_awaited_once()
+        kwargs = p_patch.call_args.kwargs
+        self.assertEqual(kwargs["_content_type"], "application/apply-patch+yaml")
+        self.assertEqual(kwargs["field_manager"], "django-operator")
+        self.assertTrue(kwargs["force"])
+
+    async def test_server_side_apply_skip_when_seen_unchanged(self):
+        self.p_supports.return_value = True
+        self.addCleanup(resource_cache.clear)
+        _body = self.service._get_manifest(
+            body=MANIFEST,
+            template=None,
+            parent=PARENT,
+            namespace="test",
+            enrichments=None,
+        )
+        metadata = {"name": "app", "annotations": _body["metadata"]["annotations"]}
+        live = V1Deployment(metadata=V1ObjectMeta(**metadata))
+        resource_cache.observe(
+            kind="deployment",
+            event_type="ADDED",
+            body={"metadata": dict(metadata, namespace="test")},
+        )
+        with patch.object(
+            self.service.client,
+            "read_namespaced_deployment",
+            AsyncMock(return_value=live),
+        ), patch.object(
+            self.service.client, "patch_namespaced_deployment", AsyncMock()
+        ) as p_patch:
+            obj = await self.service.ensure(
+                namespace="test", body=MANIFEST, parent=PARENT
+            )
+        self.assertIs(obj, live)
+        p_patch.assert_not_awaited()
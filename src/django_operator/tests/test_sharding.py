@@ -0,0 +1,245 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from unittest import TestCase
+from unittest.mock import patch
+
+import kopf
+from kubernetes.client import V1Lease, V1LeaseSpec, V1ObjectMeta
+from kubernetes.client.exceptions import ApiException
+
+from django_operator.services import BaseService, DjangoService, LeaseService
+from django_operator.sharding import (
+    KOPF_FINALIZER,
+    SHARD_ANNOTATION,
+    HashRing,
+    ShardedDiffBaseStorage,
+    ShardedProgressStorage,
+    ShardMembership,
+)
+from django_operator.tests.base import MockLogger
+
+NOW = datetime(2021, 12, 1, tzinfo=timezone.utc)
+UIDS = [f"uid-{index}" for index in range(3000)]
+
+
+def lease(holder, *, age=0, duration=15):
+    return V1Lease(
+        metadata=V1ObjectMeta(name=f"group-{holder}"),
+        spec=V1LeaseSpec(
+            holder_identity=holder,
+            lease_duration_seconds=duration,
+            renew_time=NOW - timedelta(seconds=age),
+        ),
+    )
+
+
+class HashRingTestCase(TestCase):
+    def test_empty(self):
+        self.assertIsNone(HashRing().owner("uid"))
+
+    def test_balanced(self):
+        ring = HashRing(["a", "b", "c"])
+        owners = Counter(ring.owner(uid) for uid in UIDS)
+        self.assertEqual(set(owners), {"a", "b", "c"})
+        for count in owners.values():
+            self.assertGreater(count, len(UIDS) / 6)
+
+    def test_leaving_moves_only_its_keys(self):
+        before = HashRing(["a", "b", "c"])
+        after = HashRing(["a", "b"])
+        for uid in UIDS:
+            if before.owner(uid) != "c":
+                self.assertEqual(after.owner(uid), before.owner(uid))
+
+
+class ShardMembershipTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.clock = lambda: NOW
+        self.membership = ShardMembership(
+            group="group",
+            identity="a",
+            namespace="operator",
+            lease_seconds=15,
+            clock=lambda: self.clock(),
+        )
+        self.membership.ring = HashRing(["a", "b"])
+        self.mine = next(uid for uid in UIDS if self.membership.owns(uid))
+        self.theirs = next(uid for uid in UIDS if not self.membership.owns(uid))
+
+    def test_disabled(self):
+        membership = ShardMembership(group="", identity="a")
+        membership.ring = HashRing(["b"])
+        self.assertTrue(membership.owns(self.mine))
+        self.assertTrue(membership.owns(self.theirs))
+
+    def test_owns_body(self):
+        self.assertTrue(self.membership.owns_body({"metadata": {"uid": self.mine}}))
+        self.assertFalse(self.membership.owns_body({"metadata": {"uid": self.theirs}}))
+        # resources go by their Django object
+        labels = {BaseService.instance_label: self.theirs}
+        self.assertFalse(
+            self.membership.owns_body(
+                {"metadata": {"uid": self.mine, "labels": labels}}
+            )
+        )
+        owner = {
+            "apiVersion": "thismatters.github/v1alpha",
+            "kind": "Django",
+            "uid": self.theirs,
+        }
+        self.assertFalse(
+            self.membership.owns_body(
+                {"metadata": {"uid": self.mine, "ownerReferences": [owner]}}
+            )
+        )
+
+    @patch.object(LeaseService, "list_labelled")
+    @patch.object(LeaseService, "renew")
+    def test_refresh(self, p_renew, p_list):
+        p_list.return_value = [lease("a"), lease("b", age=5), lease("c", age=20)]
+        self.assertIsNone(self.membership.refresh(logger=MockLogger()))
+        body = p_renew.call_args.kwargs["body"]
+        self.assertEqual(body["spec"]["holderIdentity"], "a")
+        self.assertEqual(body["spec"]["renewTime"], "2021-12-01T00:00:00.000000Z")
+
+        p_list.return_value.append(lease("c"))
+        previous = self.membership.refresh(logger=MockLogger())
+        self.assertEqual(previous.members, {"a", "b"})
+        self.assertEqual(self.membership.ring.members, {"a", "b", "c"})
+
+    @patch.object(DjangoService, "patch")
+    @patch.object(DjangoService, "list_all")
+    def test_rebalance(self, p_list, p_patch):
+        p_list.return_value = [
+            {
+                "metadata": {
+                    "namespace": "ns",
+                    "name": uid,
+                    "uid": uid,
+                    "finalizers": ["django.thismatters.github/shard-b"],
+                    "resourceVersion": "7",
+                }
+            }
+            for uid in UIDS[:100]
+        ]
+        previous = HashRing(["a", "b", "c"])
+        self.membership.rebalance(previous=previous, logger=MockLogger())
+        gained = {
+            uid
+            for uid in UIDS[:100]
+            if self.membership.owns(uid) and previous.owner(uid) != "a"
+        }
+        self.assertTrue(gained)
+        self.assertEqual(
+            {call.kwargs["name"] for call in p_patch.call_args_list}, gained
+        )
+        self.assertEqual(
+            p_patch.call_args.kwargs["body"],
+            {
+                "metadata": {
+                    "annotations": {SHARD_ANNOTATION: "a"},
+                    # held before the former owner drops its own
+                    "finalizers": [
+                        "django.thismatters.github/shard-b",
+                        "django.thismatters.github/shard-a",
+                    ],
+                    "resourceVersion": "7",
+                }
+            },
+        )
+
+    @patch.object(DjangoService, "patch")
+    def test_release_finalizers(self, p_patch):
+        body = {
+            "metadata": {
+                "namespace": "ns",
+                "name": "django",
+                "finalizers": [
+                    "django.thismatters.github/shard-a",
+                    "django.thismatters.github/shard-gone",
+                    KOPF_FINALIZER,
+                    "example.com/other",
+                ],
+            }
+        }
+        self.membership.release_finalizers(body=body, logger=MockLogger())
+        self.assertEqual(
+            p_patch.call_args.kwargs["body"],
+            {
+                "metadata": {
+                    "finalizers": [
+                        "django.thismatters.github/shard-a",
+                        "example.com/other",
+                    ]
+                }
+            },
+        )
+        p_patch.reset_mock()
+        body["metadata"]["finalizers"] = ["django.thismatters.github/shard-a"]
+        self.membership.release_finalizers(body=body, logger=MockLogger())
+        p_patch.assert_not_called()
+
+    @patch.object(ShardMembership, "rebalance")
+    @patch.object(LeaseService, "list_labelled")
+    @patch.object(LeaseService, "renew")
+    def test_tick(self, p_renew, p_list, p_rebalance):
+        p_list.return_value = [lease("a"), lease("b")]
+        self.membership.tick(logger=MockLogger())
+        p_rebalance.assert_not_called()
+
+        p_list.return_value = [lease("a")]
+        p_rebalance.side_effect = ApiException(status=500)
+        self.membership.tick(logger=MockLogger())
+        self.assertEqual(self.membership.ring.members, {"a"})
+        # taking over is retried until it goes through
+        p_rebalance.side_effect = None
+        self.membership.tick(logger=MockLogger())
+        self.assertEqual(p_rebalance.call_count, 2)
+        self.assertEqual(p_rebalance.call_args.kwargs["previous"].members, {"a", "b"})
+        self.membership.tick(logger=MockLogger())
+        self.assertEqual(p_rebalance.call_count, 2)
+
+    @patch.object(LeaseService, "list_labelled")
+    @patch.object(LeaseService, "renew")
+    def test_tick_expired(self, p_renew, p_list):
+        p_list.return_value = [lease("a"), lease("b")]
+        self.membership.tick(logger=MockLogger())
+        p_renew.side_effect = ApiException(status=500)
+        self.clock = lambda: NOW + timedelta(seconds=10)
+        self.membership.tick(logger=MockLogger())
+        self.assertTrue(self.membership.owns(self.mine))
+        self.clock = lambda: NOW + timedelta(seconds=20)
+        self.membership.tick(logger=MockLogger())
+        self.assertFalse(self.membership.owns(self.mine))
+
+
+class ShardedStorageTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.membership = ShardMembership(group="group", identity="a")
+        self.membership.ring = HashRing(["a", "b"])
+        mine = next(uid for uid in UIDS if self.membership.owns(uid))
+        theirs = next(uid for uid in UIDS if not self.membership.owns(uid))
+        self.mine = kopf.Body({"metadata": {"uid": mine}})
+        self.theirs = kopf.Body({"metadata": {"uid": theirs}})
+
+    def test_diffbase(self):
+        storage = ShardedDiffBaseStorage(membership=self.membership)
+        essence = kopf.BodyEssence({"spec": {"version": "1"}})
+        patch = kopf.Patch()
+        storage.store(body=self.theirs, patch=patch, essence=essence)
+        self.assertFalse(patch)
+        storage.store(body=self.mine, patch=patch, essence=essence)
+        self.assertTrue(patch)
+
+    def test_progress(self):
+        storage = ShardedProgressStorage(membership=self.membership)
+        record = {"started": "2021-12-01T00:00:00", "retries": 1}
+        patch = kopf.Patch()
+        storage.store(key="handler", record=record, body=self.theirs, patch=patch)
+        storage.purge(key="handler", body=self.theirs, patch=patch)
+        storage.touch(body=self.theirs, patch=patch, value="x")
+        self.assertFalse(patch)
+        storage.store(key="handler", record=record, body=self.mine, patch=patch)
+        self.assertTrue(patch)
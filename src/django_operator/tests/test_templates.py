@@ -0,0 +1,68 @@
+from pathlib import Path
+from unittest import TestCase
+
+import yaml
+
+from django_operator.templates import CompiledTemplate, TemplateCache
+
+MANIFESTS = Path(__file__).resolve().parents[3] / "manifests"
+
+TEMPLATE_KWARGS = {
+    "host": "test.somewhere.com",
+    "image": "testimage:6.9.420",
+    "version": "6.9.420",
+    "version_slug": "6-9-420",
+    "cluster_issuer": "letsencrypt",
+    "app_port": 8000,
+    "redis_port": 6379,
+    "app_cpu_request": "100m",
+    "beat_cpu_request": "10m",
+    "worker_cpu_request": "30m",
+    "app_memory_request": "200Mi",
+    "beat_memory_request": "200Mi",
+    "worker_memory_request": "250Mi",
+    "purpose": "app",
+    "command_slug": "migrate",
+    "common_name": "somewhere.com",
+    "deployment_name": "app-6-9-420",
+    "cpu_threshold": 60,
+    "max_replicas": 10,
+    "min_replicas": 1,
+    "current_replicas": 3,
+}
+
+
+class CompiledTemplateTestCase(TestCase):
+    def test_matches_format_and_load(self):
+        cache = TemplateCache(directory=MANIFESTS)
+        for path in sorted(MANIFESTS.glob("*.yaml")):
+            with self.subTest(template=path.name):
+                self.assertEqual(
+                    cache.render(path.name, **TEMPLATE_KWARGS),
+                    yaml.safe_load(path.read_text().format(**TEMPLATE_KWARGS)),
+                )
+
+    def test_placeholder_types(self):
+        compiled = CompiledTemplate(
+            'a: {num}\nb: "{num}"\nc: "x-{word}-{num}"\nd: {{}}\ne: {missing}\n'
+        )
+        rendered = compiled.render(num=3, word="y", missing=None)
+        self.assertEqual(
+            rendered, {"a": 3, "b": "3", "c": "x-y-3", "d": {}, "e": "None"}
+        )
+
+    def test_missing_kwarg(self):
+        with self.assertRaises(KeyError):
+            CompiledTemplate("a: {num}\n").render()
+
+    def test_renders_are_independent(self):
+        compiled = CompiledTemplate("a:\n  b: []\n  c: {{}}\n")
+        first = compiled.render()
+        first["a"]["b"].append(1)
+        first["a"]["c"]["d"] = 2
+        self.assertEqual(compiled.render(), {"a": {"b": [], "c": {}}})
+
+    def test_cache(self):
+        cache = TemplateCache(directory=MANIFESTS)
+        cache.preload()
+        self.assertIs(cache.get("service_app.yaml"), cache.get("service_app.yaml"))
@@ -0,0 +1,77 @@
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from django_operator.tracing import (
+    FileSpanExporter,
+    Tracer,
+    count_api_call,
+    load_exporter,
+    new_trace,
+    span,
+    submit,
+)
+
+
+class TracerTestCase(TestCase):
+    def test_counting(self):
+        tracer = Tracer()
+        # calls outside of a step aren't counted anywhere
+        count_api_call()
+        with tracer.counting(("uid", "step")):
+            count_api_call()
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                for _ in range(3):
+                    submit(executor, count_api_call)
+        # a later attempt at the same step adds to the count
+        with tracer.counting(("uid", "step")):
+            count_api_call()
+        self.assertEqual(tracer.take_calls(("uid", "step")), 5)
+        self.assertEqual(tracer.take_calls(("uid", "step")), 0)
+
+    def test_forget(self):
+        tracer = Tracer()
+        for key in [("uid", "step"), ("uid", "other"), ("uid2", "step")]:
+            with tracer.counting(key):
+                count_api_call()
+        tracer.forget("uid")
+        self.assertEqual(tracer.take_calls(("uid", "step")), 0)
+        self.assertEqual(tracer.take_calls(("uid", "other")), 0)
+        self.assertEqual(tracer.take_calls(("uid2", "step")), 1)
+
+    def test_span(self):
+        trace = new_trace()
+        child = span(
+            trace=trace,
+            name="step",
+            started="2026-01-01T12:00:00+00:00",
+            finished="2026-01-01T12:00:01.5+00:00",
+            attributes={},
+        )
+        self.assertEqual(child["parentSpanId"], trace["spanId"])
+        self.assertNotEqual(child["spanId"], trace["spanId"])
+        self.assertEqual(
+            child["endTimeUnixNano"] - child["startTimeUnixNano"], 1_500_000_000
+        )
+
+
+class ExporterTestCase(TestCase):
+    def test_file_exporter(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "spans.jsonl")
+            exporter = load_exporter(f"file:{path}")
+            exporter.export([{"name": "a"}, {"name": "b"}])
+            exporter.export([{"name": "c"}])
+            with open(path) as f:
+                names = [json.loads(line)["name"] for line in f]
+        self.assertEqual(names, ["a", "b", "c"])
+
+    def test_load_exporter(self):
+        self.assertIsNone(load_exporter(""))
+        self.assertIsNone(load_exporter("stdout").path)
+        self.assertIsInstance(
+            load_exporter("django_operator.tracing.FileSpanExporter"),
+            FileSpanExporter,
+        )
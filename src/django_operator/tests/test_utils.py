@@ -5,8 +5,12 @@ from kubernetes.client import V1Deployment, V1ObjectMeta
 from django_operator.utils import (
     _k8s_client_owner_mask,
     merge,
+    merge_patch,
+    merge_patches,
+    merged,
     slugify,
     superget,
+    supergetmany,
 )
 
 
@@ -29,6 +33,39 @@ class UtilsTestCase(TestCase):
         self.assertEqual(superget(haystack, "a.b.g", default={}), {})
         self.assertEqual(superget(haystack, "n", default=""), "")
 
+    def test_superget_missing(self):
+        haystack = {"a": {"b": None, "c": "string"}}
+        self.assertIsNone(superget(haystack, "a.b.c"))
+        self.assertIsNone(superget(haystack, "a.c.d"))
+        with self.assertRaises(KeyError):
+            superget(haystack, "a.x", _raise=KeyError())
+
+    def test_superget_client_objects(self):
+        deployment = V1Deployment(
+            api_version="apps/v1", metadata=V1ObjectMeta(name="app")
+        )
+        self.assertEqual(superget(deployment, "metadata.name"), "app")
+        self.assertEqual(superget(deployment, "apiVersion"), "apps/v1")
+        self.assertIsNone(superget(deployment, "metadata.namespace"))
+        self.assertEqual(superget(deployment, "metadata.to_dict", default=1), 1)
+        # and what `to_dict()` makes of them
+        self.assertEqual(superget(deployment.to_dict(), "apiVersion"), "apps/v1")
+
+    def test_supergetmany(self):
+        haystack = {"a": {"b": {"c": 1, "d": 2}, "e": 3}, "f": None}
+        self.assertEqual(
+            supergetmany(haystack, ["a.b.c", "a.b.d", "a.e", "a", "f.g", "x"]),
+            {
+                "a.b.c": 1,
+                "a.b.d": 2,
+                "a.e": 3,
+                "a": haystack["a"],
+                "f.g": None,
+                "x": None,
+            },
+        )
+        self.assertEqual(supergetmany(None, ["a"], default=0), {"a": 0})
+
     def test_real_superget(self):
         haystack = {
             "complete_management_commands": {},
@@ -181,6 +218,14 @@ class UtilsTestCase(TestCase):
             },
         )
 
+    def test_merge_in_place(self):
+        nested = {"c": {"d": [1]}}
+        target = {"b": nested}
+        merge(target, {"b": {"c": {"d": [2], "e": 3}}})
+        # whoever holds on to the nested containers sees the merge too
+        self.assertIs(target["b"], nested)
+        self.assertEqual(nested, {"c": {"d": [1, 2], "e": 3}})
+
     def test_complex_merge(self):
         target = {
             "spec": {
@@ -199,6 +244,86 @@ class UtilsTestCase(TestCase):
             },
         )
 
+    def test_merged_leaves_inputs(self):
+        left = {"a": {"b": [1], "c": {"d": 1}}, "untouched": {"e": 1}}
+        right = {"a": {"b": [2], "f": {"g": 1}}}
+        ret = merged(left, right)
+        self.assertEqual(
+            ret,
+            {
+                "a": {"b": [1, 2], "c": {"d": 1}, "f": {"g": 1}},
+                "untouched": {"e": 1},
+            },
+        )
+        self.assertEqual(left, {"a": {"b": [1], "c": {"d": 1}}, "untouched": {"e": 1}})
+        self.assertEqual(right, {"a": {"b": [2], "f": {"g": 1}}})
+        # untouched subtrees are shared rather than copied
+        self.assertIs(ret["untouched"], left["untouched"])
+        self.assertIs(ret["a"]["c"], left["a"]["c"])
+        self.assertIs(ret["a"]["f"], right["a"]["f"])
+
+    def test_merged_index_path(self):
+        left = {"containers": [{"name": "app"}, {"name": "sidecar"}]}
+        ret = merged(left, {("containers", 0): {"image": "app:1"}})
+        self.assertEqual(
+            ret["containers"], [{"name": "app", "image": "app:1"}, {"name": "sidecar"}]
+        )
+        self.assertEqual(left["containers"][0], {"name": "app"})
+        self.assertIs(ret["containers"][1], left["containers"][1])
+
+    def test_merged_list_key(self):
+        left = {"env": [{"name": "A", "value": "1"}, {"name": "B", "value": "2"}]}
+        right = {"env": [{"name": "B", "value": "3"}, {"name": "C", "value": "4"}]}
+        self.assertEqual(
+            merged(left, right, list_key="name")["env"],
+            [
+                {"name": "A", "value": "1"},
+                {"name": "B", "value": "3"},
+                {"name": "C", "value": "4"},
+            ],
+        )
+        # without the key the lists are just joined
+        self.assertEqual(len(merged(left, right)["env"]), 4)
+        # as they are if any item lacks the key
+        self.assertEqual(len(merged(left, {"env": ["B"]}, list_key="name")["env"]), 3)
+
+    def test_merged_type_mismatch(self):
+        with self.assertRaises(ValueError):
+            merged({"a": {}}, {"a": []})
+
+    def test_merge_patch(self):
+        target = {"a": {"b": 1, "c": 2}, "d": [1], "e": 3}
+        patch = {"a": {"b": None, "f": 4}, "d": [2], "e": None}
+        self.assertEqual(merge_patch(target, patch), {"a": {"c": 2, "f": 4}, "d": [2]})
+        self.assertEqual(target["a"], {"b": 1, "c": 2})
+
+    def test_merge_patches(self):
+        target = {"a": {"b": 1, "c": 2}, "d": 3}
+        first = {"a": {"b": None, "e": 5}, "d": None}
+        second = {"a": {"c": None, "b": 6}, "d": 7}
+        self.assertEqual(
+            merge_patch(target, merge_patches(first, second)),
+            merge_patch(merge_patch(target, first), second),
+        )
+
+    def test_merge_patches_delete_then_set(self):
+        target = {"a": {"b": 1, "c": {"d": 2, "e": 3}}, "f": 4}
+        first = {"a": None}
+        second = {"a": {"c": {"d": 5}}}
+        combined = merge_patches(first, second, target)
+        self.assertEqual(combined, {"a": {"b": None, "c": {"d": 5, "e": None}}})
+        self.assertEqual(
+            merge_patch(target, combined),
+            merge_patch(merge_patch(target, first), second),
+        )
+        # nested deletes too
+        first = {"a": {"c": None}}
+        second = {"a": {"c": {"e": 6}}}
+        self.assertEqual(
+            merge_patch(target, merge_patches(first, second, target)),
+            {"a": {"b": 1, "c": {"e": 6}}, "f": 4},
+        )
+
     def test_slugify(self):
         unslug = "bu.nch_of1  OTHEr__shit"
         self.assertEqual(slugify(unslug), "bu-nch-of1-other-shit")
@@ -0,0 +1,429 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from unittest import IsolatedAsyncioTestCase, TestCase, skipIf
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import main
+from django_operator.clients import async_registry, kubernetes_asyncio
+from django_operator.kinds import DjangoKind
+from django_operator.services import DeploymentService
+from django_operator.tests.base import MockLogger
+from django_operator.watches import (
+    ResourceCache,
+    daemonset_ready,
+    deployment_condition,
+    is_owned,
+    pod_phase,
+    resource_cache,
+    rollout_progress,
+)
+
+
+def _deployment(name, available=None):
+    body = {"metadata": {"name": name, "namespace": "test"}, "status": {}}
+    if available is not None:
+        body["status"]["conditions"] = [
+            {"type": "Progressing", "status": "True"},
+            {"type": "Available", "status": "True" if available else "False"},
+        ]
+    return body
+
+
+def _rolled_out(name):
+    body = _deployment(name)
+    body["status"] = {"replicas": 1, "updatedReplicas": 1, "availableReplicas": 1}
+    return body
+
+
+class WatchHelpersTestCase(TestCase):
+    def test_is_owned(self):
+        owned = {
+            "metadata": {
+                "ownerReferences": [
+                    {"apiVersion": "thismatters.github/v1alpha", "kind": "Django"}
+                ]
+            }
+        }
+        self.assertTrue(is_owned(owned))
+        self.assertFalse(is_owned({"metadata": {}}))
+        self.assertFalse(
+            is_owned(
+                {"metadata": {"ownerReferences": [{"apiVersion": "v1", "kind": "Pod"}]}}
+            )
+        )
+
+    def test_deployment_condition(self):
+        self.assertTrue(deployment_condition(_deployment("a", True), "Available"))
+        self.assertFalse(deployment_condition(_deployment("a", False), "Available"))
+        self.assertFalse(deployment_condition(_deployment("a"), "Available"))
+
+    def test_rollout_progress(self):
+        body = {
+            "metadata": {"generation": 2},
+            "spec": {"replicas": 3},
+            "status": {
+                "observedGeneration": 2,
+                "replicas": 4,
+                "updatedReplicas": 3,
+                "readyReplicas": 3,
+                "availableReplicas": 3,
+            },
+        }
+        progress = rollout_progress(body)
+        self.assertEqual(
+            progress,
+            {
+                "observedGeneration": 2,
+                "desired": 3,
+                "updated": 3,
+                "ready": 3,
+                "available": 3,
+                # an old replica is still around
+                "complete": False,
+            },
+        )
+        body["status"]["replicas"] = 3
+        self.assertTrue(rollout_progress(body)["complete"])
+        # the controller hasn't caught up with the spec
+        body["metadata"]["generation"] = 3
+        self.assertFalse(rollout_progress(body)["complete"])
+
+    def test_rollout_progress_client_dict(self):
+        # `read_status().to_dict()` is snake_cased
+        body = {
+            "metadata": {"generation": 1},
+            "spec": {"replicas": None},
+            "status": {
+                "observed_generation": 1,
+                "replicas": 1,
+                "updated_replicas": 1,
+                "available_replicas": 1,
+            },
+        }
+        progress = rollout_progress(body)
+        self.assertEqual(progress["desired"], 1)
+        self.assertTrue(progress["complete"])
+
+    def test_daemonset_ready(self):
+        body = {
+            "metadata": {"generation": 2},
+            "status": {
+                "observedGeneration": 2,
+                "desiredNumberScheduled": 3,
+                "updatedNumberScheduled": 3,
+                "numberReady": 2,
+            },
+        }
+        self.assertFalse(daemonset_ready(body))
+        body["status"]["numberReady"] = 3
+        self.assertTrue(daemonset_ready(body))
+        body["metadata"]["generation"] = 3
+        self.assertFalse(daemonset_ready(body))
+        # not yet looked at by the controller
+        self.assertFalse(daemonset_ready({"metadata": {"generation": 1}}))
+
+    def test_pod_phase(self):
+        self.assertEqual(pod_phase({"status": {"phase": "Succeeded"}}), "succeeded")
+        self.assertEqual(pod_phase({"status": None}), "unknown")
+
+
+class ResourceCacheTestCase(TestCase):
+    def test_observe(self):
+        cache = ResourceCache()
+        cache.observe(kind="deployment", event_type=None, body=_deployment("a"))
+        self.assertIsNotNone(cache.get(kind="deployment", namespace="test", name="a"))
+        cache.observe(kind="deployment", event_type="DELETED", body=_deployment("a"))
+        self.assertIsNone(cache.get(kind="deployment", namespace="test", name="a"))
+
+    def test_observe_rollout(self):
+        cache = ResourceCache()
+        body = _deployment("a")
+        body["spec"] = {"replicas": 3, "template": {}}
+        body["status"] = {"replicas": 1, "updatedReplicas": 1, "availableReplicas": 1}
+        cache.observe(kind="deployment", event_type="ADDED", body=body)
+        cached = cache.get(kind="deployment", namespace="test", name="a")
+        self.assertEqual(rollout_progress(cached)["desired"], 3)
+        self.assertFalse(rollout_progress(cached)["complete"])
+        cache.observe(kind="deployment", event_type="DELETED", body=_deployment("a"))
+        self.assertIsNone(cache.get(kind="deployment", namespace="test", name="a"))
+
+    def test_wait_for_any(self):
+        cache = ResourceCache()
+        for name in ("a", "b"):
+            cache.observe(kind="deployment", event_type="ADDED", body=_deployment(name))
+        timer = threading.Timer(
+            0.05,
+            cache.observe,
+            kwargs={
+                "kind": "deployment",
+                "event_type": "MODIFIED",
+                "body": _deployment("b", True),
+            },
+        )
+        timer.start()
+        found = cache.wait_for_any(
+            kind="deployment",
+            namespace="test",
+            names=["a", "b", "c"],
+            predicate=lambda obj: deployment_condition(obj, "Available"),
+            timeout=5,
+        )
+        timer.join()
+        self.assertFalse(deployment_condition(found["a"], "Available"))
+        self.assertTrue(deployment_condition(found["b"], "Available"))
+        self.assertIsNone(found["c"])
+
+    def test_wait_for_woken_by_event(self):
+        cache = ResourceCache()
+        cache.observe(kind="deployment", event_type="ADDED", body=_deployment("a"))
+        timer = threading.Timer(
+            0.05,
+            cache.observe,
+            kwargs={
+                "kind": "deployment",
+                "event_type": "MODIFIED",
+                "body": _deployment("a", True),
+            },
+        )
+        timer.start()
+        obj = cache.wait_for(
+            kind="deployment",
+            namespace="test",
+            name="a",
+            predicate=lambda obj: deployment_condition(obj, "Available"),
+            timeout=5,
+        )
+        timer.join()
+        self.assertTrue(deployment_condition(obj, "Available"))
+
+    def test_wait_for_timeout(self):
+        cache = ResourceCache()
+        obj = cache.wait_for(
+            kind="pod",
+            namespace="test",
+            name="a",
+            predicate=lambda obj: True,
+            timeout=0.01,
+        )
+        self.assertIsNone(obj)
+
+
+class AsyncResourceCacheTestCase(IsolatedAsyncioTestCase):
+    async def test_wait_for_woken_by_event(self):
+        cache = ResourceCache()
+        cache.observe(kind="deployment", event_type="ADDED", body=_deployment("a"))
+        # events may be observed from another thread
+        timer = threading.Timer(
+            0.05,
+            cache.observe,
+            kwargs={
+                "kind": "deployment",
+                "event_type": "MODIFIED",
+                "body": _deployment("a", True),
+            },
+        )
+        timer.start()
+        obj = await asyncio.wait_for(
+            cache.async_wait_for(
+                kind="deployment",
+                namespace="test",
+                name="a",
+                predicate=lambda obj: deployment_condition(obj, "Available"),
+                timeout=5,
+            ),
+            timeout=1,
+        )
+        timer.join()
+        self.assertTrue(deployment_condition(obj, "Available"))
+
+    async def test_wait_for_timeout(self):
+        obj = await ResourceCache().async_wait_for(
+            kind="pod",
+            namespace="test",
+            name="a",
+            predicate=lambda obj: True,
+            timeout=0.01,
+        )
+        self.assertIsNone(obj)
+
+
+class WatchHandlersTestCase(IsolatedAsyncioTestCase):
+    def tearDown(self):
+        resource_cache.clear()
+        super().tearDown()
+
+    async def test_executor_saturated(self):
+        # every executor thread is held by a waiting step, the event which
+        #  wakes them must still get through
+        loop = asyncio.get_running_loop()
+        names = ["app-0", "app-1"]
+        with ThreadPoolExecutor(max_workers=len(names)) as executor:
+            waits = [
+                loop.run_in_executor(
+                    executor,
+                    partial(
+                        resource_cache.wait_for,
+                        kind="deployment",
+                        namespace="test",
+                        name=name,
+                        predicate=lambda obj: deployment_condition(obj, "Available"),
+                        timeout=5,
+                    ),
+                )
+                for name in names
+            ]
+            await asyncio.sleep(0.05)
+            for name in names:
+                kwargs = {
+                    "type": "ADDED",
+                    "body": _deployment(name, True),
+                    "logger": MockLogger(),
+                }
+                # as kopf invokes handlers: plain functions on its executor
+                if asyncio.iscoroutinefunction(main.watch_deployments):
+                    handled = main.watch_deployments(**kwargs)
+                else:
+                    handled = loop.run_in_executor(
+                        executor, partial(main.watch_deployments, **kwargs)
+                    )
+                await asyncio.wait_for(handled, timeout=1)
+            found = await asyncio.wait_for(asyncio.gather(*waits), timeout=1)
+        for obj in found:
+            self.assertTrue(deployment_condition(obj, "Available"))
+
+
+class ResourceCacheTrackingTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = ResourceCache()
+        self.django = {
+            "apiVersion": "thismatters.github/v1alpha",
+            "kind": "Django",
+            "metadata": {"name": "django", "namespace": "test", "uid": "abc"},
+            "spec": {"version": "1.2"},
+        }
+        self.cache.track(
+            body=self.django,
+            created={
+                "deployment": {"app": "app-1", "redis": "redis"},
+                "service": {"app": "app"},
+            },
+        )
+
+    def test_tracked_deletion(self):
+        self.assertTrue(self.cache.is_tracked(kind="service", body=_deployment("app")))
+        owner = self.cache.observe(
+            kind="deployment", event_type="DELETED", body=_deployment("app-1")
+        )
+        self.assertEqual(owner["metadata"]["uid"], "abc")
+        self.assertEqual(owner["spec"], {"version": "1.2"})
+        # the owner is only reported once
+        owner = self.cache.observe(
+            kind="service", event_type="DELETED", body=_deployment("app")
+        )
+        self.assertIsNone(owner)
+
+    def test_untracked_deletion(self):
+        owner = self.cache.observe(
+            kind="deployment", event_type="DELETED", body=_deployment("app-0")
+        )
+        self.assertIsNone(owner)
+        owner = self.cache.observe(
+            kind="deployment", event_type="MODIFIED", body=_deployment("app-1")
+        )
+        self.assertIsNone(owner)
+
+    def test_untrack(self):
+        self.cache.track(body=self.django, created=None)
+        self.assertFalse(
+            self.cache.is_tracked(kind="deployment", body=_deployment("app-1"))
+        )
+        owner = self.cache.observe(
+            kind="deployment", event_type="DELETED", body=_deployment("app-1")
+        )
+        self.assertIsNone(owner)
+
+
+class DjangoKindWatchTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.django_kind = DjangoKind(
+            logger=MockLogger(),
+            status={},
+            patch={},
+            body={},
+            spec={
+                "host": "test.somewhere.com",
+                "clusterIssuer": "letsencrypt",
+                "version": "6.9.420",
+                "image": "testimage",
+            },
+            namespace="test",
+        )
+
+    def tearDown(self):
+        resource_cache.clear()
+        super().tearDown()
+
+    @patch.object(DeploymentService, "read_status")
+    def test_rollout_from_cache(self, p_read_status):
+        resource_cache.observe(
+            kind="deployment", event_type=None, body=_rolled_out("app")
+        )
+        self.assertTrue(self.django_kind.deployment_rollout(name="app")["complete"])
+        p_read_status.assert_not_called()
+
+    @patch.object(DeploymentService, "read_status")
+    def test_rollout_fallback(self, p_read_status):
+        p_read_status.return_value.to_dict.return_value = _deployment("app")
+        self.assertFalse(self.django_kind.deployment_rollout(name="app")["complete"])
+        p_read_status.assert_called_once_with(namespace="test", name="app")
+
+
+@skipIf(kubernetes_asyncio is None, "kubernetes_asyncio is not installed")
+class AsyncDjangoKindWatchTestCase(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        from django_operator.async_kinds import AsyncDjangoKind
+
+        self.django_kind = AsyncDjangoKind(
+            logger=MockLogger(),
+            status={},
+            patch={},
+            body={},
+            spec={
+                "host": "test.somewhere.com",
+                "clusterIssuer": "letsencrypt",
+                "version": "6.9.420",
+                "image": "testimage",
+            },
+            namespace="test",
+        )
+
+    async def asyncTearDown(self):
+        resource_cache.clear()
+        await async_registry.close()
+        await super().asyncTearDown()
+
+    async def test_rollout_from_cache(self):
+        resource_cache.observe(
+            kind="deployment", event_type=None, body=_rolled_out("app")
+        )
+        service = self.django_kind.service("deployment")
+        with patch.object(service, "read_status", AsyncMock()) as p_read_status:
+            progress = await self.django_kind.deployment_rollout(name="app")
+        self.assertTrue(progress["complete"])
+        p_read_status.assert_not_awaited()
+
+    async def test_rollout_fallback(self):
+        status = MagicMock()
+        status.to_dict.return_value = _deployment("app")
+        service = self.django_kind.service("deployment")
+        with patch.object(
+            service, "read_status", AsyncMock(return_value=status)
+        ) as p_read_status:
+            progress = await self.django_kind.deployment_rollout(name="app")
+        self.assertFalse(progress["complete"])
+        p_read_status.assert_awaited_once_with(namespace="test", name="app")
@@ -0,0 +1,137 @@
+import contextvars
+import importlib
+import json
+import secrets
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+_counter = contextvars.ContextVar("api_call_counter", default=None)
+
+
+def count_api_call():
+    counter = _counter.get()
+    if counter is not None:
+        counter.add()
+
+
+def submit(executor, fn, *args, **kwargs):
+    """`executor.submit` which carries the caller's context into the worker
+    thread, as asyncio tasks do by themselves"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class CallCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def add(self):
+        with self._lock:
+            self.count += 1
+
+
+def new_trace():
+    return {"traceId": secrets.token_hex(16), "spanId": secrets.token_hex(8)}
+
+
+def timestamp(moment=None):
+    if moment is None:
+        moment = datetime.now(timezone.utc)
+    elif moment.tzinfo is None:
+        # kopf keeps naive UTC datetimes
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.isoformat()
+
+
+def _nanos(moment):
+    return int(datetime.fromisoformat(moment).timestamp() * 1_000_000_000)
+
+
+def span(*, trace, name, started, finished, attributes, root=False):
+    """An OpenTelemetry-style span (OTLP JSON field names); `started` and
+    `finished` are ISO timestamps as kept in the history"""
+    return {
+        "traceId": trace["traceId"],
+        "spanId": trace["spanId"] if root else secrets.token_hex(8),
+        "parentSpanId": None if root else trace["spanId"],
+        "name": name,
+        "startTimeUnixNano": _nanos(started),
+        "endTimeUnixNano": _nanos(finished),
+        "attributes": attributes,
+    }
+
+
+class SpanExporter:
+    def export(self, spans):
+        raise NotImplementedError()
+
+
+class FileSpanExporter(SpanExporter):
+    """One JSON span per line, to `path` or stdout"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        lines = "".join(json.dumps(s, sort_keys=True) + "\n" for s in spans)
+        with self._lock:
+            if self.path is None:
+                sys.stdout.write(lines)
+                sys.stdout.flush()
+            else:
+                with open(self.path, "a") as f:
+                    f.write(lines)
+
+
+def load_exporter(spec):
+    """`stdout`, `file:<path>` or the dotted path of a `SpanExporter`
+    subclass; nothing is exported when `spec` is empty"""
+    if not spec:
+        return None
+    if spec == "stdout":
+        return FileSpanExporter()
+    if spec.startswith("file:"):
+        return FileSpanExporter(spec[len("file:") :])
+    module_name, _, klass_name = spec.rpartition(".")
+    return getattr(importlib.import_module(module_name), klass_name)()
+
+
+class Tracer:
+    """Counts the API calls each step makes, over all of its attempts, and
+    hands finished spans to the exporter"""
+
+    def __init__(self, exporter=None):
+        self.exporter = exporter
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    @contextmanager
+    def counting(self, key):
+        counter = CallCounter()
+        token = _counter.set(counter)
+        try:
+            yield counter
+        finally:
+            _counter.reset(token)
+            with self._lock:
+                self._calls[key] = self._calls.get(key, 0) + counter.count
+
+    def take_calls(self, key):
+        with self._lock:
+            return self._calls.pop(key, 0)
+
+    def forget(self, uid):
+        """Drop the counts of an object's unfinished steps, e.g. once it's gone"""
+        with self._lock:
+            for key in [key for key in self._calls if key[0] == uid]:
+                del self._calls[key]
+
+    def export(self, spans):
+        if self.exporter is not None and spans:
+            self.exporter.export(spans)
+
+
+tracer = Tracer()
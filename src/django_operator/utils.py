@@ -1,4 +1,7 @@
+import hashlib
+import json
 import re
+from collections.abc import Mapping
 
 from kopf import (
     adjust_namespace,
@@ -7,53 +10,228 @@ from kopf import (
     label,
 )
 
+_MISSING = object()
+_paths = {}
+_path_sets = {}
+
+
+def _snake_case(key):
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", key).lower()
+
+
+def compile_path(superkey):
+    """`a.bC` -> (("a", "a"), ("bC", "b_c")); each key with the attribute the
+    kubernetes client models would give it"""
+    path = _paths.get(superkey)
+    if path is None:
+        path = _paths[superkey] = tuple(
+            (key, _snake_case(key)) for key in superkey.split(".")
+        )
+    return path
+
+
+def compile_paths(superkeys):
+    """Flatten `superkeys` into one list of lookups, with shared prefixes
+    looked up once: each lookup is (index of the value it reads from, key,
+    attr), and each superkey maps to the index of its final value"""
+    compiled = _path_sets.get(superkeys)
+    if compiled is None:
+        lookups = []
+        seen = {}
+        ends = {}
+        for superkey in superkeys:
+            index = 0
+            path = compile_path(superkey)
+            for depth, step in enumerate(path, start=1):
+                prefix = path[:depth]
+                if prefix not in seen:
+                    lookups.append((index, *step))
+                    seen[prefix] = len(lookups)
+                index = seen[prefix]
+            ends[superkey] = index
+        compiled = _path_sets[superkeys] = (tuple(lookups), ends)
+    return compiled
+
+
+def _step(obj, key, attr):
+    if type(obj) is dict or isinstance(obj, Mapping):
+        val = obj.get(key, _MISSING)
+        if val is _MISSING and attr != key:
+            # `to_dict()` output of the client models
+            val = obj.get(attr, _MISSING)
+        return val
+    if attr in getattr(obj, "attribute_map", ()):
+        return getattr(obj, attr)
+    return _MISSING
+
 
 def superget(dct, superkey, *, default=None, _raise=None):
-    if "." in superkey:
-        key, remainder = superkey.split(".", maxsplit=1)
+    val = dct
+    for key, attr in _paths.get(superkey) or compile_path(superkey):
+        # plain dicts holding the key are by far the common case
+        if type(val) is dict and key in val:
+            val = val[key]
+            continue
+        val = _step(val, key, attr)
+        if val is _MISSING:
+            if _raise is not None:
+                raise _raise
+            return default
+    return val
+
+
+def supergetmany(dct, superkeys, *, default=None):
+    """{superkey: value} for every one of `superkeys`, in a single walk"""
+    if not isinstance(superkeys, tuple):
+        superkeys = tuple(superkeys)
+    lookups, ends = _path_sets.get(superkeys) or compile_paths(superkeys)
+    values = [dct]
+    for index, key, attr in lookups:
+        val = values[index]
+        if type(val) is dict and key in val:
+            values.append(val[key])
+        elif val is _MISSING:
+            values.append(_MISSING)
+        else:
+            values.append(_step(val, key, attr))
+    ret = {}
+    for superkey, index in ends.items():
+        val = values[index]
+        ret[superkey] = default if val is _MISSING else val
+    return ret
+
+
+def _merged_lists(left, right, list_key):
+    if list_key is None or not all(
+        isinstance(item, dict) and list_key in item for item in left + right
+    ):
+        return left + right
+    ret = list(left)
+    positions = {item[list_key]: index for index, item in enumerate(ret)}
+    for item in right:
+        index = positions.get(item[list_key])
+        if index is None:
+            positions[item[list_key]] = len(ret)
+            ret.append(item)
+        else:
+            ret[index] = merged(ret[index], item, list_key=list_key)
+    return ret
+
+
+def _merged_at(container, indices, value, list_key):
+    index, *indices = indices
+    ret = list(container) if isinstance(container, list) else dict(container)
+    if indices:
+        ret[index] = _merged_at(container[index], indices, value, list_key)
     else:
-        key = superkey
-        remainder = None
-    if key not in dct:
-        if _raise is not None:
-            raise _raise
-        return default
-    val = dct[key]
-    if not remainder:
-        return val
-    return superget(val, remainder, default=default, _raise=_raise)
+        ret[index] = merged(container[index], value, list_key=list_key)
+    return ret
+
+
+def merged(left, right, *, list_key=None):
+    """A copy of `left` with all keys (subkeys, etc.) from `right` put into it;
+    neither is changed. Only the containers along the merged paths are new,
+    everything else is shared with `left` and `right`.
+
+    Tuple keys on the right traverse the data structure on the left, e.g.
+    `("containers", 0)`. Lists are concatenated, unless `list_key` is given
+    and every item has it, then items with the same value are merged."""
+    ret = dict(left)
+    for key_, value_ in right.items():
+        if isinstance(key_, (tuple,)):
+            _key, *indices = key_
+            ret[_key] = _merged_at(ret[_key], indices, value_, list_key)
+            continue
+        if key_ not in ret:
+            ret[key_] = value_
+            continue
+        _value = ret[key_]
+        if type(_value) is not type(value_):
+            raise ValueError(f"type mismatch for key {key_}")
+        if isinstance(_value, (dict,)):
+            ret[key_] = merged(_value, value_, list_key=list_key)
+        elif isinstance(_value, (list,)):
+            ret[key_] = _merged_lists(_value, value_, list_key)
+        else:
+            ret[key_] = value_
+    return ret
 
 
 def merge(left, right):
-    """recursively put all keys (subkeys, etc.) from right into left. If
-    keys on the right are tuples then the data structure on the left will be
-    traversed"""
+    """`merged`, but putting everything into `left` itself, nested dicts and
+    lists included"""
     for key_, value_ in right.items():
         if isinstance(key_, (tuple,)):
-            print("tuple")
-            # traverse the data structure on the left
             _key, *indices = key_
             _value = left[_key]
             for index in indices:
-                print(index)
                 _value = _value[index]
-            _value = merge(_value, value_)
+            merge(_value, value_)
             continue
         if key_ not in left:
             left[key_] = value_
             continue
         _value = left[key_]
-        if type(_value) != type(value_):
+        if type(_value) is not type(value_):
             raise ValueError(f"type mismatch for key {key_}")
         if isinstance(_value, (dict,)):
-            _value = merge(_value, value_)
+            merge(_value, value_)
         elif isinstance(_value, (list,)):
             _value.extend(value_)
         else:
-            # primitive type, probably not a pointer
             left[key_] = value_
 
 
+def merge_patch(target, patch):
+    """RFC 7386, as kopf patches handler results into the status: mappings
+    merge, `None` removes, everything else replaces"""
+    if not isinstance(patch, Mapping):
+        return patch
+    ret = dict(target) if isinstance(target, Mapping) else {}
+    for key, value in patch.items():
+        if value is None:
+            ret.pop(key, None)
+        else:
+            ret[key] = merge_patch(ret.get(key), value)
+    return ret
+
+
+def _replacing(target, value):
+    """A merge patch turning `target` into `value` rather than merging them"""
+    if not isinstance(target, Mapping) or not isinstance(value, Mapping):
+        return value
+    ret = {key: None for key in target if key not in value}
+    for key, _value in value.items():
+        ret[key] = _replacing(target.get(key), _value)
+    return ret
+
+
+def merge_patches(first, second, target=None):
+    """One merge patch doing what `first` and then `second` would to `target`.
+
+    A mapping deleted by `first` and set again by `second` must replace what
+    `target` held there, so only with `target` given is that exact"""
+    if first is None and isinstance(second, Mapping):
+        return _replacing(target, second)
+    if not isinstance(first, Mapping) or not isinstance(second, Mapping):
+        return second
+    ret = dict(first)
+    if not isinstance(target, Mapping):
+        target = {}
+    for key, value in second.items():
+        if key in ret:
+            ret[key] = merge_patches(ret[key], value, target.get(key))
+        else:
+            ret[key] = value
+    return ret
+
+
+def manifest_hash(body):
+    """Stable digest of a manifest, for telling whether it changed"""
+    text = json.dumps(body, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
 def slugify(unslug):
     return re.sub("[^-a-z0-9]+", "-", unslug.lower())
 
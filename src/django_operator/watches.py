@@ -0,0 +1,274 @@
+import asyncio
+import threading
+
+from django_operator.utils import supergetmany
+
+OWNER_API_GROUP = "thismatters.github"
+OWNER_KIND = "Django"
+
+
+def _django_owner(body):
+    for owner in body.get("metadata", {}).get("ownerReferences") or []:
+        api_version = owner.get("apiVersion", "")
+        if owner.get("kind") == OWNER_KIND and api_version.startswith(
+            f"{OWNER_API_GROUP}/"
+        ):
+            return owner
+    return None
+
+
+def is_owned(body, **_):
+    """kopf filter for resources which belong to a Django object"""
+    return _django_owner(body) is not None
+
+
+def owner_uid(body):
+    """uid of the Django object a resource belongs to, if any"""
+    return (_django_owner(body) or {}).get("uid")
+
+
+def deployment_condition(body, condition):
+    for _condition in (body.get("status") or {}).get("conditions") or []:
+        if _condition.get("type") == condition:
+            return _condition.get("status") == "True"
+    return False
+
+
+ROLLOUT_PATHS = (
+    "metadata.generation",
+    "spec.replicas",
+    "status.observedGeneration",
+    "status.replicas",
+    "status.updatedReplicas",
+    "status.readyReplicas",
+    "status.availableReplicas",
+)
+
+
+def rollout_progress(body):
+    """Replica counts of a deployment's rollout, and whether it is done by the
+    same reckoning as `kubectl rollout status`"""
+    found = supergetmany(body, ROLLOUT_PATHS)
+    desired = found["spec.replicas"]
+    if desired is None:
+        # the apiserver's default
+        desired = 1
+    replicas, updated, ready, available = (
+        found[path] or 0
+        for path in (
+            "status.replicas",
+            "status.updatedReplicas",
+            "status.readyReplicas",
+            "status.availableReplicas",
+        )
+    )
+    observed = found["status.observedGeneration"] or 0
+    return {
+        "observedGeneration": observed,
+        "desired": desired,
+        "updated": updated,
+        "ready": ready,
+        "available": available,
+        "complete": (
+            # the controller has acted on the latest spec
+            observed >= (found["metadata.generation"] or 0)
+            and updated >= desired
+            # and the old replicas are gone
+            and replicas <= updated
+            and available >= updated
+        ),
+    }
+
+
+DAEMONSET_PATHS = (
+    "metadata.generation",
+    "status.observedGeneration",
+    "status.desiredNumberScheduled",
+    "status.updatedNumberScheduled",
+    "status.numberReady",
+)
+
+
+def daemonset_ready(body):
+    """Whether every node the daemonset is scheduled on runs a ready pod of
+    its latest spec"""
+    found = supergetmany(body, DAEMONSET_PATHS)
+    observed = found["status.observedGeneration"] or 0
+    desired = found["status.desiredNumberScheduled"] or 0
+    return (
+        observed >= (found["metadata.generation"] or 0)
+        and (found["status.updatedNumberScheduled"] or 0) >= desired
+        and (found["status.numberReady"] or 0) >= desired
+    )
+
+
+def pod_phase(body):
+    return ((body.get("status") or {}).get("phase") or "unknown").lower()
+
+
+def owner_reference(body):
+    """Enough of a Django object to post events against and to restart its
+    migration later"""
+    metadata = body.get("metadata", {})
+    return {
+        "apiVersion": body.get("apiVersion"),
+        "kind": body.get("kind"),
+        "metadata": {
+            "name": metadata.get("name"),
+            "namespace": metadata.get("namespace"),
+            "uid": metadata.get("uid"),
+        },
+        "spec": dict(body.get("spec") or {}),
+    }
+
+
+class ResourceCache:
+    """In-memory copy of the resources owned by Django objects.
+
+    Kept current by the kopf event handlers in `main.py`, so readiness checks
+    can block until the watch stream reports a change rather than polling the
+    apiserver. Also indexes the `status.created` resources of each settled
+    Django object so that a deletion can be traced back to its owner."""
+
+    def __init__(self):
+        self._objects = {}
+        self._owners = {}
+        self._owned = {}
+        self._changed = threading.Condition()
+        # (loop, event) pairs for coroutines awaiting a change
+        self._waiters = set()
+
+    def _key(self, kind, namespace, name):
+        return (kind, namespace, name)
+
+    def _untrack(self, owner_key):
+        for key in self._owned.pop(owner_key, ()):
+            self._owners.pop(key, None)
+
+    def track(self, *, body, created):
+        """Index the `created` resources of a Django object; pass `None` to
+        stop watching over them (e.g. when a migration is underway)"""
+        metadata = body.get("metadata", {})
+        owner_key = (metadata.get("namespace"), metadata.get("name"))
+        with self._changed:
+            self._untrack(owner_key)
+            if not created:
+                return
+            owner = owner_reference(body)
+            keys = set()
+            for kind, data in created.items():
+                for name in (data or {}).values():
+                    key = self._key(kind, owner_key[0], name)
+                    keys.add(key)
+                    self._owners[key] = owner
+            self._owned[owner_key] = keys
+
+    def is_tracked(self, *, kind, body):
+        metadata = body.get("metadata", {})
+        key = self._key(kind, metadata.get("namespace"), metadata.get("name"))
+        with self._changed:
+            return key in self._owners
+
+    def observe(self, *, kind, event_type, body):
+        """Record a watch event. Returns the owner reference of the Django
+        object when one of its `created` resources has gone missing."""
+        metadata = body.get("metadata", {})
+        key = self._key(kind, metadata.get("namespace"), metadata.get("name"))
+        owner = None
+        with self._changed:
+            if event_type == "DELETED":
+                self._objects.pop(key, None)
+                owner = self._owners.get(key)
+                if owner is not None:
+                    # only report the owner once, it will be re-tracked once
+                    #  the migration settles
+                    self._untrack(
+                        (owner["metadata"]["namespace"], owner["metadata"]["name"])
+                    )
+            else:
+                self._objects[key] = {
+                    "metadata": dict(metadata),
+                    # a rollout is judged against the desired replicas
+                    "spec": {"replicas": (body.get("spec") or {}).get("replicas")},
+                    "status": dict(body.get("status") or {}),
+                }
+            self._changed.notify_all()
+            for loop, event in self._waiters:
+                loop.call_soon_threadsafe(event.set)
+        return owner
+
+    def get(self, *, kind, namespace, name):
+        with self._changed:
+            return self._objects.get(self._key(kind, namespace, name))
+
+    def wait_for(self, *, kind, namespace, name, predicate, timeout):
+        """Block until the cached object satisfies `predicate` or `timeout`
+        seconds pass. Returns the latest cached object either way (`None` if
+        the object has never been seen)."""
+        return self.wait_for_any(
+            kind=kind,
+            namespace=namespace,
+            names=[name],
+            predicate=predicate,
+            timeout=timeout,
+        )[name]
+
+    def wait_for_any(self, *, kind, namespace, names, predicate, timeout):
+        """`wait_for` on several objects at once, until any one of them
+        satisfies `predicate`; returns {name: latest cached object}"""
+        keys = {name: self._key(kind, namespace, name) for name in names}
+
+        def _satisfied():
+            return any(
+                obj is not None and predicate(obj)
+                for obj in map(self._objects.get, keys.values())
+            )
+
+        with self._changed:
+            if timeout:
+                self._changed.wait_for(_satisfied, timeout=timeout)
+            return {name: self._objects.get(key) for name, key in keys.items()}
+
+    async def async_wait_for(self, *, kind, namespace, name, predicate, timeout):
+        """`wait_for` for use on the event loop"""
+        found = await self.async_wait_for_any(
+            kind=kind,
+            namespace=namespace,
+            names=[name],
+            predicate=predicate,
+            timeout=timeout,
+        )
+        return found[name]
+
+    async def async_wait_for_any(self, *, kind, namespace, names, predicate, timeout):
+        """`wait_for_any` for use on the event loop"""
+        keys = {name: self._key(kind, namespace, name) for name in names}
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or 0)
+        while True:
+            event = asyncio.Event()
+            with self._changed:
+                found = {name: self._objects.get(key) for name, key in keys.items()}
+                remaining = deadline - loop.time()
+                satisfied = any(
+                    obj is not None and predicate(obj) for obj in found.values()
+                )
+                if satisfied or remaining <= 0:
+                    return found
+                self._waiters.add((loop, event))
+            try:
+                await asyncio.wait_for(event.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._changed:
+                    self._waiters.discard((loop, event))
+
+    def clear(self):
+        with self._changed:
+            self._objects = {}
+            self._owners = {}
+            self._owned = {}
+
+
+resource_cache = ResourceCache()
@@ -1,51 +1,241 @@
+import asyncio
+
 import kopf
+import kubernetes
 
+from django_operator.clients import (
+    DEFAULT_WORKERS,
+    async_registry,
+    kubernetes_asyncio,
+    pool_maxsize,
+    registry,
+)
+from django_operator.drift import manifest_cache
+from django_operator.metrics import serve_metrics, step_occupancy
 from django_operator.pipelines.migration import (
     MigrationPipeline,
     MonitorException,
 )
+from django_operator.settings import (
+    ASYNC_HANDLERS,
+    METRICS_PORT,
+    MONITOR_INTERVAL,
+    TRACE_EXPORTER,
+)
+from django_operator.sharding import shard_membership
+from django_operator.templates import template_cache
+from django_operator.tracing import load_exporter, tracer
+from django_operator.watches import is_owned, resource_cache
+
+
+@kopf.on.startup()
+async def configure(settings, **_):
+    # a connection for every thread making calls, so that none queue on the pool
+    registry.configure(
+        pool_maxsize=pool_maxsize(
+            settings.execution.max_workers or DEFAULT_WORKERS,
+            lanes=MigrationPipeline.max_lanes(),
+        )
+    )
+    if ASYNC_HANDLERS:
+        # kopf's login only sets up the sync client
+        try:
+            kubernetes_asyncio.config.load_incluster_config()
+        except kubernetes_asyncio.config.ConfigException:
+            await kubernetes_asyncio.config.load_kube_config()
+        async_registry.configure()
+    template_cache.preload()
+    serve_metrics(METRICS_PORT)
+    tracer.exporter = load_exporter(TRACE_EXPORTER)
+
+
+@kopf.on.startup()
+def join_shard(settings, logger, **_):
+    if shard_membership.enabled:
+        shard_membership.configure(settings)
+        # kopf only logs in after the startup handlers, and joining needs the
+        #  API already; a client built before the config is loaded would
+        #  keep talking to localhost
+        try:
+            kubernetes.config.load_incluster_config()
+        except kubernetes.config.ConfigException:
+            kubernetes.config.load_kube_config()
+        registry.configure()
+        shard_membership.join(logger=logger)
+
+
+@kopf.on.cleanup()
+def leave_shard(logger, **_):
+    if shard_membership.enabled:
+        shard_membership.leave(logger=logger)
+
+
+@kopf.on.cleanup()
+async def close_clients(**_):
+    await async_registry.close()
+
+
+async def _observe(kind, event_type, body, logger):
+    # on the event loop rather than kopf's executor: waiting steps hold
+    #  executor threads until an event reaches the cache, so feeding it from
+    #  the executor could starve once enough objects wait at once
+    owner = resource_cache.observe(kind=kind, event_type=event_type, body=body)
+    if owner is not None:
+        logger.error(f"{kind} {body['metadata']['name']} missing.")
+        await asyncio.to_thread(MigrationPipeline.restart, owner=owner, logger=logger)
+    if event_type == "DELETED":
+        metadata = body["metadata"]
+        manifest_cache.forget(
+            kind=kind, namespace=metadata["namespace"], name=metadata["name"]
+        )
+    elif resource_cache.is_tracked(kind=kind, body=body):
+        await asyncio.to_thread(
+            MigrationPipeline.correct_drift, kind=kind, body=body, logger=logger
+        )
+
+
+def _is_tracked_hpa(body, **_):
+    # HPAs belong to the deployment they scale, not to the Django object
+    return resource_cache.is_tracked(kind="horizontalpodautoscaler", body=body)
+
+
+# resources of the Django objects in this replica's shard
+in_shard = kopf.all_([is_owned, shard_membership.in_shard])
+
+
+# feed the shared cache that readiness checks and resource monitoring rely on
+@kopf.on.event("apps", "v1", "deployments", when=in_shard)
+async def watch_deployments(type, body, logger, **_):
+    await _observe("deployment", type, body, logger)
+
+
+@kopf.on.event("apps", "v1", "daemonsets", when=in_shard)
+async def watch_daemonsets(type, body, logger, **_):
+    await _observe("daemonset", type, body, logger)
+
+
+@kopf.on.event("v1", "pods", when=in_shard)
+async def watch_pods(type, body, logger, **_):
+    await _observe("pod", type, body, logger)
+
+
+@kopf.on.event("v1", "services", when=in_shard)
+async def watch_services(type, body, logger, **_):
+    await _observe("service", type, body, logger)
+
 
+@kopf.on.event("networking.k8s.io", "v1", "ingresses", when=in_shard)
+async def watch_ingresses(type, body, logger, **_):
+    await _observe("ingress", type, body, logger)
 
-@kopf.on.create("thismatters.github", "v1alpha", "djangos")
+
+@kopf.on.event("autoscaling", "v1", "horizontalpodautoscalers", when=_is_tracked_hpa)
+async def watch_horizontalpodautoscalers(type, body, logger, **_):
+    await _observe("horizontalpodautoscaler", type, body, logger)
+
+
+@kopf.on.event("thismatters.github", "v1alpha", "djangos")
+def watch_djangos(type, body, labels, status, meta, **_):
+    """Only settled objects are monitored; mid-migration the `created`
+    resources are expected to come and go. Objects of other shards are
+    treated as gone, bar the management command slots they hold."""
+    owned = shard_membership.owns(meta["uid"])
+    MigrationPipeline.observe_slot(
+        event_type=type,
+        namespace=meta["namespace"],
+        name=meta["name"],
+        labels=labels,
+        condition=status.get("condition"),
+        owned=owned,
+    )
+    if not owned:
+        type = "DELETED"
+    settled = (
+        type != "DELETED"
+        and meta.get("deletionTimestamp") is None
+        and labels.get(MigrationPipeline.label) == MigrationPipeline.waiting_step_name
+    )
+    resource_cache.track(body=body, created=status.get("created") if settled else None)
+    step_occupancy.observe(
+        uid=meta["uid"],
+        step=None if type == "DELETED" else labels.get(MigrationPipeline.label),
+    )
+    if type == "DELETED":
+        tracer.forget(meta["uid"])
+
+
+@kopf.on.create(
+    "thismatters.github", "v1alpha", "djangos", when=shard_membership.in_shard
+)
 def initial_migration(patch, body, **kwargs):
     kopf.info(body, reason="Migrating", message="Enacting brand new config")
     patch.metadata.labels[MigrationPipeline.label] = MigrationPipeline.steps[0].name
 
 
+# the handlers below are defined either as coroutines or as plain functions,
+#  under the same names so that kopf's handler ids (and so the progress
+#  stored on in-flight objects) don't change with the mode
+if ASYNC_HANDLERS:
+
+    async def migration_pipeline(**kwargs):
+        return await MigrationPipeline(use_async=True, **kwargs).handle_async()
+
+    async def unprotect_resources(body, logger, **kwargs):
+        await MigrationPipeline(
+            body=body, logger=logger, use_async=True, **kwargs
+        ).unprotect_all_async()
+        if shard_membership.enabled:
+            await asyncio.to_thread(
+                shard_membership.release_finalizers, body=body, logger=logger
+            )
+
+    async def monitor_resources(logger, **kwargs):
+        try:
+            await MigrationPipeline(
+                logger=logger, use_async=True, **kwargs
+            ).monitor_async()
+        except MonitorException:
+            logger.debug("monitor_resources found a problem, migrating.")
+
+else:
+
+    def migration_pipeline(**kwargs):
+        return MigrationPipeline(**kwargs).handle()
+
+    def unprotect_resources(body, logger, **kwargs):
+        MigrationPipeline(body=body, logger=logger, **kwargs).unprotect_all()
+        if shard_membership.enabled:
+            shard_membership.release_finalizers(body=body, logger=logger)
+
+    def monitor_resources(logger, **kwargs):
+        try:
+            MigrationPipeline(logger=logger, **kwargs).monitor()
+        except MonitorException:
+            logger.debug("monitor_resources found a problem, migrating.")
+
+
 # catch-all update handler
-@kopf.on.update(
+kopf.on.update(
     "thismatters.github",
     "v1alpha",
     "djangos",
     labels={MigrationPipeline.label: MigrationPipeline.is_step_name},
-)
-def migration_pipeline(**kwargs):
-    return MigrationPipeline(**kwargs).handle()
+    when=shard_membership.in_shard,
+)(migration_pipeline)
 
+kopf.on.delete(
+    "thismatters.github", "v1alpha", "djangos", when=shard_membership.in_shard
+)(unprotect_resources)
 
-# catch-all update handler
-@kopf.on.delete("thismatters.github", "v1alpha", "djangos")
-def unprotect_resources(**kwargs):
-    MigrationPipeline(**kwargs).unprotect_all()
-
-
-@kopf.daemon(
+# the watch handlers above notice deletions as they happen; this checks that
+#  the `created` resources are still present at startup and every so often
+#  after, for whatever a watch missed (e.g. while it was reconnecting). Either
+#  way the migration is triggered if anything is missing
+kopf.on.timer(
     "thismatters.github",
     "v1alpha",
     "djangos",
     labels={MigrationPipeline.label: MigrationPipeline.waiting_step_name},
-)
-def monitor_resources(stopped, **kwargs):
-    """Watch the `created` resources to ensure that they are still present.
-
-    Trigger the migration process if anything is missing.
-    """
-    logger = kwargs.get("logger")
-    while not stopped:
-        try:
-            MigrationPipeline(**kwargs).monitor()
-        except MonitorException:
-            logger.debug("monitor_resources found a problem, stopping.")
-            raise kopf.TemporaryError("Need to restart.", delay=10)
-        stopped.wait(120)
-    logger.debug("monitor_resources daemon is stopping...")
+    when=shard_membership.in_shard,
+    interval=MONITOR_INTERVAL,
+)(monitor_resources)